@@ -0,0 +1,182 @@
+# Copyright (C) 2024 Mete Balci
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+# pdfls: a utility to investigate PDF files
+# Copyright (C) 2024 Mete Balci
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+from array import array
+import bisect
+import logging
+import re
+
+from .exceptions import *
+
+logger = logging.getLogger(__name__)
+
+# bfrange with at most this many codes are expanded into chars
+# larger ones are kept as ranges, e.g. <0000> <FFFF> <0000>
+CMAP_MAX_EXPANDED_RANGE = 256
+
+cmap_section_re = re.compile(rb'begin(codespacerange|bfchar|bfrange)(.*?)end\1', re.S)
+cmap_token_re = re.compile(rb'<([0-9A-Fa-f\x00\t\n\x0c\r ]*)>|(\[)|(\])')
+cmap_whitespace_re = re.compile(rb'[\x00\t\n\x0c\r ]+')
+
+def _hex_to_bytes(v:bytes):
+    v = cmap_whitespace_re.sub(b'', v)
+    if len(v) % 2 == 1:
+        v = v + b'0'
+    return bytes.fromhex(v.decode('ascii'))
+
+# destinations are UTF-16BE
+def _to_str(dst:bytes):
+    return dst.decode('utf-16-be', 'replace')
+
+# returns the hex strings (bytes) and arrays (lists of bytes) in a section
+def _parse_section(data:bytes):
+    values = []
+    array_values = None
+    for m in cmap_token_re.finditer(data):
+        (hex_string, array_start, array_end) = m.groups()
+        if hex_string is not None:
+            if array_values is not None:
+                array_values.append(_hex_to_bytes(hex_string))
+            else:
+                values.append(_hex_to_bytes(hex_string))
+        elif array_start is not None:
+            array_values = []
+        elif array_values is not None:
+            values.append(array_values)
+            array_values = None
+    return values
+
+# ISO 32000-2 9.10.3 ToUnicode CMaps
+# it is compiled once, codes are looked up in:
+# chars, a dict code (int) -> str, from bfchar and small bfrange
+# range_starts, range_ends and range_dsts, sorted large bfrange
+# code of bytes b is int.from_bytes(b, 'big')
+class ToUnicodeCMap:
+
+    def __init__(self, data:bytes):
+        # list of (low, high) of codespace ranges, low and high are bytes
+        self.codespace_ranges = []
+        self.chars = {}
+        self.range_starts = array('I')
+        self.range_ends = array('I')
+        # list of (dst as int, dst length in bytes) of ranges
+        self.range_dsts = []
+        ranges = []
+        for m in cmap_section_re.finditer(data):
+            (section, section_data) = m.groups()
+            values = _parse_section(section_data)
+            if section == b'codespacerange':
+                for i in range(0, len(values) - 1, 2):
+                    self.codespace_ranges.append((values[i], values[i+1]))
+            elif section == b'bfchar':
+                for i in range(0, len(values) - 1, 2):
+                    (src, dst) = (values[i], values[i+1])
+                    if isinstance(src, bytes) and isinstance(dst, bytes):
+                        self.chars[int.from_bytes(src, 'big')] = _to_str(dst)
+            else:
+                for i in range(0, len(values) - 2, 3):
+                    (low, high, dst) = (values[i], values[i+1], values[i+2])
+                    if not isinstance(low, bytes) or not isinstance(high, bytes):
+                        continue
+                    low = int.from_bytes(low, 'big')
+                    high = int.from_bytes(high, 'big')
+                    if high < low:
+                        continue
+                    if isinstance(dst, list):
+                        # a dst for each code
+                        for (code, code_dst) in zip(range(low, high + 1), dst):
+                            self.chars[code] = _to_str(code_dst)
+                    elif high - low < CMAP_MAX_EXPANDED_RANGE:
+                        dst_int = int.from_bytes(dst, 'big')
+                        for code in range(low, high + 1):
+                            self.chars[code] = self._range_str(dst_int, len(dst), code - low)
+                    else:
+                        ranges.append((low, high, int.from_bytes(dst, 'big'), len(dst)))
+        ranges.sort()
+        for (low, high, dst_int, dst_len) in ranges:
+            self.range_starts.append(low)
+            self.range_ends.append(high)
+            self.range_dsts.append((dst_int, dst_len))
+        # the byte lengths of codes, shortest first
+        self.code_lengths = sorted(set([len(low) for (low, high) in self.codespace_ranges]))
+
+    # the last byte of dst is incremented for each code in range
+    @staticmethod
+    def _range_str(dst_int:int, dst_len:int, offset:int):
+        try:
+            return _to_str((dst_int + offset).to_bytes(dst_len, 'big'))
+        except OverflowError:
+            return '\ufffd'
+
+    # returns str of code (int), None if it is not mapped
+    def lookup(self, code:int):
+        s = self.chars.get(code, None)
+        if s is not None or len(self.range_starts) == 0:
+            return s
+        i = bisect.bisect_right(self.range_starts, code) - 1
+        if i >= 0 and code <= self.range_ends[i]:
+            (dst_int, dst_len) = self.range_dsts[i]
+            return self._range_str(dst_int, dst_len, code - self.range_starts[i])
+        return None
+
+    def _in_codespace(self, code:bytes):
+        for (low, high) in self.codespace_ranges:
+            if len(low) == len(code):
+                if all([low[i] <= code[i] <= high[i] for i in range(0, len(code))]):
+                    return True
+        return False
+
+    # yields codes (bytes) in data, code lengths are from codespace ranges
+    # or default_code_length if there are no codespace ranges
+    def iter_codes(self, data:bytes, default_code_length:int=1):
+        if len(self.code_lengths) <= 1:
+            n = self.code_lengths[0] if len(self.code_lengths) == 1 else default_code_length
+            for i in range(0, len(data), n):
+                yield data[i:i+n]
+            return
+        pos = 0
+        while pos < len(data):
+            for n in self.code_lengths:
+                if self._in_codespace(data[pos:pos+n]):
+                    break
+            else:
+                # not in any codespace, the shortest is used
+                n = self.code_lengths[0]
+            yield data[pos:pos+n]
+            pos = pos + n
+
+    # returns str of string data (bytes) shown with the font of this CMap
+    # codes that are not mapped are U+FFFD
+    def decode(self, data:bytes, default_code_length:int=1):
+        chars = self.chars
+        s = []
+        for code in self.iter_codes(data, default_code_length):
+            code = int.from_bytes(code, 'big')
+            c = chars.get(code, None)
+            if c is None:
+                c = self.lookup(code)
+                if c is None:
+                    c = '\ufffd'
+            s.append(c)
+        return ''.join(s)
+
+    # memory used by this, used for cache budget
+    def size(self):
+        return 64 * len(self.chars) + 32 * len(self.range_dsts)
@@ -0,0 +1,466 @@
+# Copyright (C) 2024 Mete Balci
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+# pdfls: a utility to investigate PDF files
+# Copyright (C) 2024 Mete Balci
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+from array import array
+import collections
+import logging
+import re
+
+from . import Parser
+from .tokenizer import WHITESPACE_CHARACTERS
+from .tokenizer import EOL_CHARACTERS
+from .tokenizer import DELIMITER_CHARACTERS
+from .tokens import *
+from .objects import *
+from .exceptions import *
+
+logger = logging.getLogger(__name__)
+
+# ISO 32000-2 7.8.2 Content streams
+# a content stream is a sequence of instructions
+# each instruction is zero or more operands followed by an operator
+
+# at least this many bytes are kept after the current position
+# when more data is available, so a token is rarely split
+CONTENT_WINDOW_SIZE = 64 * 1024
+
+def _char_class(chars):
+    return b''.join([re.escape(bytes([ch])) for ch in sorted(chars)])
+
+_ws = _char_class(WHITESPACE_CHARACTERS | EOL_CHARACTERS)
+_delim = _char_class(DELIMITER_CHARACTERS)
+
+# whitespace, then one of:
+# 1: comment, 2: name (without /), 3: regular characters (number, keyword or operator)
+# 4: literal string without escapes, parentheses or CR
+# 5: hexadecimal string, 6: [, 7: ]
+# 8: another delimiter, e.g. a dictionary or a literal string with escapes
+#    its object is parsed with Parser
+content_token_re = re.compile(rb'[%s]*(?:%%([^\r\n]*)|/([^%s%s]*)|([^%s%s]+)|'
+                              rb'\(([^()\\\r]*)\)|<([0-9A-Fa-f%s]*)>|(\[)|(\])|([%s]))' % (_ws,
+                                                                                           _ws, _delim,
+                                                                                           _ws, _delim,
+                                                                                           _ws,
+                                                                                           _delim))
+name_escape_re = re.compile(rb'#([0-9A-Fa-f]{2})')
+ws_re = re.compile(rb'[%s]+' % _ws)
+# EI after inline image data, it is followed by whitespace, a delimiter or the end
+inline_image_end_re = re.compile(rb'[%s]*EI(?:[%s%s]|\Z)' % (_ws, _ws, _delim))
+
+NUMBER_START_CHARACTERS = frozenset(b'+-.0123456789')
+
+def _decode_name(name:bytes):
+    if b'#' in name:
+        name = name_escape_re.sub(lambda m: bytes([int(m.group(1), 16)]), name)
+    return PdfName(name)
+
+def _parse_number(v:bytes):
+    try:
+        if b'.' in v:
+            return PdfRealNumber(float(v))
+        else:
+            return PdfIntegerNumber(int(v))
+    except ValueError:
+        raise PdfConformanceException('%s is not a number' % v)
+
+# ISO 32000-2 8.9.7 Inline images
+# BI, key value pairs, ID, a single whitespace, image data, EI
+# the values of keys can be abbreviated (e.g. W for Width)
+_INLINE_IMAGE_COMPONENTS = {b'G': 1, b'DeviceGray': 1,
+                            b'RGB': 3, b'DeviceRGB': 3,
+                            b'CMYK': 4, b'DeviceCMYK': 4,
+                            b'I': 1, b'Indexed': 1}
+
+def _get_inline_image_entry(image_dictionary:PdfDictionary, abbreviation:str, name:str):
+    value = image_dictionary.get(PdfName(abbreviation), None)
+    if value is None:
+        value = image_dictionary.get(PdfName(name), None)
+    return value
+
+# returns the length of inline image data in bytes
+# or None if it cannot be known without decoding, e.g. it is filtered
+# or its color space is a named resource
+def get_inline_image_length(image_dictionary:PdfDictionary):
+    length = _get_inline_image_entry(image_dictionary, 'L', 'Length')
+    if isinstance(length, PdfIntegerNumber):
+        return length.p
+    image_filter = _get_inline_image_entry(image_dictionary, 'F', 'Filter')
+    if image_filter is not None and not (isinstance(image_filter, PdfArray) and len(image_filter.p) == 0):
+        return None
+    width = _get_inline_image_entry(image_dictionary, 'W', 'Width')
+    height = _get_inline_image_entry(image_dictionary, 'H', 'Height')
+    if not isinstance(width, PdfIntegerNumber) or not isinstance(height, PdfIntegerNumber):
+        return None
+    image_mask = _get_inline_image_entry(image_dictionary, 'IM', 'ImageMask')
+    if isinstance(image_mask, PdfBoolean) and image_mask.p:
+        bits_per_component = 1
+        components = 1
+    else:
+        bits_per_component = _get_inline_image_entry(image_dictionary, 'BPC', 'BitsPerComponent')
+        if not isinstance(bits_per_component, PdfIntegerNumber):
+            return None
+        bits_per_component = bits_per_component.p
+        color_space = _get_inline_image_entry(image_dictionary, 'CS', 'ColorSpace')
+        # [/I base hival lookup]
+        if isinstance(color_space, PdfArray) and len(color_space.p) > 0:
+            color_space = color_space[0]
+        if not isinstance(color_space, PdfName):
+            return None
+        components = _INLINE_IMAGE_COMPONENTS.get(color_space.p, None)
+        if components is None:
+            return None
+    # each row starts at a byte boundary
+    return height.p * ((width.p * components * bits_per_component + 7) // 8)
+
+# the data is read from chunks (an iterable of bytes), e.g. decoded streams
+# only a window of the data is kept, so the memory used does not depend
+# on the size of content stream
+# iterating yields (operands, operator)
+# operands is a list of PdfDirectObject, operator is bytes e.g. b'Tj'
+# an inline image is yielded as ([PdfDictionary, data], b'BI')
+# data is a memoryview of the window (not a copy), it is not decoded
+class ContentStreamLexer:
+
+    def __init__(self, chunks, window_size:int=CONTENT_WINDOW_SIZE):
+        self.chunks = iter(chunks)
+        self.window_size = window_size
+        # window of data, position in it and if chunks are exhausted
+        self.buffer = b''
+        self.pos = 0
+        self.exhausted = False
+        # offset of the window in content, for messages
+        self.offset = 0
+        # Parser of the current buffer, created when needed
+        self._parser = None
+
+    # drops the data before pos and appends chunks
+    # until there are at least size bytes after pos or chunks are exhausted
+    def _fill(self, size:int):
+        data = [self.buffer[self.pos:]]
+        available = len(data[0])
+        while available < size:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                self.exhausted = True
+                break
+            data.append(chunk)
+            available = available + len(chunk)
+        self.buffer = b''.join(data)
+        self.offset = self.offset + self.pos
+        self.pos = 0
+        self._parser = None
+
+    # more data is needed to complete the token at pos
+    # returns False if there is no more data
+    def _grow(self):
+        if self.exhausted:
+            return False
+        self._fill(max(2 * (len(self.buffer) - self.pos), self.window_size))
+        return True
+
+    # parses the object (string, array, dictionary) starting with a delimiter at pos
+    # returns (object, end) or None if the object is not complete in buffer
+    def _parse_object(self):
+        if self._parser is None:
+            self._parser = Parser(self.buffer)
+        try:
+            (obj, end) = self._parser.parse_object_at(self.pos)
+        except (PdfConformanceException, AssertionError, IndexError) as e:
+            if not self.exhausted:
+                return None
+            raise PdfConformanceException('invalid object at %d in content stream: %s' %
+                                          (self.offset + self.pos, e))
+        # it might have ended only because the buffer ended
+        if end >= len(self.buffer) and not self.exhausted:
+            return None
+        if not isinstance(obj, PdfDirectObject):
+            raise PdfConformanceException('invalid object at %d in content stream' % (self.offset + self.pos))
+        return (obj, end)
+
+    # reads the data of an inline image after ID up to and including EI
+    # returns the data, image data is never tokenized
+    def _read_inline_image(self, image_dictionary:PdfDictionary):
+        # ID is followed by a single whitespace
+        self._fill(self.window_size)
+        if self.pos < len(self.buffer) and self.buffer[self.pos] in WHITESPACE_CHARACTERS | EOL_CHARACTERS:
+            self.pos = self.pos + 1
+        length = get_inline_image_length(image_dictionary)
+        if length is not None:
+            # some more data for EI
+            self._fill(length + self.window_size)
+            m = inline_image_end_re.match(self.buffer, self.pos + length)
+            if m is not None:
+                data = memoryview(self.buffer)[self.pos:self.pos + length]
+                self.pos = m.end()
+                return data
+            logger.warning('inline image is not followed by EI after %d bytes' % length)
+        # EI preceded by whitespace and followed by whitespace, a delimiter or the end
+        start = self.pos
+        while True:
+            idx = self.buffer.find(b'EI', start)
+            if idx >= 0 and (idx + 2 < len(self.buffer) or self.exhausted):
+                if (idx > self.pos and
+                    self.buffer[idx-1] in WHITESPACE_CHARACTERS | EOL_CHARACTERS and
+                    (idx + 2 == len(self.buffer) or
+                     self.buffer[idx+2] in WHITESPACE_CHARACTERS | EOL_CHARACTERS | DELIMITER_CHARACTERS)):
+                    # the whitespace before EI is not part of the data
+                    data = memoryview(self.buffer)[self.pos:idx-1]
+                    self.pos = idx + 2
+                    return data
+                start = idx + 1
+                continue
+            # search is continued after more data, from where it is left
+            resume = (idx if idx >= 0 else max(self.pos, len(self.buffer) - 1)) - self.pos
+            if not self._grow():
+                raise PdfConformanceException('inline image does not end with EI')
+            start = self.pos + resume
+
+    def __iter__(self):
+        operands = []
+        # arrays are built here, since TJ arrays are common
+        # list of the lists of the arrays not closed yet
+        arrays = []
+        # operands, or the entries of the innermost array
+        values = operands
+        # after BI, until ID
+        in_inline_image = False
+        while True:
+            if not self.exhausted and len(self.buffer) - self.pos < self.window_size:
+                self._fill(2 * self.window_size)
+            m = content_token_re.match(self.buffer, self.pos)
+            if m is None:
+                # only whitespace is left
+                if self._grow():
+                    continue
+                break
+            # a token ending at the end of buffer might continue in next chunk
+            if m.end() == len(self.buffer) and not self.exhausted:
+                self._grow()
+                continue
+            (comment,
+             name,
+             regular,
+             literal_string,
+             hexadecimal_string,
+             array_start,
+             array_end,
+             delimiter) = m.groups()
+            if comment is not None:
+                self.pos = m.end()
+            elif name is not None:
+                values.append(_decode_name(name))
+                self.pos = m.end()
+            elif regular is not None:
+                self.pos = m.end()
+                if regular[0] in NUMBER_START_CHARACTERS:
+                    values.append(_parse_number(regular))
+                elif regular == b'true':
+                    values.append(PdfBoolean(True))
+                elif regular == b'false':
+                    values.append(PdfBoolean(False))
+                elif regular == b'null':
+                    values.append(PdfNull())
+                elif len(arrays) > 0:
+                    raise PdfConformanceException('operator %s in an array' % regular)
+                elif regular == b'BI':
+                    # key value pairs are collected as operands until ID
+                    if len(operands) > 0:
+                        logger.warning('BI has operands')
+                        operands = []
+                        values = operands
+                    in_inline_image = True
+                elif regular == b'ID' and in_inline_image:
+                    if len(operands) % 2 == 1:
+                        raise PdfConformanceException('inline image has a key without a value')
+                    image_dictionary = PdfDictionary()
+                    for i in range(0, len(operands), 2):
+                        if not isinstance(operands[i], PdfName):
+                            raise PdfConformanceException('inline image key %s is not a name' % operands[i])
+                        image_dictionary[operands[i]] = operands[i+1]
+                    data = self._read_inline_image(image_dictionary)
+                    yield ([image_dictionary, data], b'BI')
+                    in_inline_image = False
+                    operands = []
+                    values = operands
+                else:
+                    yield (operands, regular)
+                    operands = []
+                    values = operands
+            elif literal_string is not None:
+                # EOL in a literal string is LF, CR is not matched here
+                values.append(PdfLiteralString(literal_string))
+                self.pos = m.end()
+            elif hexadecimal_string is not None:
+                hexadecimal_string = ws_re.sub(b'', hexadecimal_string)
+                # odd number of hex digits, the last one is followed by 0
+                if len(hexadecimal_string) % 2 == 1:
+                    hexadecimal_string = hexadecimal_string + b'0'
+                values.append(PdfHexadecimalString(bytes.fromhex(hexadecimal_string.decode('ascii'))))
+                self.pos = m.end()
+            elif array_start is not None:
+                arrays.append(values)
+                values = []
+                self.pos = m.end()
+            elif array_end is not None:
+                if len(arrays) == 0:
+                    raise PdfConformanceException('] without [ in content stream')
+                array = PdfArray(values)
+                values = arrays.pop()
+                values.append(array)
+                self.pos = m.end()
+            elif delimiter in b')>{}':
+                # it does not start an object, e.g. ) without (
+                logger.warning('%s at %d in content stream is skipped' % (delimiter.decode('ascii'),
+                                                                        self.offset + m.start(8)))
+                self.pos = m.end()
+            else:
+                self.pos = m.start(8)
+                result = self._parse_object()
+                if result is None:
+                    self._grow()
+                    continue
+                (obj, self.pos) = result
+                values.append(obj)
+        if len(arrays) > 0:
+            raise PdfConformanceException('content stream ends in an array')
+        if len(operands) > 0:
+            logger.warning('content stream ends with operands without an operator')
+
+# operand kinds in CompiledContent
+OPERAND_INTEGER = 0
+OPERAND_REAL = 1
+# any other operand, its value in numbers is its index in pool
+OPERAND_POOL = 2
+
+# integers larger than this are not exact in a double, they are pooled
+_MAX_EXACT_INTEGER = 2 ** 53
+
+# compact form of the instructions of a content stream
+# for passes over many pages, e.g. operator histograms or text extraction
+# it is compiled once (see compile and Page.compiled_content) and it can be pickled
+# instruction i has operator operators[opcodes[i]] and operand_counts[i] operands
+# operand j has kind kinds[j] (OPERAND_*) and value numbers[j]
+# names, strings, arrays etc. are in pool, identical names and strings once
+# inline images are in pool as (PdfDictionary, bytes)
+class CompiledContent:
+
+    def __init__(self):
+        # list of bytes, opcode -> operator
+        self.operators = []
+        self.opcodes = array('H')
+        self.operand_counts = array('I')
+        self.kinds = array('B')
+        self.numbers = array('d')
+        self.pool = []
+
+    # instructions is an iterable of (operands, operator), e.g. ContentStreamLexer
+    @classmethod
+    def compile(cls, instructions):
+        compiled = cls()
+        opcodes = {}
+        pool_indexes = {}
+        for (operands, operator) in instructions:
+            opcode = opcodes.get(operator, None)
+            if opcode is None:
+                opcode = len(compiled.operators)
+                opcodes[operator] = opcode
+                compiled.operators.append(operator)
+            if operator == b'BI':
+                # data is a view of the lexer window, it is copied here
+                (image_dictionary, data) = operands
+                operands = [(image_dictionary, bytes(data))]
+            compiled.opcodes.append(opcode)
+            compiled.operand_counts.append(len(operands))
+            for operand in operands:
+                if isinstance(operand, PdfIntegerNumber) and abs(operand.p) <= _MAX_EXACT_INTEGER:
+                    compiled.kinds.append(OPERAND_INTEGER)
+                    compiled.numbers.append(operand.p)
+                elif isinstance(operand, PdfRealNumber):
+                    compiled.kinds.append(OPERAND_REAL)
+                    compiled.numbers.append(operand.p)
+                else:
+                    # scalars of different types can be equal, so type is in key
+                    if isinstance(operand, PdfScalar):
+                        key = (type(operand), operand.p)
+                        pool_index = pool_indexes.get(key, None)
+                        if pool_index is None:
+                            pool_index = len(compiled.pool)
+                            pool_indexes[key] = pool_index
+                            compiled.pool.append(operand)
+                    else:
+                        pool_index = len(compiled.pool)
+                        compiled.pool.append(operand)
+                    compiled.kinds.append(OPERAND_POOL)
+                    compiled.numbers.append(pool_index)
+        return compiled
+
+    def __len__(self):
+        return len(self.opcodes)
+
+    # memory used by this, used for cache budget (see DecodeCache)
+    # pooled objects are counted roughly
+    def size(self):
+        return (2 * len(self.opcodes) +
+                4 * len(self.operand_counts) +
+                9 * len(self.kinds) +
+                64 * len(self.pool))
+
+    # dict operator (bytes) -> number of instructions
+    def get_operator_counts(self):
+        counts = collections.Counter(self.opcodes)
+        return {self.operators[opcode]: count for (opcode, count) in counts.items()}
+
+    # yields (values, operator) where values are the operands as Python values
+    # int, float or the object in pool, no PdfNumber is created
+    def iter_values(self):
+        operators = self.operators
+        kinds = self.kinds
+        numbers = self.numbers
+        pool = self.pool
+        j = 0
+        for (opcode, operand_count) in zip(self.opcodes, self.operand_counts):
+            values = []
+            for k in range(j, j + operand_count):
+                kind = kinds[k]
+                if kind == OPERAND_INTEGER:
+                    values.append(int(numbers[k]))
+                elif kind == OPERAND_REAL:
+                    values.append(numbers[k])
+                else:
+                    values.append(pool[int(numbers[k])])
+            j = j + operand_count
+            yield (values, operators[opcode])
+
+    # yields (operands, operator) as ContentStreamLexer does
+    # except inline image data is bytes
+    def __iter__(self):
+        for (values, operator) in self.iter_values():
+            operands = []
+            for value in values:
+                if isinstance(value, int):
+                    operands.append(PdfIntegerNumber(value))
+                elif isinstance(value, float):
+                    operands.append(PdfRealNumber(value))
+                elif isinstance(value, tuple):
+                    # inline image
+                    operands.extend(value)
+                else:
+                    operands.append(value)
+            yield (operands, operator)
@@ -0,0 +1,50 @@
+# Copyright (C) 2024 Mete Balci
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+# pdfls: a utility to investigate PDF files
+# Copyright (C) 2024 Mete Balci
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+import collections
+import logging
+
+from .lrucache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+# decoded things are kept up to this many bytes in total
+DECODE_CACHE_SIZE = 64 * 1024 * 1024
+
+# least recently used decoded things up to max_size bytes
+# e.g. decoded streams, compiled contents and fonts shared by many pages
+# keys are (kind, PdfIndirectReference or id of a direct object), kind is a str e.g. 'stream'
+# see LRUCache, a key is loaded once even if it is requested by many threads
+class DecodeCache(LRUCache):
+
+    def __init__(self, max_size:int=DECODE_CACHE_SIZE):
+        super().__init__(max_size)
+        # kind -> number of loads (misses) of that kind
+        self.loads = collections.Counter()
+
+    # bytes by their length, other values (e.g. CompiledContent) by size()
+    def _get_size(self, value):
+        if isinstance(value, (bytes, bytearray)):
+            return len(value)
+        return value.size()
+
+    def _count_miss(self, key:tuple):
+        super()._count_miss(key)
+        self.loads[key[0]] = self.loads[key[0]] + 1
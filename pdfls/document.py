@@ -19,42 +19,151 @@
 # along with this program. If not, see <https://www.gnu.org/licenses/>.
 
 import collections
+import itertools
 import logging
+import mmap
 import re
 import time
 import sys
+import threading
 
 from . import Parser
 from . import Page
+from .page import PageList
+from . import workers as _workers
+from . import indexcache
+from .objstm import ObjectStream
+from .objstm import ObjectStreamCache
+from .decodecache import DecodeCache
+from .content import ContentStreamLexer
+from .content import CompiledContent
+from .font import Font
+from . import text
+from .hashcons import HashConsTable
+from . import snapshot as _snapshot
+from . import phases
+from .stats import Stats
+from .xref import *
 from .objects import *
 from .exceptions import *
 
 logger = logging.getLogger(__name__)
 
+# number of locks guarding the loading of objects in get_object
+# an object is guarded by the lock at object_number % OBJECT_LOCK_STRIPES
+OBJECT_LOCK_STRIPES = 16
+
+# page tree deeper than this is not walked
+# real documents are only a few levels deep
+PAGE_TREE_MAX_DEPTH = 256
+
+# startxref is searched in this many bytes at the end of the buffer
+# it is first searched in the smaller one
+STARTXREF_SEARCH_SIZES = (1024, 4096)
+
+startxref_offset_re = re.compile(rb"[\x00\x09\x0a\x0c\x0d\x20]*([0-9]+)")
+
 # represents a PDF document
 class Document:
 
-    def __init__(self, buffer:bytes):
+    # path is the file buffer is read from, it is required for workers > 1
+    # if workers > 1, objects are parsed in that many worker processes
+    # if lazy=True, objects are parsed only when they are accessed (get_object)
+    # if index_cache=True, xref, trailers and page tree leaves are read from
+    # an index file next to path, or it is (re)written after a full parse
+    # when the index is read, the document is lazy, objects are not parsed
+    # if hash_cons=True, identical scalars and small containers are shared
+    # snapshot is a Snapshot of the file (see load_snapshot), objects are read from it
+    # if stats=False, nothing is counted and stats is None
+    def __init__(self,
+                 buffer:bytes,
+                 path:str=None,
+                 workers:int=0,
+                 lazy:bool=False,
+                 index_cache:bool=False,
+                 hash_cons:bool=False,
+                 snapshot=None,
+                 stats:bool=True):
         self.buffer = buffer
+        self.path = path
+        self.workers = workers
+        # objects in a snapshot are decoded only when they are accessed
+        self.lazy = lazy or snapshot is not None
+        self.snapshot = snapshot
+        if snapshot is not None:
+            # stream data in snapshot is sliced from buffer
+            snapshot.pdf_buffer = buffer
+        self.index_cache = index_cache
         logger.debug("document buffer size = %0.2f MB" % (len(self.buffer)/1024.0/1024.0))
-        self.parser = Parser(self.buffer)
+        # HashConsTable, it also has the stats (e.g. bytes_saved)
+        self.hash_cons = HashConsTable() if hash_cons else None
+        # counters of tokenizers, parsers, stream decoding and objects cache
+        self.stats = Stats() if stats else None
+        # stream Length objects are parsed directly, without the cache
+        # so parsing a stream never waits for another object lock
+        self.parser = Parser(self.buffer,
+                             resolver=self._parse_object,
+                             hash_cons=self.hash_cons,
+                             stats=self.stats)
+        if snapshot is not None:
+            snapshot.stats = self.stats
         # tuple (major, minor)
         self.version = None
-        # dict, final/merged xref table, obj_num -> (obj_offset, obj_gen, obj_free)
+        # XrefOverlay, final xref, obj_num -> (obj_offset, obj_gen, obj_free)
+        # it looks up the xref of each revision, newest first
         self.xref = None
+        # list of (xref_type, XrefTable, trailer) of each revision
+        # newest first, the last one is the original document
+        self.prevs = None
+        # offsets of trailers in prevs (of xref stream object if xref_type is stream)
+        self.trailer_offsets = None
         # dict
         self.trailer = None
         # dict (obj_num, obj_gen) -> PdfIndirectObject
+        # it is a cache of parsed objects, objects are added by get_object
         self.objects = None
+        self._object_locks = [threading.Lock() for i in range(0, OBJECT_LOCK_STRIPES)]
+        # decoded object streams (ObjStm), for compressed objects
+        self.object_streams = ObjectStreamCache(self._load_object_stream)
+        # decoded streams, compiled contents (e.g. of Form XObjects) and fonts
+        # they are shared by pages, so they are decoded once
+        self.decode_cache = DecodeCache()
+        # dict obj_num -> end offset of the parsed (not compressed) objects
+        self.object_ends = {}
+        # dict obj_num -> bytes, value of Type of the parsed objects (if any)
+        self.object_types = {}
         # root of page tree of type PdfDictionary
         self.catalog = None
         # root page in page tree of type Page
         self.root_page = None
-        # ordered list (by page num) of (leaf) Page objects
+        # PageList, ordered (by page num) lazy list of (leaf) Page objects
         self.pages = None
+        # dict PdfIndirectReference -> Page, the page tree nodes created so far
+        self._page_nodes = {}
+        # list of PdfIndirectReference of leaf pages, if known (from index)
+        self._page_refs = None
         # load document in self.buffer
         self._load()
 
+    # maps the file at path read-only instead of reading it to memory
+    @classmethod
+    def open(cls,
+             path:str,
+             workers:int=0,
+             lazy:bool=False,
+             index_cache:bool=False,
+             hash_cons:bool=False,
+             stats:bool=True):
+        with open(path, 'rb') as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls(buffer,
+                   path=path,
+                   workers=workers,
+                   lazy=lazy,
+                   index_cache=index_cache,
+                   hash_cons=hash_cons,
+                   stats=stats)
+
     def _version_equal_or_greater_than(self, major, minor):
         if self.version[0] > major:
             return True
@@ -63,32 +172,39 @@ class Document:
         else:
             return False
 
+    # ISO 32000-2 7.5.5: File trailer
+    # startxref
+    # byte_offset_of_last_xref
+    # %%EOF
+    # only the end of the buffer is read, backwards from %%EOF
     def _find_last_xref_offset(self):
         logger.debug('_find_last_xref_offset')
-        num_lines = self.parser.get_num_lines()
-        only_numbers_re = re.compile(r"^[0-9]+$")
-        for idx in range(num_lines-1, -1, -1):
-            startxref = self.parser.get_line(idx)
-            if startxref == b'startxref':
-                assert idx < (num_lines-2), 'startxref cannot be the last line'
-                try:
-                    line = self.parser.get_line(idx+1).decode('ascii')
-                    if only_numbers_re.match(line) is not None:
-                        return int(line)
-                except UnicodeError:
-                    pass
-                assert True, "document should have an offset after startxref"
-                return None
-        assert True, "document should have a startxref"
-        return None
+        buffer_len = len(self.buffer)
+        for size in STARTXREF_SEARCH_SIZES:
+            start = max(0, buffer_len - size)
+            tail = self.buffer[start:buffer_len]
+            eof = tail.rfind(b'%%EOF')
+            if eof == -1:
+                eof = len(tail)
+            idx = tail.rfind(b'startxref', 0, eof)
+            if idx != -1:
+                m = startxref_offset_re.match(tail, idx + len(b'startxref'))
+                if m is None:
+                    raise PdfConformanceException('startxref is not followed by an offset')
+                return int(m.group(1))
+            if start == 0:
+                break
+        raise PdfConformanceException('document does not have a startxref')
 
     # ISO 32000-2 7.5.4: Cross-reference table
     # xref entry has a fixed format
     # nnnnnnnnnn ggggg fEOL
     # EOL is one of SP CR, SP LF, CR LF
-    def _read_xref_entry(self):
+    # returns (xref_entry, next_line_pos)
+    def _read_xref_entry(self, pos:int):
         logger.debug('_read_xref_entry')
-        line = self.parser.next_line().decode('ascii')
+        (line, pos) = self.parser.read_line_at(pos)
+        line = line.decode('ascii')
         # 10-digit byte offset
         byte_offset = int(line[0:10])
         # 5-digit generation number
@@ -100,48 +216,142 @@ class Document:
         elif is_free == 'n':
             is_free = False
         else:
-            assert False, "xref entry in-use flag should be f or n, not %s" % str(free)
-        return (byte_offset, generation_number, is_free)
+            raise PdfConformanceException("xref entry in-use flag should be f or n, not %s" % is_free)
+        return ((byte_offset, generation_number, is_free), pos)
 
     # ISO 32000-2 7.5.4: Cross-reference table
     # xref
-    # first_obj_num num_entries
-    # xref_entries* (see _read_xref_entry)
+    # (first_obj_num num_entries
+    #  xref_entries* (see _read_xref_entry))+
+    # trailer
+    # a subsection is parsed in one pass (see parse_xref_subsection)
+    # entry by entry only if its entries are not exactly 20 bytes
+    # returns (XrefTable, trailer_offset)
     def _read_xref(self, xref_offset):
         logger.debug('_read_xref')
-        self.parser.seek(xref_offset)
-        line = self.parser.next_line()
-        assert line == b'xref', 'xref offset does not point to an xref'
-        line = self.parser.next_line().decode('ascii')
-        words = line.split(' ')
-        first_obj_num = int(words[0])
-        num_entries = int(words[1])
-        logger.debug('xref.first_obj_num: %d' % first_obj_num)
-        logger.debug('xref.num_entries: %d' % num_entries)
-        xref_entries = []
-        for obj_num in range(first_obj_num, first_obj_num + num_entries):
-            xref_entry = self._read_xref_entry()
-            xref_entries.append(xref_entry)
-        return (first_obj_num, xref_entries)
-
-    def _read_trailer(self):
+        (line, pos) = self.parser.read_line_at(xref_offset)
+        if line.rstrip() != b'xref':
+            raise PdfConformanceException('xref offset does not point to an xref')
+        xref_table = XrefTable()
+        while True:
+            (line, next_pos) = self.parser.read_line_at(pos)
+            if line is None:
+                raise PdfConformanceException('xref is not followed by a trailer')
+            if line.startswith(b'trailer'):
+                return (xref_table, pos)
+            words = line.decode('ascii').split()
+            first_obj_num = int(words[0])
+            num_entries = int(words[1])
+            pos = next_pos
+            logger.debug('xref.first_obj_num: %d' % first_obj_num)
+            logger.debug('xref.num_entries: %d' % num_entries)
+            subsection = parse_xref_subsection(self.buffer, pos, num_entries)
+            if subsection is not None:
+                (offsets, generations, types, pos) = subsection
+                xref_table.set_subsection(first_obj_num, offsets, generations, types)
+            else:
+                logger.warning('xref entries are not 20 bytes, reading entry by entry')
+                for obj_num in range(first_obj_num, first_obj_num + num_entries):
+                    ((obj_offset, obj_gen, obj_is_free), pos) = self._read_xref_entry(pos)
+                    xref_table.set(obj_num, obj_offset, obj_gen, obj_is_free)
+
+    # ISO 32000-2 7.5.8: Cross-reference streams
+    # returns (XrefTable, trailer), trailer is the stream dictionary
+    def _read_xref_stream(self, xref_offset):
+        logger.debug('_read_xref_stream')
+        (obj, end_offset) = self.parser.parse_object_at(xref_offset)
+        if not (isinstance(obj, PdfIndirectObject) and
+                isinstance(obj.p, PdfStream)):
+            raise PdfConformanceException('xref offset does not point to an xref or an xref stream')
+        stream = obj.p
+        stream_dictionary = stream.stream_dictionary
+        if stream_dictionary.get(PdfName('Type'), None) != PdfName('XRef'):
+            raise PdfConformanceException('xref stream Type is not XRef')
+        if PdfName('W') not in stream_dictionary:
+            raise PdfConformanceException('xref stream does not have W')
+        if PdfName('Size') not in stream_dictionary:
+            raise PdfConformanceException('xref stream does not have Size')
+        widths = [w.p for w in stream_dictionary[PdfName('W')].p]
+        size = stream_dictionary[PdfName('Size')].p
+        index = stream_dictionary.get(PdfName('Index'), None)
+        if index is None:
+            index = [(0, size)]
+        else:
+            index = [v.p for v in index.p]
+            if len(index) % 2 != 0:
+                raise PdfConformanceException('xref stream Index should have pairs of integers')
+            index = [(index[i], index[i+1]) for i in range(0, len(index), 2)]
+        xref_table = parse_xref_stream(stream.decode(self.stats), widths, index)
+        return (xref_table, stream_dictionary)
+
+    # xref_offset (startxref or Prev) points to an xref table or an xref stream
+    # returns (xref_type, XrefTable, trailer, trailer_offset)
+    def _read_xref_section(self, xref_offset):
+        logger.debug('_read_xref_section')
+        (line, pos) = self.parser.read_line_at(xref_offset)
+        if line is None or not line.startswith(b'xref'):
+            (xref_table, trailer) = self._read_xref_stream(xref_offset)
+            return (XREF_TYPE_STREAM, xref_table, trailer, xref_offset)
+        (xref_table, trailer_offset) = self._read_xref(xref_offset)
+        trailer = self._read_trailer(trailer_offset)
+        # ISO 32000-2 7.5.8.4: Compatibility with applications
+        # that do not support compressed reference streams
+        # hybrid-reference file, XRefStm points to an xref stream
+        # containing the entries not in (or free in) the xref table
+        xref_stream_offset = trailer.get(PdfName('XRefStm'), None)
+        if xref_stream_offset is not None:
+            (xref_stream_table, xref_stream_dictionary) = self._read_xref_stream(xref_stream_offset.p)
+            xref_table.fill_from(xref_stream_table)
+        return (XREF_TYPE_TABLE, xref_table, trailer, trailer_offset)
+
+    # ISO 32000-2 7.5.6: Incremental updates
+    # Prev in trailer is the offset of the previous xref section
+    # returns list of (xref_type, XrefTable, trailer, trailer_offset), newest first
+    def _read_xref_sections(self, last_xref_offset:int):
+        logger.debug('_read_xref_sections')
+        sections = []
+        visited = set()
+        xref_offset = last_xref_offset
+        while xref_offset is not None:
+            if xref_offset in visited:
+                logger.warning('Prev chain has a cycle at %d, ignoring the rest' % xref_offset)
+                break
+            visited.add(xref_offset)
+            section = self._read_xref_section(xref_offset)
+            sections.append(section)
+            prev = section[2].get(PdfName('Prev'), None)
+            if prev is None:
+                xref_offset = None
+            elif isinstance(prev, PdfIntegerNumber):
+                xref_offset = prev.p
+            else:
+                raise PdfConformanceException('trailer Prev is not an integer')
+        logger.info('%d revisions' % len(sections))
+        return sections
+
+    # reads the trailer of an xref section of xref_type
+    # trailer_offset is as returned by _read_xref_section
+    def _read_section_trailer(self, xref_type:str, trailer_offset:int):
+        if xref_type == XREF_TYPE_TABLE:
+            return self._read_trailer(trailer_offset)
+        (obj, end_offset) = self.parser.parse_object_at(trailer_offset)
+        if not (isinstance(obj, PdfIndirectObject) and
+                isinstance(obj.p, PdfStream)):
+            raise PdfConformanceException('xref stream is not a stream')
+        return obj.p.stream_dictionary
+
+    # ISO 32000-2 7.5.5: File trailer
+    # trailer_offset is the offset of trailer keyword following the xref
+    def _read_trailer(self, trailer_offset:int):
         logger.debug('_read_trailer')
-        num_lines = self.parser.get_num_lines()
-        for idx in range(num_lines-1, -1, -1):
-            trailer = self.parser.get_line(idx)
-            if trailer == b'trailer':
-                if idx >= (num_lines-1):
-                    raise PdfConformanceException('trailer cannot be the last line')
-                self.parser.seek_to_line(idx+1)
-                trailer = self.parser.next()
-                if not isinstance(trailer, PdfDictionary):
-                    raise PdfConformanceException('trailer is not a dictionary')
-                return trailer
-        return None
+        (trailer, end_offset) = self.parser.parse_object_at(trailer_offset + len(b'trailer'))
+        if not isinstance(trailer, PdfDictionary):
+            raise PdfConformanceException('trailer is not a dictionary')
+        return trailer
 
     def _read_header(self):
         logger.debug('_read_header')
-        header = self.parser.get_line(0)
+        (header, pos) = self.parser.read_line_at(0)
         assert header[0:5] == b'%PDF-'
         version = header.decode('ascii')[5:]
         version_numbers = version.split('.')
@@ -149,41 +359,107 @@ class Document:
         self.version = (int(version_numbers[0]), int(version_numbers[1]))
         logger.info('version: %d.%d' % (self.version[0], self.version[1]))
 
-    # this should be called in order
-    # for the last xref th first
-    # for the first xref the last
-    def _load_objects_from_xref(self,
-                                xref_first_obj_num:int,
-                                xref_entries:list):
+    # loads the in-use objects in xref_table which are not loaded yet
+    # only the newest versions are loaded, older versions are never parsed
+    def _load_objects_from_xref(self, xref_table:XrefOverlay):
         logger.debug('_load_objects_from_xref')
-        for i in range(0, len(xref_entries)):
-            (obj_byte_offset, obj_gen, obj_is_free) = xref_entries[i]
-            obj_num = xref_first_obj_num + i
-            if not obj_is_free:
-                logger.debug('obj %d:%d @ %d' % (obj_num, obj_gen, obj_byte_offset))
-                ref = PdfIndirectReference(obj_num, obj_gen)
-                if ref in self.objects:
-                    self.debug('newer version of %s is already loaded' % ref)
-                else:
-                    self.parser.seek(obj_byte_offset)
-                    obj = self.parser.next()
-                    assert isinstance(obj, PdfIndirectObject), '%s:%s' % (obj, type(obj))
-                    self.objects[ref] = obj
-
-    def _load_objects(self):
+        if self.lazy:
+            return
+        # (obj_byte_offset, obj_num, obj_gen) of objects to load
+        entries = []
+        in_use = xref_table.in_use_entries()
+        for (obj_byte_offset, obj_num, obj_gen) in in_use:
+            ref = PdfIndirectReference(obj_num, obj_gen)
+            if ref in self.objects:
+                logger.debug('newer version of %s is already loaded' % ref)
+            else:
+                entries.append((obj_byte_offset, obj_num, obj_gen))
+        with phases.phase('objects') as phase:
+            if self.workers > 1 and self.path is not None:
+                objs = _workers.parse_objects(self.path,
+                                              entries,
+                                              self.workers,
+                                              hash_cons=self.hash_cons is not None,
+                                              in_use=in_use)
+            else:
+                objs = self._parse_objects(entries)
+            for ((obj_byte_offset, _, _), (obj_num, obj_gen, obj, end_offset)) in zip(entries, objs):
+                self.objects[PdfIndirectReference(obj_num, obj_gen)] = obj
+                self._record_object(obj, end_offset)
+                phase.add_bytes(end_offset - obj_byte_offset)
+            if self.stats is not None:
+                self.stats.objects_cached = self.stats.objects_cached + len(objs)
+                if self.workers > 1 and self.path is not None:
+                    # streams parsed in workers are decoded here
+                    for (obj_num, obj_gen, obj, end_offset) in objs:
+                        if isinstance(obj.p, PdfStream):
+                            obj.p.stats = self.stats
+        with phases.phase('compressed objects'):
+            # sorted by object stream, so each object stream is decoded once
+            for (objstm_obj_num, index, obj_num) in sorted(xref_table.compressed_entries()):
+                ref = PdfIndirectReference(obj_num, 0)
+                if ref not in self.objects:
+                    self.objects[ref] = self._parse_compressed_object(ref, objstm_obj_num, index, xref_table)
+                    self._record_object(self.objects[ref], None)
+                    if self.stats is not None:
+                        self.stats.objects_cached = self.stats.objects_cached + 1
+
+    # entries is a list of (obj_byte_offset, obj_num, obj_gen)
+    # returns a list of (obj_num, obj_gen, PdfIndirectObject, end_offset)
+    def _parse_objects(self, entries:list):
+        objs = []
+        for (obj_byte_offset, obj_num, obj_gen) in entries:
+            (obj, end_offset) = self.parser.parse_object_at(obj_byte_offset)
+            assert isinstance(obj, PdfIndirectObject), '%s:%s' % (obj, type(obj))
+            objs.append((obj_num, obj_gen, obj, end_offset))
+        return objs
+
+    # keeps the end offset (if not compressed) and Type of a parsed object
+    # end_offset is None for compressed objects
+    def _record_object(self, obj:PdfIndirectObject, end_offset:int):
+        if end_offset is not None:
+            self.object_ends[obj.object_number] = end_offset
+        value = obj.p
+        if isinstance(value, PdfStream):
+            value = value.stream_dictionary
+        if isinstance(value, PdfDictionary):
+            obj_type = value.get(PdfName('Type'), None)
+            # a malformed Type (not a name) is not recorded
+            if isinstance(obj_type, PdfName):
+                self.object_types[obj.object_number] = obj_type.p
+
+    # sections is a list of (xref_type, XrefTable, trailer, trailer_offset)
+    def _set_xref_sections(self, sections:list):
+        self.prevs = [(xref_type, xref_table, trailer)
+                      for (xref_type, xref_table, trailer, trailer_offset) in sections]
+        self.trailer_offsets = [trailer_offset
+                                for (xref_type, xref_table, trailer, trailer_offset) in sections]
+        self.xref = XrefOverlay([xref_table
+                                 for (xref_type, xref_table, trailer) in self.prevs])
+
+    def _load_objects(self, index:indexcache.DocumentIndex=None):
         logger.debug('_load_objects')
         self.objects = {}
 
-        last_xref_offset = self._find_last_xref_offset()
-        logger.debug("startxref found: xref @ %d" % last_xref_offset)
-
-        (xref_first_obj_num, xref_entries) = self._read_xref(last_xref_offset)
-        logger.debug('%d xref entries starting from object number %d' % (len(xref_entries), xref_first_obj_num))
-
-        self._load_objects_from_xref(xref_first_obj_num, xref_entries)
-
-        trailer = self._read_trailer()
-        assert trailer is not None, "there has to be at least one trailer"
+        with phases.phase('xref'):
+            if index is None:
+                last_xref_offset = self._find_last_xref_offset()
+                logger.debug("startxref found: xref @ %d" % last_xref_offset)
+                self._set_xref_sections(self._read_xref_sections(last_xref_offset))
+            else:
+                logger.debug('xref is read from index')
+                self._set_xref_sections([(xref_type,
+                                          xref_table,
+                                          self._read_section_trailer(xref_type, trailer_offset),
+                                          trailer_offset)
+                                         for (xref_type, trailer_offset, xref_table) in index.sections])
+                self.object_ends.update(index.object_ends)
+                self.object_types.update(index.object_types)
+
+        self._load_objects_from_xref(self.xref)
+
+        # newest trailer
+        trailer = self.prevs[0][2]
         #logger.info('trailer: %s' % trailer)
 
         if PdfName('Size') not in trailer:
@@ -197,46 +473,454 @@ class Document:
                 PdfName('Encrypt') in trailer):
                     raise PdfConformanceException('trailer dictionary should have an ID key')
 
-        if PdfName('Prev') in trailer:
-            raise NotSupportedException('incrementally updated PDFs not supported yet')
-
         self.trailer = trailer
 
-    def get_object(self, ref:PdfIndirectReference):
+    # number of revisions, original document and the incremental updates
+    def get_num_revisions(self):
+        return len(self.prevs)
+
+    # this is thread-safe, objects not loaded yet are parsed and cached
+    # raises KeyError if there is no such object in xref
+    # if revision is given, the object is returned as it was in that revision
+    # revision 0 is the original document, 1 is after the first update etc.
+    # objects of older revisions are not cached
+    def get_object(self, ref:PdfIndirectReference, revision:int=None):
         assert isinstance(ref, PdfIndirectReference), ref
-        return self.objects[ref]
+        if revision is not None:
+            if revision < 0 or revision >= len(self.prevs):
+                raise IndexError('there is no revision %d' % revision)
+            return self._parse_object(ref, self.xref.older(len(self.prevs) - 1 - revision))
+        obj = self.objects.get(ref, None)
+        stats = self.stats
+        if obj is not None:
+            if stats is not None:
+                stats.object_cache_hits = stats.object_cache_hits + 1
+            return obj
+        if stats is not None:
+            stats.object_cache_misses = stats.object_cache_misses + 1
+        with self._object_locks[ref.object_number % OBJECT_LOCK_STRIPES]:
+            # it might be loaded by another thread while waiting for the lock
+            obj = self.objects.get(ref, None)
+            if obj is None:
+                obj = self._parse_object(ref)
+                # a single dict assignment is atomic
+                # so different stripes can add to objects concurrently
+                self.objects[ref] = obj
+                if stats is not None:
+                    stats.objects_cached = stats.objects_cached + 1
+        return obj
+
+    # returns the object at ref without keeping it in objects (unlike get_object)
+    # so walking all objects once does not keep them all in memory
+    # the object in objects is returned if it is already there
+    # raises KeyError if there is no such object in xref
+    def parse_object(self, ref:PdfIndirectReference):
+        obj = self.objects.get(ref, None)
+        if obj is not None:
+            return obj
+        return self._parse_object(ref)
+
+    # returns True if ref is an in-use or a compressed object in the final xref
+    def has_object(self, ref:PdfIndirectReference):
+        entry = self.xref.get_entry(ref.object_number, None)
+        if entry is None:
+            return False
+        if entry[0] == ENTRY_IN_USE:
+            return entry[2] == ref.generation_number
+        return entry[0] == ENTRY_COMPRESSED and ref.generation_number == 0
+
+    # returns the decoded data (bytes) of the stream at ref
+    # it is kept in decode_cache, not in the stream object
+    def get_decoded_stream(self, ref:PdfIndirectReference):
+        return self.decode_cache.get(('stream', ref),
+                                     lambda: self._get_stream(ref).decode(self.stats))
+
+    # returns CompiledContent of the content stream at ref, e.g. a Form XObject
+    def get_compiled_content(self, ref:PdfIndirectReference):
+        return self.decode_cache.get(('content', ref),
+                                     lambda: CompiledContent.compile(
+                                         ContentStreamLexer(self._get_stream(ref).decode_chunks(stats=self.stats))))
+
+    # returns Font of the font dictionary at ref, or of a direct font dictionary
+    # a direct one is keyed by its id, Font keeps the dictionary
+    # so its id is not reused by another one while it is in decode_cache
+    def get_font(self, font):
+        if isinstance(font, PdfIndirectReference):
+            return self.decode_cache.get(('font', font),
+                                         lambda: Font(self, self.get_object(font).p))
+        return self.decode_cache.get(('font', id(font)),
+                                     lambda: Font(self, font))
+
+    # returns the resource of category (e.g. 'XObject', 'Font') named name
+    # in resources (dictionary or reference, e.g. of a page or a Form XObject)
+    # it is usually a PdfIndirectReference, None if there is no such resource
+    def get_resource(self, resources, category:str, name:PdfName):
+        if resources is None:
+            return None
+        if isinstance(resources, PdfIndirectReference):
+            resources = self.get_object(resources).p
+        resources_of_category = resources.get(PdfName(category), None)
+        if isinstance(resources_of_category, PdfIndirectReference):
+            resources_of_category = self.get_object(resources_of_category).p
+        if not isinstance(resources_of_category, PdfDictionary):
+            return None
+        return resources_of_category.get(name, None)
+
+    # yields fn(page) for the (leaf) pages at indexes in pages (all if None)
+    # in page order, if workers > 1 pages are fanned out to that many processes
+    # each worker opens path lazily, so fn and its results should be picklable
+    # if there is no path, pages are processed in this process
+    # pages is a range with a positive step, the page tree is walked once
+    def map_pages(self, fn, workers:int=0, pages:range=None):
+        if pages is None:
+            pages = range(0, self.get_num_pages())
+        if workers > 1 and self.path is not None:
+            # (obj_num, obj_gen) of the pages, Page objects are created in workers
+            page_refs = (ref.p for ref in itertools.islice(self.iter_page_refs(),
+                                                           pages.start,
+                                                           pages.stop,
+                                                           pages.step))
+            return _workers.map_pages(type(self), self.path, fn, page_refs, workers)
+        return (fn(page) for page in itertools.islice(self.iter_pages(),
+                                                      pages.start,
+                                                      pages.stop,
+                                                      pages.step))
+
+    # yields the text (str) of each page, one page at a time
+    def iter_text(self):
+        return text.iter_text(self)
+
+    def _get_stream(self, ref:PdfIndirectReference):
+        stream = self.get_object(ref).p
+        if not isinstance(stream, PdfStream):
+            raise PdfConformanceException('%s is not a stream' % ref)
+        return stream
+
+    # xref is the final xref (self.xref) if not given
+    def _parse_object(self, ref:PdfIndirectReference, xref:XrefOverlay=None):
+        logger.debug('_parse_object: %s' % ref)
+        if xref is None:
+            xref = self.xref
+        if xref is None:
+            raise KeyError(ref)
+        if self.snapshot is not None and xref is self.xref:
+            obj = self.snapshot.get_object(ref)
+            if obj is not None:
+                return obj
+        xref_entry = xref.get_entry(ref.object_number, None)
+        if xref_entry is None:
+            raise KeyError(ref)
+        (entry_type, obj_byte_offset, obj_gen) = xref_entry
+        if entry_type == ENTRY_COMPRESSED:
+            if ref.generation_number != 0:
+                raise KeyError(ref)
+            return self._parse_compressed_object(ref, obj_byte_offset, obj_gen, xref)
+        if entry_type != ENTRY_IN_USE or obj_gen != ref.generation_number:
+            raise KeyError(ref)
+        (obj, end_offset) = self.parser.parse_object_at(obj_byte_offset)
+        if not isinstance(obj, PdfIndirectObject):
+            raise PdfConformanceException('xref entry of %s does not point to an object' % ref)
+        if xref is self.xref:
+            self._record_object(obj, end_offset)
+        return obj
+
+    # key is (objstm_obj_num, objstm_byte_offset)
+    # the byte offset is in the key because different revisions
+    # can have different object streams with the same object number
+    # the object stream is parsed at the offset (not with get_object)
+    # so the offset of the given revision is used and it is not kept in objects
+    def _load_object_stream(self, key:tuple):
+        (objstm_obj_num, objstm_byte_offset) = key
+        (obj, end_offset) = self.parser.parse_object_at(objstm_byte_offset)
+        if not (isinstance(obj, PdfIndirectObject) and
+                obj.object_number == objstm_obj_num and
+                isinstance(obj.p, PdfStream)):
+            raise PdfConformanceException('object stream %d is not a stream' % objstm_obj_num)
+        return ObjectStream(objstm_obj_num, obj.p, hash_cons=self.hash_cons, stats=self.stats)
+
+    # ISO 32000-2 7.5.7: Object streams
+    # the object is at index in object stream objstm_obj_num
+    def _parse_compressed_object(self,
+                                 ref:PdfIndirectReference,
+                                 objstm_obj_num:int,
+                                 index:int,
+                                 xref:XrefOverlay):
+        logger.debug('_parse_compressed_object: %s in %d[%d]' % (ref, objstm_obj_num, index))
+        objstm_entry = xref.get_entry(objstm_obj_num, None)
+        if objstm_entry is None or objstm_entry[0] != ENTRY_IN_USE:
+            raise PdfConformanceException('object stream %d of %s is not in xref' % (objstm_obj_num, ref))
+        object_stream = self.object_streams.get((objstm_obj_num, objstm_entry[1]))
+        obj = object_stream.get_object(index)
+        if obj.object_number != ref.object_number:
+            raise PdfConformanceException('object stream %d index %d is not %s' % (objstm_obj_num, index, ref))
+        return obj
 
     def _load_catalog(self):
-        log.debug('_load_catalog')
+        logger.debug('_load_catalog')
         root_ref = self.trailer[PdfName('Root')]
         logger.info("trailer.Root (catalog dictionary): %s" % str(root_ref))
-        self.catalog = self.get_object(root_ref).value
+        self.catalog = self.get_object(root_ref).p
         #logger.info('Catalog: %s:%s' % (self.catalog, type(self.catalog)))
         assert PdfName('Type') in self.catalog, 'catalog has no Type'
         assert self.catalog[PdfName('Type')] == PdfName('Catalog'), 'catalog Type is not Catalog'
         assert PdfName('Pages') in self.catalog, 'catalog has no Pages'
 
-    def add_leaf_page(self, page):
-        logger.info('page #%d: %s' % (len(self.pages) + 1, str(page.ref)))
-        self.pages.append(page)
+    # returns the Page of page tree node at ref, creates it if needed
+    # parent is the Page of its parent node
+    def _get_page_node(self, parent, ref):
+        node = self._page_nodes.get(ref, None)
+        if node is None:
+            # setdefault, another thread might have created it already
+            node = self._page_nodes.setdefault(ref, Page(self, parent, ref))
+        return node
+
+    # returns the Page of page tree node at ref, using Parent to find its parent
+    def _get_page_node_by_parent(self, ref):
+        node = self._page_nodes.get(ref, None)
+        if node is None:
+            parent_ref = self.get_object(ref).p.get(PdfName('Parent'), None)
+            parent = None
+            if parent_ref is not None:
+                parent = self._get_page_node_by_parent(parent_ref)
+            node = self._get_page_node(parent, ref)
+        return node
+
+    # number of pages, Count of the root of page tree
+    def get_num_pages(self):
+        if self._page_refs is not None:
+            return len(self._page_refs)
+        return self.root_page.get_count()
+
+    # returns Type of the page tree node at ref as bytes
+    # leaves are not parsed if their Type is already known (e.g. from index)
+    # if cache=False, the node is not kept in objects
+    def _get_page_node_type(self, ref, cache:bool=True):
+        node_type = self.object_types.get(ref.object_number, None)
+        if node_type is None:
+            obj = self.get_object(ref) if cache else self.parse_object(ref)
+            node_type = obj.p.get(PdfName('Type'), PdfName('')).p
+        return node_type
+
+    # returns Page of page index n (0 is the first page)
+    # only the nodes on the path from root to the page are created
+    # the kids (not taken) are skipped with their Count
+    def page(self, n:int):
+        if n < 0 or n >= self.get_num_pages():
+            raise IndexError('page index %d out of range' % n)
+        if self._page_refs is not None:
+            return self._get_page_node_by_parent(self._page_refs[n])
+        node = self.root_page
+        depth = 0
+        while node.is_pages():
+            depth = depth + 1
+            if depth > PAGE_TREE_MAX_DEPTH:
+                raise PdfConformanceException('page tree is deeper than %d' % PAGE_TREE_MAX_DEPTH)
+            parent = node
+            for kid_ref in parent.node[PdfName('Kids')]:
+                kid_type = self._get_page_node_type(kid_ref)
+                if kid_type == b'Pages':
+                    count = self.get_object(kid_ref).p[PdfName('Count')].p
+                elif kid_type == b'Page':
+                    count = 1
+                else:
+                    count = 0
+                if n < count:
+                    node = self._get_page_node(parent, kid_ref)
+                    break
+                n = n - count
+            else:
+                raise PdfConformanceException('Count of page tree node %s is not correct' % parent.ref)
+        return node
+
+    # walks page tree depth-first with an explicit stack
+    # yields (parent, ref) of each leaf page in order
+    # parent is the Page of its parent node if create_nodes=True, otherwise None
+    # and then intermediate nodes are not kept in objects either
+    # if cache=False, leaves are not kept in objects
+    # raises PdfConformanceException if a Pages node is visited twice (cycle)
+    # or the tree is deeper than PAGE_TREE_MAX_DEPTH
+    def _walk_page_tree(self, create_nodes:bool, cache:bool=True):
+        root_ref = self.root_page.ref
+        visited = {root_ref}
+        # (Page or None, Kids array, index of the next kid)
+        stack = [(self.root_page if create_nodes else None,
+                  self.root_page.node[PdfName('Kids')].p,
+                  0)]
+        while len(stack) > 0:
+            (parent, kids, idx) = stack[-1]
+            if idx == len(kids):
+                stack.pop()
+                continue
+            stack[-1] = (parent, kids, idx + 1)
+            kid_ref = kids[idx]
+            kid_type = self._get_page_node_type(kid_ref, cache)
+            if kid_type == b'Page':
+                # a leaf cannot make a cycle, so it is not kept in visited
+                yield (parent, kid_ref)
+            elif kid_type == b'Pages':
+                if kid_ref in visited:
+                    raise PdfConformanceException('page tree has a cycle at %s' % kid_ref)
+                visited.add(kid_ref)
+                if len(stack) >= PAGE_TREE_MAX_DEPTH:
+                    raise PdfConformanceException('page tree is deeper than %d' % PAGE_TREE_MAX_DEPTH)
+                if create_nodes:
+                    kid = self._get_page_node(parent, kid_ref)
+                    kid_node = kid.node
+                else:
+                    kid = None
+                    kid_node = self.parse_object(kid_ref).p
+                stack.append((kid, kid_node[PdfName('Kids')].p, 0))
+
+    # yields the references of leaf pages in order, no Page is created
+    # and page tree nodes are not kept in objects
+    def iter_page_refs(self):
+        if self._page_refs is not None:
+            yield from self._page_refs
+        else:
+            for (parent, ref) in self._walk_page_tree(False, False):
+                yield ref
+
+    # yields leaf pages in order, nodes are created as the tree is walked
+    # if cache=False, leaf pages (and their nodes and contents) are not kept
+    # only the intermediate nodes are, so visiting all pages once uses constant memory
+    def iter_pages(self, cache:bool=True):
+        if self._page_refs is not None:
+            for ref in self._page_refs:
+                if cache:
+                    yield self._get_page_node_by_parent(ref)
+                else:
+                    yield self._get_transient_page(ref)
+        else:
+            for (parent, ref) in self._walk_page_tree(True, cache):
+                if cache:
+                    yield self._get_page_node(parent, ref)
+                else:
+                    yield self._get_transient_page(ref, parent)
+
+    # returns the leaf Page at ref without keeping it in _page_nodes
+    # the one in _page_nodes is returned if it is already there
+    # parent is found using Parent if it is not given
+    def _get_transient_page(self, ref, parent=None):
+        page = self._page_nodes.get(ref, None)
+        if page is not None:
+            return page
+        node = self.parse_object(ref).p
+        if parent is None:
+            parent_ref = node.get(PdfName('Parent'), None)
+            if parent_ref is not None:
+                parent = self._get_page_node_by_parent(parent_ref)
+        return Page(self, parent, ref, cache=False, node=node)
 
     def _load_pages(self):
-        self.pages = []
-        self.root_page = Page(self,
-                              None,
-                              self.catalog['Pages'])
+        self.root_page = self._get_page_node(None, self.catalog[PdfName('Pages')])
+        self.pages = PageList(self)
+
+    # leaf pages are known (from index), so page tree is not walked
+    # only the intermediate nodes on the Parent chains of pages are created
+    def _load_pages_from_refs(self, page_refs:list):
+        self._page_refs = [PdfIndirectReference(obj_num, obj_gen)
+                           for (obj_num, obj_gen) in page_refs]
+        self._load_pages()
+
+    def _make_index(self):
+        index = indexcache.DocumentIndex()
+        index.version = self.version
+        for i in range(0, len(self.prevs)):
+            (xref_type, xref_table, trailer) = self.prevs[i]
+            index.sections.append((xref_type, self.trailer_offsets[i], xref_table))
+        index.object_ends = self.object_ends
+        index.object_types = self.object_types
+        index.page_refs = [(ref.object_number, ref.generation_number)
+                           for ref in self.iter_page_refs()]
+        return index
+
+    def _write_index(self):
+        index = self._make_index()
+        try:
+            indexcache.write_index(self.path, index)
+        except OSError as e:
+            logger.warning('cannot write index of %s: %s' % (self.path, e))
 
     def _load(self):
-        self._read_header()
-        self._load_objects()
-        self._load_catalog()
-        self._load_pages()
+        index = None
+        if self.snapshot is not None:
+            index = self.snapshot.index
+        elif self.index_cache and self.path is not None:
+            with phases.phase('index'):
+                index = indexcache.read_index(self.path)
+            # objects are parsed on demand, so a reopen does not parse the file
+            if index is not None:
+                self.lazy = True
+        if index is None:
+            with phases.phase('header'):
+                self._read_header()
+        else:
+            self.version = index.version
+        self._load_objects(index)
+        with phases.phase('catalog'):
+            self._load_catalog()
+        if index is None:
+            with phases.phase('page tree'):
+                self._load_pages()
+            if self.index_cache and self.path is not None:
+                with phases.phase('index'):
+                    self._write_index()
+        else:
+            with phases.phase('page tree'):
+                self._load_pages_from_refs(index.page_refs)
+        if self.hash_cons is not None:
+            logger.info('hash-consing: %d objects, %d hits, %d bytes saved' % (len(self.hash_cons),
+                                                                             self.hash_cons.hits,
+                                                                             self.hash_cons.bytes_saved))
+
+    # writes the snapshot of this document to path (see snapshot.py)
+    # all objects (of the final xref) are written, they are parsed if needed
+    # but they are not kept in objects if they are not there already
+    def save_snapshot(self, path:str):
+        if self.path is None:
+            raise NotSupportedException('snapshot of a document without a file is not supported')
+        # objects are parsed (and written) one at a time, they are not kept in objects
+        # index is made after, so their Types are in index
+        # and the page tree is walked without parsing the leaves again
+        def iter_objects():
+            for obj_num in range(0, self.xref.size()):
+                entry = self.xref.get_entry(obj_num, None)
+                if entry is None or entry[0] not in (ENTRY_IN_USE, ENTRY_COMPRESSED):
+                    continue
+                ref = PdfIndirectReference(obj_num, entry[2] if entry[0] == ENTRY_IN_USE else 0)
+                obj = self.objects.get(ref, None)
+                if obj is None:
+                    obj = self._parse_object(ref)
+                yield obj
+        _snapshot.write_snapshot(path, self.path, self._make_index, iter_objects())
+
+    # opens the document of the snapshot at path (see save_snapshot)
+    # objects are decoded from the snapshot when they are accessed, not parsed
+    # pdf_path is the PDF file, if it is not where it was when snapshot is saved
+    @classmethod
+    def load_snapshot(cls, path:str, pdf_path:str=None):
+        snapshot = _snapshot.Snapshot(path, pdf_path)
+        with open(snapshot.pdf_path, 'rb') as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls(buffer, path=snapshot.pdf_path, snapshot=snapshot)
+
+    # prints the object at ref, stream data is not printed
+    def print_object(self, ref:PdfIndirectReference):
+        obj = self.get_object(ref)
+        print("Object %s:" % ref)
+        if isinstance(obj.p, PdfStream):
+            print("%s %s" % (obj.p.stream_dictionary, obj.p))
+        else:
+            print(obj.p)
 
-    def print_summary(self):
+    # pages is an iterable of page indexes (from 0) to print, all if None
+    # if summary_only=True, no page is printed
+    # only the selected pages (and their parents) are loaded if document is lazy
+    def print_summary(self, pages=None, summary_only:bool=False):
 
         print("PDF Version in Header: %s" % str(self.version))
 
-        assert 'Version' not in self.catalog, 'Version in catalog is not supported yet'
+        assert PdfName('Version') not in self.catalog, 'Version in catalog is not supported yet'
 
         print("Catalog: %s" % self.catalog)
 
@@ -252,31 +936,44 @@ class Document:
             print("PDF contains no incremental updates");
         print("Base (%s) XREF contains %d objects" % (self.prevs[-1][0],
                                                       len(self.prevs[-1][1])))
-        print("Final XREF contains %d objects" % len(self.objects))
+        if self.lazy:
+            # objects are not all loaded, so they are counted in xref
+            print("Final XREF contains %d objects" % self.xref.count_objects())
+        else:
+            print("Final XREF contains %d objects" % len(self.objects))
 
         print("PDF contains %d pages:" % len(self.pages))
 
-        for i in range(0, len(self.pages)):
-            page = self.pages[i]
-            print("Page #%d contains %d%sresources %d instructions" % (
+        if summary_only:
+            return
+
+        # all pages are walked in order, page(i) would look each up from the root
+        if pages is None:
+            selected_pages = enumerate(self.iter_pages())
+        else:
+            selected_pages = ((i, self.page(i)) for i in pages)
+
+        for (i, page) in selected_pages:
+            resources = page.resources if page.resources is not None else PdfDictionary()
+            print("Page #%d contains %d%sresources" % (
                 (i+1),
-                len(page.resources),
-                ' inherited ' if page.is_resources_inherited() else ' ',
-                len(page.content)))
-            for k,v in page.resources['Font'].items():
-                print(k)
-                print(self.get_object(v))
-            for inst in page.content:
-                try:
-                    s = []
-                    for i in range(len(inst),0,-1):
-                        c = inst[i-1:i]
-                        if c == b' ':
-                            if len(s) > 0:
-                                m = b''.join(reversed(s))
-                                print(inst, m.decode('ascii'))
-                                break
-                        else:
-                            s.append(c)
-                except:
-                    raise
+                len(resources.p),
+                ' inherited ' if page.is_resources_inherited() else ' '))
+            fonts = resources.get(PdfName('Font'), None)
+            if isinstance(fonts, PdfIndirectReference):
+                fonts = self.get_object(fonts).p
+            if fonts is not None:
+                for (k, v) in fonts.p.items():
+                    print(k)
+                    print(self.get_object(v))
+            num_instructions = 0
+            for (operands, operator) in page.instructions():
+                if operator == b'BI':
+                    # inline image data is not printed
+                    (image_dictionary, data) = operands
+                    print('BI %s ID [%d bytes] EI' % (image_dictionary, len(data)))
+                else:
+                    print(' '.join([str(operand) for operand in operands] +
+                                   [operator.decode('ascii', 'replace')]))
+                num_instructions = num_instructions + 1
+            print("Page #%d contains %d instructions" % ((i+1), num_instructions))
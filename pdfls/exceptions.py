@@ -29,3 +29,7 @@ class PossibleBugException(Exception):
 
 class NotSupportedException(Exception):
     pass
+
+# a snapshot (see snapshot.py) is corrupted or not of the file
+class SnapshotException(Exception):
+    pass
@@ -0,0 +1,85 @@
+# Copyright (C) 2024 Mete Balci
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+# pdfls: a utility to investigate PDF files
+# Copyright (C) 2024 Mete Balci
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+import logging
+import zlib
+
+from .cmap import ToUnicodeCMap
+from .objects import *
+from .exceptions import *
+
+logger = logging.getLogger(__name__)
+
+# ISO 32000-2 9.5 Introduction to font data structures
+# a font dictionary with its indirect entries resolved
+# fonts are shared by pages, see Document.get_font
+class Font:
+
+    def __init__(self, document, dictionary:PdfDictionary):
+        if not isinstance(dictionary, PdfDictionary):
+            raise PdfConformanceException('font is not a dictionary')
+        font_type = dictionary.get(PdfName('Type'), None)
+        if font_type is not None and not (isinstance(font_type, PdfName) and font_type.p == b'Font'):
+            raise PdfConformanceException('font Type is not Font')
+        self.dictionary = dictionary
+        subtype = dictionary.get(PdfName('Subtype'), None)
+        # bytes, e.g. b'Type1' or b'Type0'
+        self.subtype = subtype.p if isinstance(subtype, PdfName) else None
+        base_font = dictionary.get(PdfName('BaseFont'), None)
+        self.base_font = base_font.p if isinstance(base_font, PdfName) else None
+        # FontDescriptor, Widths etc. are often indirect
+        self.entries = {}
+        for (k, v) in dictionary.p.items():
+            if isinstance(v, PdfIndirectReference):
+                v = document.get_object(v).p
+            self.entries[k] = v
+        # ToUnicodeCMap, compiled once here, so once per font reference
+        self.to_unicode = None
+        to_unicode = self.entries.get(PdfName('ToUnicode'), None)
+        if isinstance(to_unicode, PdfStream):
+            try:
+                self.to_unicode = ToUnicodeCMap(to_unicode.decode(document.stats))
+            except (PdfConformanceException, NotSupportedException, ValueError, zlib.error) as e:
+                logger.warning('ToUnicode of %s cannot be read: %s' % (self, e))
+
+    # ISO 32000-2 9.7 Composite fonts
+    def is_composite(self):
+        return self.subtype == b'Type0'
+
+    # returns str of string data (bytes) shown with this font
+    # without ToUnicode, codes of simple fonts are taken as Latin-1
+    # and codes of composite fonts (2 bytes) cannot be mapped (U+FFFD)
+    def decode(self, data:bytes):
+        if self.to_unicode is not None:
+            return self.to_unicode.decode(data, 2 if self.is_composite() else 1)
+        if self.is_composite():
+            return '\ufffd' * (len(data) // 2)
+        return data.decode('latin-1')
+
+    # memory used by this font, used for cache budget
+    # streams (e.g. FontFile) are not decoded, they are not counted
+    def size(self):
+        size = 256 + 64 * len(self.entries)
+        if self.to_unicode is not None:
+            size = size + self.to_unicode.size()
+        return size
+
+    def __str__(self):
+        return 'Font(%s %s)' % (self.subtype, self.base_font)
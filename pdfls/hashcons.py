@@ -0,0 +1,96 @@
+# Copyright (C) 2024 Mete Balci
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+# pdfls: a utility to investigate PDF files
+# Copyright (C) 2024 Mete Balci
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+import itertools
+import logging
+import sys
+
+from .objects import *
+
+logger = logging.getLogger(__name__)
+
+# arrays and dictionaries with more entries than this are not hash-consed
+# they are rarely repeated and their keys are expensive
+HASH_CONS_MAX_CONTAINER_SIZE = 16
+
+# memory that is not allocated again when an existing object is used
+def _retained_size(obj):
+    if isinstance(obj, (PdfBoolean, PdfNull, PdfIndirectReference)):
+        return sys.getsizeof(obj)
+    else:
+        return sys.getsizeof(obj) + sys.getsizeof(obj.p)
+
+# hash-consing of direct objects, used by Parser
+# scalars are created once for each (class, value)
+# small arrays and dictionaries, which contain only hash-consed objects,
+# are frozen and shared between all the places they appear
+# objects are kept (strongly) as long as the table, which is per Document
+# a weak-value table would need __weakref__ slot in every object
+# stats are not locked, they can be slightly off with multiple threads
+class HashConsTable:
+
+    def __init__(self, max_container_size:int=HASH_CONS_MAX_CONTAINER_SIZE):
+        self.max_container_size = max_container_size
+        # key -> PdfDirectObject
+        # key is (class, args) for scalars
+        # and (class, ids of entries) for containers
+        # ids are stable since the entries are kept by the container in table
+        self._objects = {}
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+
+    def __len__(self):
+        return len(self._objects)
+
+    # returns the object cls(*args)
+    def get(self, cls, *args):
+        key = (cls, args)
+        obj = self._objects.get(key, None)
+        if obj is None:
+            self.misses = self.misses + 1
+            # setdefault, another thread might have added it already
+            return self._objects.setdefault(key, cls(*args))
+        self.hits = self.hits + 1
+        self.bytes_saved = self.bytes_saved + _retained_size(obj)
+        return obj
+
+    # returns a frozen container equal to container
+    # or container itself if it cannot be hash-consed
+    def get_container(self, container):
+        if isinstance(container, PdfArray):
+            entries = container.p
+        else:
+            entries = list(itertools.chain.from_iterable(container.p.items()))
+        if len(container.p) > self.max_container_size:
+            return container
+        for entry in entries:
+            if not (isinstance(entry, PdfScalar) or
+                    (isinstance(entry, (PdfArray, PdfDictionary)) and entry.frozen)):
+                return container
+        key = (type(container), tuple(map(id, entries)))
+        obj = self._objects.get(key, None)
+        if obj is None:
+            self.misses = self.misses + 1
+            container.freeze()
+            return self._objects.setdefault(key, container)
+        self.hits = self.hits + 1
+        self.bytes_saved = self.bytes_saved + _retained_size(obj)
+        return obj
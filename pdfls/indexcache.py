@@ -0,0 +1,225 @@
+# Copyright (C) 2024 Mete Balci
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+# pdfls: a utility to investigate PDF files
+# Copyright (C) 2024 Mete Balci
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+from array import array
+import hashlib
+import logging
+import os
+import struct
+import sys
+import tempfile
+
+from .xref import *
+
+logger = logging.getLogger(__name__)
+
+# index of a PDF file is kept next to it in a file with this suffix
+INDEX_CACHE_SUFFIX = '.pdfls-index'
+
+# the index of a file is valid if its size, mtime and
+# the hash of its first and last INDEX_HASH_SIZE bytes are the same
+INDEX_HASH_SIZE = 64 * 1024
+
+INDEX_MAGIC = b'PDFLSIDX'
+INDEX_FORMAT_VERSION = 1
+
+# arrays are written in native byte order, the byte order is in header
+_BYTEORDER = b'L' if sys.byteorder == 'little' else b'B'
+
+# magic, format version, byte order, file size, file mtime_ns, hash
+_header_struct = struct.Struct('<8sHcQq32s')
+# pdf version major, minor, number of sections
+_document_struct = struct.Struct('<BBI')
+# xref type (0: table, 1: stream), trailer offset, number of entries
+_section_struct = struct.Struct('<BQI')
+_count_struct = struct.Struct('<I')
+_name_struct = struct.Struct('<H')
+
+# the things that are needed to open a document without parsing
+# everything is indexed by object number
+class DocumentIndex:
+
+    def __init__(self):
+        # tuple (major, minor)
+        self.version = None
+        # list of (xref_type, trailer_offset, XrefTable), newest first
+        self.sections = []
+        # dict obj_num -> end offset of the object, start is in xref
+        self.object_ends = {}
+        # dict obj_num -> bytes, the value of Type entry
+        self.object_types = {}
+        # list of (obj_num, obj_gen) of leaf pages in order
+        self.page_refs = []
+
+def get_index_path(path:str):
+    return path + INDEX_CACHE_SUFFIX
+
+# returns (size, mtime_ns, hash) of the file at path
+def get_file_key(path:str):
+    st = os.stat(path)
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        h.update(f.read(INDEX_HASH_SIZE))
+        if st.st_size > INDEX_HASH_SIZE:
+            f.seek(max(INDEX_HASH_SIZE, st.st_size - INDEX_HASH_SIZE))
+            h.update(f.read(INDEX_HASH_SIZE))
+    return (st.st_size, st.st_mtime_ns, h.digest())
+
+def _write_array(out, values:array):
+    out.append(_count_struct.pack(len(values)))
+    out.append(values.tobytes())
+
+def _read_array(data, pos:int, typecode:str):
+    (count,) = _count_struct.unpack_from(data, pos)
+    pos = pos + _count_struct.size
+    values = array(typecode)
+    end = pos + count * values.itemsize
+    values.frombytes(data[pos:end])
+    return (values, end)
+
+def _write_dict_columns(out, d:dict, typecode:str):
+    keys = sorted(d)
+    _write_array(out, array('q', keys))
+    _write_array(out, array(typecode, [d[k] for k in keys]))
+
+def _read_dict_columns(data, pos:int, typecode:str):
+    (keys, pos) = _read_array(data, pos, 'q')
+    (values, pos) = _read_array(data, pos, typecode)
+    return (dict(zip(keys, values)), pos)
+
+# appends the encoded index to out (a list of bytes)
+# it is also a part of snapshots (see snapshot.py)
+def encode_index(out:list, index:DocumentIndex):
+    out.append(_document_struct.pack(index.version[0],
+                                     index.version[1],
+                                     len(index.sections)))
+    for (xref_type, trailer_offset, xref_table) in index.sections:
+        out.append(_section_struct.pack(0 if xref_type == XREF_TYPE_TABLE else 1,
+                                        trailer_offset,
+                                        xref_table.size()))
+        out.append(xref_table.offsets.tobytes())
+        out.append(xref_table.generations.tobytes())
+        out.append(bytes(xref_table.types))
+    _write_dict_columns(out, index.object_ends, 'q')
+    # Type names are written once, objects refer to their index
+    names = sorted(set(index.object_types.values()))
+    out.append(_count_struct.pack(len(names)))
+    for name in names:
+        out.append(_name_struct.pack(len(name)))
+        out.append(name)
+    name_indexes = {name: i for (i, name) in enumerate(names)}
+    _write_dict_columns(out,
+                        {k: name_indexes[v] for (k, v) in index.object_types.items()},
+                        'H')
+    _write_array(out, array('q', [obj_num for (obj_num, obj_gen) in index.page_refs]))
+    _write_array(out, array('H', [obj_gen for (obj_num, obj_gen) in index.page_refs]))
+
+# returns (DocumentIndex, end position) of the index encoded at pos in data
+# raises struct.error, IndexError or ValueError if it is not valid
+def decode_index(data, pos:int):
+    index = DocumentIndex()
+    (major, minor, num_sections) = _document_struct.unpack_from(data, pos)
+    index.version = (major, minor)
+    pos = pos + _document_struct.size
+    for i in range(0, num_sections):
+        (xref_type, trailer_offset, xref_size) = _section_struct.unpack_from(data, pos)
+        pos = pos + _section_struct.size
+        xref_table = XrefTable()
+        xref_table.offsets.frombytes(data[pos:pos + 8 * xref_size])
+        pos = pos + 8 * xref_size
+        xref_table.generations.frombytes(data[pos:pos + 2 * xref_size])
+        pos = pos + 2 * xref_size
+        xref_table.types = bytearray(data[pos:pos + xref_size])
+        pos = pos + xref_size
+        if len(xref_table.types) != xref_size:
+            raise ValueError('truncated index')
+        index.sections.append((XREF_TYPE_TABLE if xref_type == 0 else XREF_TYPE_STREAM,
+                               trailer_offset,
+                               xref_table))
+    (index.object_ends, pos) = _read_dict_columns(data, pos, 'q')
+    (num_names,) = _count_struct.unpack_from(data, pos)
+    pos = pos + _count_struct.size
+    names = []
+    for i in range(0, num_names):
+        (name_len,) = _name_struct.unpack_from(data, pos)
+        pos = pos + _name_struct.size
+        names.append(data[pos:pos + name_len])
+        pos = pos + name_len
+    (object_types, pos) = _read_dict_columns(data, pos, 'H')
+    index.object_types = {k: names[v] for (k, v) in object_types.items()}
+    (page_obj_nums, pos) = _read_array(data, pos, 'q')
+    (page_obj_gens, pos) = _read_array(data, pos, 'H')
+    index.page_refs = list(zip(page_obj_nums, page_obj_gens))
+    return (index, pos)
+
+# writes chunks (a list of bytes) to a temporary file next to path
+# then renames it to path, so a reader never sees a partial file
+def write_atomically(path:str, chunks:list):
+    (fd, tmp_path) = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)),
+                                      prefix='.pdfls-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for chunk in chunks:
+                f.write(chunk)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+# writes index of the file at path atomically
+# it is written to a temporary file first, then renamed
+def write_index(path:str, index:DocumentIndex):
+    (size, mtime_ns, digest) = get_file_key(path)
+    out = []
+    out.append(_header_struct.pack(INDEX_MAGIC,
+                                   INDEX_FORMAT_VERSION,
+                                   _BYTEORDER,
+                                   size,
+                                   mtime_ns,
+                                   digest))
+    encode_index(out, index)
+    index_path = get_index_path(path)
+    write_atomically(index_path, out)
+    logger.info('index written to %s' % index_path)
+
+# returns DocumentIndex of the file at path
+# or None if there is no index or it is not valid for the file anymore
+def read_index(path:str):
+    index_path = get_index_path(path)
+    try:
+        with open(index_path, 'rb') as f:
+            data = f.read()
+    except OSError:
+        return None
+    try:
+        (magic, format_version, byteorder, size, mtime_ns, digest) = _header_struct.unpack_from(data, 0)
+        if (magic != INDEX_MAGIC or
+            format_version != INDEX_FORMAT_VERSION or
+            byteorder != _BYTEORDER):
+            logger.info('index %s is not compatible' % index_path)
+            return None
+        if (size, mtime_ns, digest) != get_file_key(path):
+            logger.info('index %s is stale' % index_path)
+            return None
+        (index, pos) = decode_index(data, _header_struct.size)
+        return index
+    except (struct.error, IndexError, ValueError):
+        logger.warning('index %s is corrupted' % index_path)
+        return None
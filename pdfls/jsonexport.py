@@ -0,0 +1,167 @@
+# Copyright (C) 2024 Mete Balci
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+# pdfls: a utility to investigate PDF files
+# Copyright (C) 2024 Mete Balci
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+import base64
+import hashlib
+import json
+import logging
+
+from .xref import *
+from .objects import *
+from .exceptions import *
+
+logger = logging.getLogger(__name__)
+
+# stream data is written as
+# 'hash': its (encoded) length and SHA-256
+# 'base64': its (encoded) data in base64
+# 'none': its (encoded) length only
+STREAM_DATA_HASH = 'hash'
+STREAM_DATA_BASE64 = 'base64'
+STREAM_DATA_NONE = 'none'
+STREAM_DATA_MODES = (STREAM_DATA_HASH, STREAM_DATA_BASE64, STREAM_DATA_NONE)
+
+# sections of the JSON document, in order, with their record kind
+# header is an object, the others are arrays of records
+JSON_SECTIONS = (('header', 'header'),
+                 ('trailer', 'trailers'),
+                 ('xref', 'xref'),
+                 ('object', 'objects'),
+                 ('page', 'pages'))
+
+_ENTRY_TYPE_NAMES = {ENTRY_FREE: 'free',
+                     ENTRY_IN_USE: 'in-use',
+                     ENTRY_COMPRESSED: 'compressed'}
+
+# returns the JSON value (made of dict, list, str etc.) of a PdfObject
+# names are '/Name', dictionary keys are without /
+# strings are {'string': str} if they are UTF-8 (or UTF-16 with BOM), otherwise {'hex': str}
+# references are {'ref': [obj_num, gen]}
+def to_json(obj, stream_data:str=STREAM_DATA_HASH):
+    if isinstance(obj, PdfIndirectReference):
+        return {'ref': [obj.object_number, obj.generation_number]}
+    elif isinstance(obj, PdfName):
+        return '/' + obj.p.decode('latin-1')
+    elif isinstance(obj, PdfString):
+        try:
+            if obj.p.startswith(b'\xfe\xff'):
+                return {'string': obj.p[2:].decode('utf-16-be')}
+            return {'string': obj.p.decode('utf-8')}
+        except UnicodeError:
+            return {'hex': obj.p.hex()}
+    elif isinstance(obj, PdfNull):
+        return None
+    elif isinstance(obj, (PdfBoolean, PdfNumber)):
+        return obj.p
+    elif isinstance(obj, PdfArray):
+        return [to_json(v, stream_data) for v in obj.p]
+    elif isinstance(obj, PdfDictionary):
+        return {k.p.decode('latin-1'): to_json(v, stream_data) for (k, v) in obj.p.items()}
+    elif isinstance(obj, PdfStream):
+        # stream data is not decoded
+        data = obj.stream_data
+        stream = {'length': len(data)}
+        if stream_data == STREAM_DATA_HASH:
+            stream['sha256'] = hashlib.sha256(data).hexdigest()
+        elif stream_data == STREAM_DATA_BASE64:
+            stream['data'] = base64.b64encode(data).decode('ascii')
+        return {'dictionary': to_json(obj.stream_dictionary, stream_data),
+                'stream': stream}
+    else:
+        raise NotSupportedException('%s cannot be exported to JSON' % type(obj))
+
+# yields (kind, record) of document in the order of JSON_SECTIONS
+# records are created one by one, objects are parsed but not kept in document
+def iter_records(document, stream_data:str=STREAM_DATA_HASH):
+    yield ('header', {'version': '%d.%d' % document.version})
+    for (i, (xref_type, xref_table, trailer)) in enumerate(document.prevs):
+        yield ('trailer', {'revision': len(document.prevs) - 1 - i,
+                           'xref_type': xref_type,
+                           'offset': document.trailer_offsets[i],
+                           'value': to_json(trailer, stream_data)})
+    xref = document.xref
+    for obj_num in range(0, xref.size()):
+        entry = xref.get_entry(obj_num, None)
+        if entry is None:
+            continue
+        (entry_type, offset, generation) = entry
+        record = {'object': obj_num, 'type': _ENTRY_TYPE_NAMES[entry_type]}
+        if entry_type == ENTRY_COMPRESSED:
+            record['object_stream'] = offset
+            record['index'] = generation
+        else:
+            record['generation'] = generation
+            record['offset'] = offset
+        yield ('xref', record)
+    # objects are not kept in document.objects (see Document.parse_object)
+    # only their end offsets and Types are recorded, so the page tree is walked
+    # below without parsing the leaf pages again
+    for obj_num in range(0, xref.size()):
+        entry = xref.get_entry(obj_num, None)
+        if entry is None or entry[0] not in (ENTRY_IN_USE, ENTRY_COMPRESSED):
+            continue
+        generation = entry[2] if entry[0] == ENTRY_IN_USE else 0
+        ref = PdfIndirectReference(obj_num, generation)
+        obj = document.parse_object(ref)
+        yield ('object', {'object': obj_num,
+                          'generation': generation,
+                          'value': to_json(obj.p, stream_data)})
+    for (i, ref) in enumerate(document.iter_page_refs()):
+        yield ('page', {'index': i, 'ref': [ref.object_number, ref.generation_number]})
+
+# writes document to out (a text file) as JSON as it is walked
+# if lines=True, it is JSON Lines, a record on each line with its kind
+# otherwise it is a JSON object with all JSON_SECTIONS, even if they are empty
+def write_json(document, out, lines:bool=False, stream_data:str=STREAM_DATA_HASH):
+    if stream_data not in STREAM_DATA_MODES:
+        raise ValueError('stream data should be one of %s' % str(STREAM_DATA_MODES))
+    records = iter_records(document, stream_data)
+    if lines:
+        for (kind, record) in records:
+            record = dict(kind=kind, **record)
+            out.write(json.dumps(record))
+            out.write('\n')
+        return
+    (kind, record) = next(records)
+    assert kind == 'header'
+    out.write('{"header": ')
+    out.write(json.dumps(record))
+    # index in JSON_SECTIONS of the section being written
+    section = 0
+    for (kind, record) in records:
+        if kind == JSON_SECTIONS[section][0]:
+            out.write(',\n')
+        else:
+            while kind != JSON_SECTIONS[section][0]:
+                section = _next_section(out, section)
+            out.write('\n')
+        out.write(json.dumps(record))
+    while section < len(JSON_SECTIONS) - 1:
+        section = _next_section(out, section)
+    out.write('\n]}\n')
+
+# ends the array of section (if it is not header) and starts the next one
+# returns the index of the next section
+def _next_section(out, section:int):
+    if section > 0:
+        out.write('\n]')
+    section = section + 1
+    out.write(',\n"%s": [' % JSON_SECTIONS[section][1])
+    return section
@@ -0,0 +1,103 @@
+# Copyright (C) 2024 Mete Balci
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+# pdfls: a utility to investigate PDF files
+# Copyright (C) 2024 Mete Balci
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+import collections
+import concurrent.futures
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# least recently used values up to max_size in total
+# the size of a value is given by _get_size (value.size() by default)
+# it is thread-safe, different keys are loaded concurrently
+# and a key is loaded once (single-flight), other threads wait for its load
+# e.g. DecodeCache and ObjectStreamCache
+class LRUCache:
+
+    def __init__(self, max_size:int):
+        self.max_size = max_size
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # key -> (value, size)
+        self._values = collections.OrderedDict()
+        # key -> Future of the keys being loaded
+        self._loading = {}
+        self._lock = threading.Lock()
+
+    # memory used by a cached value, used for cache budget
+    def _get_size(self, value):
+        return value.size()
+
+    # called with the lock when key is not in the cache and it is not being loaded
+    def _count_miss(self, key):
+        self.misses = self.misses + 1
+
+    # load is called with no arguments when key is not in the cache
+    # it is called without the lock, if it raises, the key is not cached
+    def get(self, key, load):
+        with self._lock:
+            entry = self._values.get(key, None)
+            if entry is not None:
+                self.hits = self.hits + 1
+                self._values.move_to_end(key)
+                return entry[0]
+            future = self._loading.get(key, None)
+            if future is None:
+                self._count_miss(key)
+                future = concurrent.futures.Future()
+                self._loading[key] = future
+                loading = True
+            else:
+                # it is loaded by another thread
+                self.hits = self.hits + 1
+                loading = False
+        if not loading:
+            return future.result()
+        logger.debug('loading %s' % str(key))
+        try:
+            value = load()
+        except BaseException as e:
+            with self._lock:
+                del self._loading[key]
+            future.set_exception(e)
+            raise
+        size = self._get_size(value)
+        with self._lock:
+            del self._loading[key]
+            self._values[key] = (value, size)
+            self.size = self.size + size
+            # the one just loaded is kept even if it is larger than max_size
+            while self.size > self.max_size and len(self._values) > 1:
+                (evicted_key, (evicted, evicted_size)) = self._values.popitem(last=False)
+                logger.debug('evicting %s' % str(evicted_key))
+                self.size = self.size - evicted_size
+                self.evictions = self.evictions + 1
+        future.set_result(value)
+        return value
+
+    def __len__(self):
+        return len(self._values)
+
+    def get_hit_rate(self):
+        if self.hits + self.misses == 0:
+            return 0.0
+        return self.hits / (self.hits + self.misses)
@@ -0,0 +1,221 @@
+# Copyright (C) 2024 Mete Balci
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+# pdfls: a utility to investigate PDF files
+# Copyright (C) 2024 Mete Balci
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+import collections
+import os
+import tracemalloc
+
+# number of allocation sites reported for each phase and for the run
+MEMPROFILE_TOP_SITES = 10
+
+# only the allocations in pdfls modules (except this) are reported as sites
+_PDFLS_DIR = os.path.dirname(os.path.abspath(__file__))
+_MEMPROFILE_FILE = os.path.abspath(__file__)
+
+# returns Counter (filename, lineno) -> bytes of the traced memory
+# allocated (and not freed yet) in pdfls modules
+# traces are grouped first, Snapshot.filter_traces is much slower
+# since it matches the filename of each trace
+def _get_sites():
+    sites = collections.Counter()
+    for stat in tracemalloc.take_snapshot().statistics('lineno'):
+        frame = stat.traceback[0]
+        filename = os.path.abspath(frame.filename)
+        if os.path.dirname(filename) == _PDFLS_DIR and filename != _MEMPROFILE_FILE:
+            sites[(filename, frame.lineno)] = stat.size
+    return sites
+
+# e.g. pdfls/parser.py:123
+def _format_site(site:tuple):
+    (filename, lineno) = site
+    return '%s:%d' % (os.path.relpath(filename, os.path.dirname(_PDFLS_DIR)), lineno)
+
+def _top_sites(sites:collections.Counter):
+    return [(_format_site(site), size)
+            for (site, size) in sites.most_common(MEMPROFILE_TOP_SITES)
+            if size > 0]
+
+# calls, peak and retained memory and bytes of a phase e.g. 'objects'
+class MemoryPhaseStats:
+    __slots__ = ('calls', 'peak', 'retained', 'bytes', 'sites')
+
+    def __init__(self):
+        self.calls = 0
+        # the largest increase of traced memory in a call
+        self.peak = 0
+        # the sum of traced memory left at the end of calls
+        # it is negative if a phase frees more than it allocates
+        self.retained = 0
+        self.bytes = 0
+        # Counter (filename, lineno) -> bytes retained in pdfls modules
+        # only the phases that are not nested in another phase have sites
+        self.sites = collections.Counter()
+
+    def to_dict(self):
+        return {'calls': self.calls,
+                'peak': self.peak,
+                'retained': self.retained,
+                'bytes': self.bytes,
+                'top_sites': [{'site': site, 'size': size}
+                              for (site, size) in _top_sites(self.sites)]}
+
+# a measured phase, see MemoryProfiler.phase
+# it can be entered more than once (see MemoryProfiler.iter_phase)
+class MemoryPhase:
+    __slots__ = ('profiler', 'name', 'nbytes', 'start', 'peak', 'retained', 'start_sites', 'sites')
+
+    def __init__(self, profiler, name:str, nbytes:int):
+        self.profiler = profiler
+        self.name = name
+        self.nbytes = nbytes
+        self.start = 0
+        self.peak = 0
+        self.retained = 0
+        self.start_sites = None
+        self.sites = collections.Counter()
+
+    def add_bytes(self, nbytes:int):
+        self.nbytes = self.nbytes + nbytes
+
+    def __enter__(self):
+        self.profiler._enter(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.profiler._exit(self)
+        self.profiler._record(self)
+        return False
+
+# collects the memory allocated in the phases (see phases.py) with tracemalloc
+# peak of a phase includes its nested phases (e.g. stream decode in summary)
+# memory not allocated by Python (e.g. the mmap of the file) is not traced
+# phases should be measured on a single thread
+class MemoryProfiler:
+
+    # tracemalloc is started if it is not tracing, see close
+    def __init__(self):
+        # name -> MemoryPhaseStats, in the order phases are first seen
+        self.phases = {}
+        self._stack = []
+        self._started = not tracemalloc.is_tracing()
+        if self._started:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        self.start_memory = tracemalloc.get_traced_memory()[0]
+        self.peak = self.start_memory
+        # Counter of sites at the end of the run, see close
+        self.sites = None
+
+    def phase(self, name:str, nbytes:int):
+        return MemoryPhase(self, name, nbytes)
+
+    def iter_phase(self, name:str, iterator, nbytes:int):
+        phase = MemoryPhase(self, name, nbytes)
+        entered = False
+        try:
+            while True:
+                self._enter(phase)
+                entered = True
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    self._exit(phase)
+                yield item
+        finally:
+            if entered:
+                self._record(phase)
+
+    # the peak so far is also the peak of the phases in the stack
+    def _fold_peak(self, peak:int):
+        for phase in self._stack:
+            phase.peak = max(phase.peak, peak - phase.start)
+        self.peak = max(self.peak, peak)
+
+    # the snapshots of sites are taken before the peak is reset
+    # so their memory is not in the peak of a phase
+    def _enter(self, phase:MemoryPhase):
+        self._fold_peak(tracemalloc.get_traced_memory()[1])
+        if len(self._stack) == 0:
+            phase.start_sites = _get_sites()
+        tracemalloc.reset_peak()
+        phase.start = tracemalloc.get_traced_memory()[0]
+        self._stack.append(phase)
+
+    def _exit(self, phase:MemoryPhase):
+        (current, peak) = tracemalloc.get_traced_memory()
+        assert self._stack[-1] is phase, 'phases are not nested'
+        self._stack.pop()
+        phase.peak = max(phase.peak, peak - phase.start)
+        phase.retained = phase.retained + current - phase.start
+        self._fold_peak(peak)
+        if phase.start_sites is not None:
+            sites = _get_sites()
+            sites.subtract(phase.start_sites)
+            phase.sites.update(sites)
+            phase.start_sites = None
+            tracemalloc.reset_peak()
+
+    def _record(self, phase:MemoryPhase):
+        stats = self.phases.get(phase.name, None)
+        if stats is None:
+            stats = MemoryPhaseStats()
+            self.phases[phase.name] = stats
+        stats.calls = stats.calls + 1
+        stats.peak = max(stats.peak, phase.peak)
+        stats.retained = stats.retained + phase.retained
+        stats.bytes = stats.bytes + phase.nbytes
+        stats.sites.update(phase.sites)
+
+    # takes the sites at the end of the run, and stops tracemalloc if it is started here
+    def close(self):
+        self._fold_peak(tracemalloc.get_traced_memory()[1])
+        self.sites = _get_sites()
+        if self._started:
+            tracemalloc.stop()
+
+    # returns a dict, it can be dumped as JSON, sizes are in bytes
+    def to_dict(self):
+        return {'start': self.start_memory,
+                'peak': self.peak,
+                'phases': {name: stats.to_dict() for (name, stats) in self.phases.items()},
+                'top_sites': [{'site': site, 'size': size}
+                              for (site, size) in _top_sites(self.sites or collections.Counter())]}
+
+    def print_report(self, out):
+        print('%-20s %8s %12s %14s %14s' % ('phase', 'calls', 'peak KB', 'retained KB', 'bytes'), file=out)
+        for (name, stats) in self.phases.items():
+            print('%-20s %8d %12.1f %14.1f %14d' % (name,
+                                                   stats.calls,
+                                                   stats.peak / 1024,
+                                                   stats.retained / 1024,
+                                                   stats.bytes), file=out)
+        print('peak: %.1f KB, at start: %.1f KB' % (self.peak / 1024, self.start_memory / 1024), file=out)
+        print('top sites (at the end):', file=out)
+        for (site, size) in _top_sites(self.sites or collections.Counter()):
+            print('  %-40s %12.1f KB' % (site, size / 1024), file=out)
+        for (name, stats) in self.phases.items():
+            top_sites = _top_sites(stats.sites)
+            if len(top_sites) == 0:
+                continue
+            print('top sites retained in %s:' % name, file=out)
+            for (site, size) in top_sites:
+                print('  %-40s %12.1f KB' % (site, size / 1024), file=out)
@@ -19,18 +19,27 @@
 # along with this program. If not, see <https://www.gnu.org/licenses/>.
 
 import base64
+import time
 import zlib
 
 from pdfminer import ccitt
 from pdfminer import lzw
 
+from .predictors import decode_predictor
+from . import phases
+
+# decode_chunks yields decoded stream data in chunks of about this size
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# all objects use __slots__, a large document has millions of them
 class PdfObject:
-    pass
+    __slots__ = ()
 
 # in all PdfDirectObject subclasses
 # self.p holds the Python representation of PdfDirectObject
-# self.p can be: bool, int, float, bytes, list, dict, None
+# self.p can be: bool, int, float, bytes, tuple, list, dict, None
 class PdfDirectObject(PdfObject):
+    __slots__ = ()
 
     def __eq__(self, other):
         if other is None:
@@ -40,28 +49,52 @@ class PdfDirectObject(PdfObject):
     def __hash__(self):
         return hash(self.p)
 
+# base of the objects that cannot be changed after they are created
+# (all but PdfArray, PdfDictionary and PdfStream)
+# their hash is computed once, since they are used as dict keys
+# subclasses keep their value in slots set with _set_* in __init__
+class PdfScalar(PdfDirectObject):
+    __slots__ = ('_hash',)
+
+    def __hash__(self):
+        return self._hash
+
+    def __setattr__(self, name, value):
+        raise AttributeError('%s is immutable' % type(self).__name__)
+
+    def __delattr__(self, name):
+        raise AttributeError('%s is immutable' % type(self).__name__)
+
+    # default pickling of slots uses setattr
+    def __reduce__(self):
+        return (type(self), (self.p,))
+
 # PDF: true or false
 # Python: bool
-class PdfBoolean(PdfDirectObject):
+class PdfBoolean(PdfScalar):
+    __slots__ = ('p',)
 
     def __init__(self, value):
         assert isinstance(value, bool), value
-        self.p = value
+        _set_boolean(self, value)
+        _set_hash(self, hash(value))
 
     def __str__(self):
         return 'True' if self.p else 'False'
 
 # Integer or Real
-class PdfNumber(PdfDirectObject):
-    pass
+class PdfNumber(PdfScalar):
+    __slots__ = ('p',)
 
 # PDF: 123
 # Python: int
 class PdfIntegerNumber(PdfNumber):
+    __slots__ = ()
 
     def __init__(self, value):
         assert isinstance(value, int), value
-        self.p = value
+        _set_number(self, value)
+        _set_hash(self, hash(value))
 
     def __str__(self):
         return '%d' % self.p
@@ -69,25 +102,29 @@ class PdfIntegerNumber(PdfNumber):
 # PDF: 34.5
 # Python: float
 class PdfRealNumber(PdfNumber):
+    __slots__ = ()
 
     def __init__(self, value):
         assert isinstance(value, float), value
-        self.p = value
+        _set_number(self, value)
+        _set_hash(self, hash(value))
 
     def __str__(self):
         return '%g' % self.p
 
 # Literal or Hexadecimal
-class PdfString(PdfDirectObject):
-    pass
+class PdfString(PdfScalar):
+    __slots__ = ('p',)
 
 # PDF: (This is a string)
 # Python: bytes
 class PdfLiteralString(PdfString):
+    __slots__ = ()
 
     def __init__(self, value):
         assert isinstance(value, bytes), value
-        self.p = value
+        _set_string(self, value)
+        _set_hash(self, hash(value))
 
     def __str__(self):
         try:
@@ -107,10 +144,12 @@ class PdfLiteralString(PdfString):
 # PDF: <4E6F762073686D6F7A206B6120706F702E>
 # Python: bytes
 class PdfHexadecimalString(PdfString):
+    __slots__ = ()
 
     def __init__(self, value):
         assert isinstance(value, bytes), value
-        self.p = value
+        _set_string(self, value)
+        _set_hash(self, hash(value))
 
     def __str__(self):
         if len(self.p) <= 16:
@@ -123,13 +162,15 @@ class PdfHexadecimalString(PdfString):
 
 # PDF: /Name1
 # Python: bytes (without / symbol)
-class PdfName(PdfDirectObject):
+class PdfName(PdfScalar):
+    __slots__ = ('p',)
 
     def __init__(self, value):
         if isinstance(value, str):
             value = value.encode('ascii')
         assert isinstance(value, bytes), value
-        self.p = value
+        _set_name(self, value)
+        _set_hash(self, hash(value))
 
     # because this is used as key of PdfDictionary
     # eq and hash are explicitly implemented
@@ -138,7 +179,7 @@ class PdfName(PdfDirectObject):
         return self.p == other.p
 
     def __hash__(self):
-        return self.p.__hash__()
+        return self._hash
 
     def __str__(self):
         s = '/'
@@ -156,10 +197,17 @@ class PdfName(PdfDirectObject):
 
 # PDF: [549 3.14 false (Ralph) /SomeName]
 # Python: array of PdfDirectObject entries
+# the list given is owned by the array afterwards
+# a frozen array (see HashConsTable) is shared, so it cannot be changed
 class PdfArray(PdfDirectObject):
+    __slots__ = ('p', 'frozen')
 
-    def __init__(self, p=[]):
-        self.p = p
+    def __init__(self, p=None):
+        self.p = p if p is not None else []
+        self.frozen = False
+
+    def freeze(self):
+        self.frozen = True
 
     def __str__(self):
         s = ''
@@ -175,15 +223,23 @@ class PdfArray(PdfDirectObject):
         return self.p[idx]
 
     def append(self, value):
+        assert not self.frozen, 'array is frozen'
         assert isinstance(value, PdfDirectObject), 'value is not PdfObject'
         self.p.append(value)
 
 # PDF: <</Key Value>>
 # Python: dict of (PdfName, PdfDirectObject) entries
+# the dict given is owned by the dictionary afterwards
+# a frozen dictionary (see HashConsTable) is shared, so it cannot be changed
 class PdfDictionary(PdfDirectObject):
+    __slots__ = ('p', 'frozen')
+
+    def __init__(self, p=None):
+        self.p = p if p is not None else {}
+        self.frozen = False
 
-    def __init__(self, p={}):
-        self.p = p
+    def freeze(self):
+        self.frozen = True
 
     def __str__(self):
         s = ''
@@ -200,6 +256,7 @@ class PdfDictionary(PdfDirectObject):
         return self.p.get(key)
 
     def __setitem__(self, key, value):
+        assert not self.frozen, 'dictionary is frozen'
         assert isinstance(key, PdfName), 'key is not PdfName but %s' % type(key)
         assert isinstance(value, PdfDirectObject), 'value is not PdfDirectObject but %s' % type(value)
         self.p[key] = value
@@ -208,6 +265,12 @@ class PdfDictionary(PdfDirectObject):
         assert isinstance(key, PdfName), 'key is not PdfName but %s' % type(key)
         return self.p.get(key, default)
 
+# converts DecodeParms dictionary (or null) to dict of str -> Python value
+def _decode_parms_to_dict(decode_parms):
+    if not isinstance(decode_parms, PdfDictionary):
+        return {}
+    return {k.p.decode('ascii', 'replace'): v.p for (k, v) in decode_parms.p.items()}
+
 # PDF:
 # << dictionary >>
 # stream
@@ -215,38 +278,122 @@ class PdfDictionary(PdfDirectObject):
 # endstream
 # Python: bytes
 class PdfStream(PdfDirectObject):
-
-    def __init__(self, stream_dictionary, stream_data):
-        self.p = self._decode_stream(stream_dictionary, stream_data)
+    __slots__ = ('stream_dictionary', 'stream_data', 'stream_offset', 'stats', '_decoded_stream_data')
+
+    # stream_data is kept encoded and it is decoded on first access to p
+    # so parsing an object does not pay for decoding
+    # and a parsed (e.g. pickled) stream object stays as small as the file
+    # stream_offset is the offset of stream_data in the file, if known
+    # stats (Stats) is where decoding on access to p is counted, e.g. of its parser
+    def __init__(self, stream_dictionary, stream_data, stream_offset:int=None, stats=None):
         self.stream_dictionary = stream_dictionary
+        self.stream_data = stream_data
+        self.stream_offset = stream_offset
+        self.stats = stats
+        self._decoded_stream_data = None
+
+    @property
+    def p(self):
+        if self._decoded_stream_data is None:
+            self._decoded_stream_data = self.decode(self.stats)
+        return self._decoded_stream_data
+
+    # returns decoded stream data without keeping it in this object
+    # if stats (Stats) is given, the stream and its filters are counted in it
+    def decode(self, stats=None):
+        if self._decoded_stream_data is not None:
+            return self._decoded_stream_data
+        with phases.phase('stream decode', len(self.stream_data)):
+            data = self._decode_stream(self.stream_dictionary, self.stream_data, stats)
+        if stats is not None:
+            stats.add_stream(len(self.stream_data), len(data))
+        return data
+
+    # yields decoded stream data in chunks (of at most chunk_size)
+    # a FlateDecode stream without a predictor is decompressed incrementally
+    # so it is never in memory as a whole, other streams are decoded first
+    # stats is as in decode, it is counted when the chunks are done
+    # also if they are not consumed to the end (then only the chunks yielded)
+    def decode_chunks(self, chunk_size:int=STREAM_CHUNK_SIZE, stats=None):
+        if self._decoded_stream_data is None and self._is_flate_only():
+            return phases.iter_phase('stream decode',
+                                     self._decompress_chunks(chunk_size, stats),
+                                     len(self.stream_data))
+        return self._split_chunks(chunk_size, stats)
+
+    def _decompress_chunks(self, chunk_size:int, stats):
+        decompressor = zlib.decompressobj()
+        data = self.stream_data
+        decoded_bytes = 0
+        decode_time = 0.0
+        try:
+            for start in range(0, len(data), chunk_size):
+                t = time.perf_counter()
+                chunk = decompressor.decompress(data[start:start+chunk_size], chunk_size)
+                decode_time = decode_time + time.perf_counter() - t
+                while True:
+                    if len(chunk) > 0:
+                        decoded_bytes = decoded_bytes + len(chunk)
+                        yield chunk
+                    if len(decompressor.unconsumed_tail) == 0:
+                        break
+                    t = time.perf_counter()
+                    chunk = decompressor.decompress(decompressor.unconsumed_tail, chunk_size)
+                    decode_time = decode_time + time.perf_counter() - t
+            chunk = decompressor.flush()
+            if len(chunk) > 0:
+                decoded_bytes = decoded_bytes + len(chunk)
+                yield chunk
+        finally:
+            if stats is not None:
+                stats.add_filter('FlateDecode', len(data), decoded_bytes, decode_time)
+                stats.add_stream(len(data), decoded_bytes)
+
+    def _split_chunks(self, chunk_size:int, stats):
+        data = self.decode(stats)
+        for start in range(0, len(data), chunk_size):
+            yield data[start:start+chunk_size]
+
+    def _is_flate_only(self):
+        stream_filter = self.stream_dictionary.get(PdfName('Filter'), None)
+        if isinstance(stream_filter, PdfArray) and len(stream_filter.p) == 1:
+            stream_filter = stream_filter[0]
+        if not (isinstance(stream_filter, PdfName) and stream_filter.p == b'FlateDecode'):
+            return False
+        decode_parms = self.stream_dictionary.get(PdfName('DecodeParms'), None)
+        if isinstance(decode_parms, PdfArray) and len(decode_parms.p) == 1:
+            decode_parms = decode_parms[0]
+        return _decode_parms_to_dict(decode_parms).get('Predictor', 1) == 1
 
     def __str__(self):
-        return 'stream[%d]' % len(self.p)
+        return 'stream[%d]' % len(self.stream_data)
 
-    def _decode_stream(self, stream_dictionary, stream_data):
+    def _decode_stream(self, stream_dictionary, stream_data, stats=None):
         stream_filter = stream_dictionary.get(PdfName('Filter'), None)
         decode_parms = stream_dictionary.get(PdfName('DecodeParms'), None)
         stream_filters = []
+        # dicts of DecodeParms entries, str -> Python value
         decode_params = []
         if stream_filter is not None:
             if isinstance(stream_filter, PdfName):
                 stream_filters.append(stream_filter.p)
-                if decode_parms is None:
-                    decode_params.append({})
-                else:
-                    decode_params.append(decode_parms.p)
+                decode_params.append(_decode_parms_to_dict(decode_parms))
             elif isinstance(stream_filter, PdfArray):
-                for i in range(0, len(stream_filter)):
+                for i in range(0, len(stream_filter.p)):
                     assert isinstance(stream_filter[i], PdfName), 'stream filter array should contain PdfName entries'
                     stream_filters.append(stream_filter[i].p)
-                    if decode_parms is None:
-                        decode_params.append({})
+                    if isinstance(decode_parms, PdfArray):
+                        decode_params.append(_decode_parms_to_dict(decode_parms[i]))
                     else:
-                        decode_params.append(decode_parms[i].p.p)
+                        decode_params.append({})
+            else:
                 assert False, 'stream filter should be PdfName or PdfArray'
         for i in range(0, len(stream_filters)):
             stream_filter = stream_filters[i]
             decode_param = decode_params[i]
+            if stats is not None:
+                encoded_bytes = len(stream_data)
+                t = time.perf_counter()
             # all stream filters defined in ISO 32000-2
             if stream_filter == b'ASCIIHexDecode':
                 # TODO: should append 0 if len(stream_data) is odd
@@ -254,13 +401,11 @@ class PdfStream(PdfDirectObject):
             elif stream_filter == b'ASCII85Decode':
                 stream_data = base64.a85decode(stream_data, adobe=True)
             elif stream_filter == b'LZWDecode':
-                predictor = decode_param.get('Predictor', 1)
-                assert predictor == 1, "FlateDecode.Predictor != 1 but %d" % predictor
                 stream_data = lzw.lzwdecode(stream_data)
+                stream_data = decode_predictor(stream_data, decode_param)
             elif stream_filter == b'FlateDecode':
-                predictor = decode_param.get('Predictor', 1)
-                assert predictor == 1, "FlateDecode.Predictor != 1 but %d" % predictor
                 stream_data = zlib.decompress(stream_data)
+                stream_data = decode_predictor(stream_data, decode_param)
             elif stream_filter == b'RunLengthDecode':
                 assert False, 'stream filter %s not implemented yet' % stream_filter.decode('ascii')
             elif stream_filter == b'CCITTFaxDecode':
@@ -268,8 +413,8 @@ class PdfStream(PdfDirectObject):
                 # default values below are taken from PDF spec
                 params = {"K": decode_param.get('K', 0),
                         "Columns": decode_param.get('Columns', 1728) ,
-                        "EncodedByteAlign": decode_param.get('EncodedByteAlign', 'false') == 'true',
-                        "BlackIs1": decode_param.get('BlackIs1', 'false') == 'true'}
+                        "EncodedByteAlign": decode_param.get('EncodedByteAlign', False),
+                        "BlackIs1": decode_param.get('BlackIs1', False)}
                 stream_data = ccitt.ccittfaxdecode(stream_data, params)
             elif stream_filter == b'JBIG2Decode':
                 assert False, 'stream filter %s not implemented yet' % stream_filter.decode('ascii')
@@ -281,15 +426,28 @@ class PdfStream(PdfDirectObject):
                 assert False, 'stream filter %s not implemented yet' % stream_filter.decode('ascii')
             else:
                 assert False, "unknown stream filter %s" % stream_filter.decode('ascii', 'replace')
+            if stats is not None:
+                stats.add_filter(stream_filter.decode('ascii', 'replace'),
+                                 encoded_bytes,
+                                 len(stream_data),
+                                 time.perf_counter() - t)
         return stream_data
 
 
 # PDF: null
 # Python: None
-class PdfNull(PdfDirectObject):
+class PdfNull(PdfScalar):
+    __slots__ = ()
 
     def __init__(self):
-        self.p = None
+        _set_hash(self, hash(None))
+
+    @property
+    def p(self):
+        return None
+
+    def __reduce__(self):
+        return (PdfNull, ())
 
     def __str__(self):
         return 'null'
@@ -303,6 +461,7 @@ class PdfNull(PdfDirectObject):
 # endobj
 # Python: tuple (object_number, generation_number, PdfDirectObject)
 class PdfIndirectObject(PdfObject):
+    __slots__ = ('object_number', 'generation_number', 'p')
 
     def __init__(self,
                  object_number,
@@ -318,7 +477,7 @@ class PdfIndirectObject(PdfObject):
     def __str__(self):
         return '(%d, %d, %s)' % (self.object_number,
                                  self.generation_number,
-                                 type(self.value))
+                                 type(self.p))
 
     def indirect_reference(self):
         return PdfIndirectReference(self.object_number, self.generation_number)
@@ -327,15 +486,23 @@ class PdfIndirectObject(PdfObject):
 # but it is used as values in Dictionary etc., so it has to be a Pdf Object
 # PDF: 12 0 R
 # Python: tuple (object_number, generation_number)
-class PdfIndirectReference(PdfDirectObject):
+# the numbers are kept in slots, p creates the tuple
+# (a tuple subclass would be formatted as two arguments by '%s' % ref)
+class PdfIndirectReference(PdfScalar):
+    __slots__ = ('object_number', 'generation_number')
 
     def __init__(self,
                  object_number,
                  generation_number):
         assert object_number > 0
         assert generation_number >= 0
-        self.object_number = object_number
-        self.generation_number = generation_number
+        _set_object_number(self, object_number)
+        _set_generation_number(self, generation_number)
+        _set_hash(self, hash((object_number, generation_number)))
+
+    @property
+    def p(self):
+        return (self.object_number, self.generation_number)
 
     def __eq__(self, other):
         assert isinstance(other, PdfIndirectReference), other
@@ -343,8 +510,20 @@ class PdfIndirectReference(PdfDirectObject):
                 self.generation_number == other.generation_number)
 
     def __hash__(self):
-        return hash('%s:%s' % (self.object_number, self.generation_number))
+        return self._hash
+
+    def __reduce__(self):
+        return (PdfIndirectReference, (self.object_number, self.generation_number))
 
     def __str__(self):
         return '(%d, %d)' % (self.object_number,
                              self.generation_number)
+
+# PdfScalar.__setattr__ prevents setting these slots in the usual way
+_set_hash = PdfScalar._hash.__set__
+_set_boolean = PdfBoolean.p.__set__
+_set_number = PdfNumber.p.__set__
+_set_string = PdfString.p.__set__
+_set_name = PdfName.p.__set__
+_set_object_number = PdfIndirectReference.object_number.__set__
+_set_generation_number = PdfIndirectReference.generation_number.__set__
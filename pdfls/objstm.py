@@ -0,0 +1,91 @@
+# Copyright (C) 2024 Mete Balci
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+# pdfls: a utility to investigate PDF files
+# Copyright (C) 2024 Mete Balci
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+from array import array
+import logging
+
+from . import Parser
+from .lrucache import LRUCache
+from .objects import *
+from .exceptions import *
+
+logger = logging.getLogger(__name__)
+
+# decoded object streams are kept up to this many bytes in total
+OBJECT_STREAM_CACHE_SIZE = 16 * 1024 * 1024
+
+# ISO 32000-2 7.5.7: Object streams
+# stream data (decoded) starts with N pairs of integers
+# obj_num_1 offset_1 obj_num_2 offset_2 ...
+# offsets are relative to First
+class ObjectStream:
+
+    # hash_cons and stats are passed to the Parser of the decoded data
+    def __init__(self, obj_num:int, stream:PdfStream, hash_cons=None, stats=None):
+        self.obj_num = obj_num
+        stream_dictionary = stream.stream_dictionary
+        if stream_dictionary.get(PdfName('Type'), None) != PdfName('ObjStm'):
+            raise PdfConformanceException('object stream %d Type is not ObjStm' % obj_num)
+        if PdfName('N') not in stream_dictionary:
+            raise PdfConformanceException('object stream %d does not have N' % obj_num)
+        if PdfName('First') not in stream_dictionary:
+            raise PdfConformanceException('object stream %d does not have First' % obj_num)
+        num_objects = stream_dictionary[PdfName('N')].p
+        self.first = stream_dictionary[PdfName('First')].p
+        # decoded once here, it is not kept in stream (PdfStream.p)
+        self.data = stream.decode(stats)
+        words = self.data[0:self.first].split()
+        if len(words) < 2 * num_objects:
+            raise PdfConformanceException('object stream %d has less than N objects' % obj_num)
+        try:
+            self.obj_nums = array('q', map(int, words[0:2*num_objects:2]))
+            self.offsets = array('q', map(int, words[1:2*num_objects:2]))
+        except ValueError:
+            raise PdfConformanceException('object stream %d has a non-integer in its header' % obj_num)
+        self.parser = Parser(self.data, hash_cons=hash_cons, stats=stats)
+
+    def __len__(self):
+        return len(self.obj_nums)
+
+    # memory used by this object stream, used for cache budget
+    def size(self):
+        return len(self.data) + 16 * len(self.obj_nums)
+
+    # returns PdfIndirectObject of the object at index
+    def get_object(self, index:int):
+        if index >= len(self.obj_nums):
+            raise PdfConformanceException('object stream %d has no index %d' % (self.obj_num, index))
+        (value, end_offset) = self.parser.parse_object_at(self.first + self.offsets[index])
+        # generation number of objects in object streams is always 0
+        return PdfIndirectObject(self.obj_nums[index], 0, value)
+
+# least recently used ObjectStreams up to max_size bytes
+# see LRUCache, an object stream is loaded once even if it is requested by many threads
+class ObjectStreamCache(LRUCache):
+
+    # load is called with the key of the object stream
+    # when it is not in the cache, it should return ObjectStream
+    # it is called without the lock, if it raises, the key is not cached
+    def __init__(self, load, max_size:int=OBJECT_STREAM_CACHE_SIZE):
+        super().__init__(max_size)
+        self.load = load
+
+    def get(self, key):
+        return super().get(key, lambda: self.load(key))
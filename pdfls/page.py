@@ -26,17 +26,35 @@ import sys
 import zlib
 
 from . import Parser
+from .content import ContentStreamLexer
+from .content import CompiledContent
+from . import text
 from .objects import *
+from .exceptions import *
 
 logger = logging.getLogger(__name__)
 
+# ISO 32000-2 7.7.3.4 Inheritance of page attributes
+INHERITABLE_ATTRIBUTES = (PdfName('Resources'),
+                          PdfName('MediaBox'),
+                          PdfName('CropBox'),
+                          PdfName('Rotate'))
+
+# a node of page tree, Pages (intermediate) or Page (leaf)
+# nodes are created by Document (see Document._get_page_node)
 class Page:
-    def __init__(self, document, parent, ref):
+    # if cache=False, the node and the content streams of this page are not kept
+    # in document.objects (see Document.parse_object), e.g. when pages are visited once
+    # node is the dictionary at ref if it is already parsed
+    def __init__(self, document, parent, ref, cache:bool=True, node=None):
         self.document = document
         self.parent = parent
         self.ref = ref
+        self.cache = cache
         logger.info('Page: %s/%s' % (parent.ref if parent is not None else '.', ref))
-        self.node = self.document.get_object(self.ref).value()
+        if node is None:
+            node = self._get_object(self.ref).p
+        self.node = node
         assert PdfName('Type') in self.node, 'page node does not have Type'
         self.node_type = self.node[PdfName('Type')]
         self.parent_ref = self.node.get(PdfName('Parent'), None)
@@ -59,70 +77,142 @@ class Page:
         # resources can be inherited
         # so the nodes value is set to _resources
         # but actual self.resources are accessed with property function
-        # which looks at resources in parents
+        # which looks at inherited_attributes
         self._resources = self.node.get(PdfName('Resources'), None)
-        # this effectively implements non-recursive DFS for loading pagetree
-        # the pages with actual content (type=Page) are leaf pages
-        # document is called back for leaf pages to keep an ordered list
+        # dict PdfName -> PdfDirectObject (references are resolved)
+        # it is resolved once when the node is created, parent is created before
+        # if this node does not specify any, it is the same dict as parent's
+        self.inherited_attributes = self._get_inherited_attributes()
+        # kids are created on first access, see kids property
+        self._kids = None
+        # CompiledContent, created on first access, see compiled_content
+        self._compiled_content = None
+
+    def _get_object(self, ref):
+        if self.cache:
+            return self.document.get_object(ref)
+        return self.document.parse_object(ref)
+
+    # returns the list of content streams (PdfStream) of this page
+    # empty if this is not a leaf page or it has no Contents
+    def get_content_streams(self):
+        streams = []
+        if not self.is_page():
+            return streams
+        content_stream_refs = collections.deque()
+        # Contents can be a stream (ref) or an array of streams (refs)
+        v = self.node.get(PdfName('Contents'), None)
+        if v is None:
+            pass
+        elif isinstance(v, PdfIndirectReference):
+            content_stream_refs.append(v)
+        elif isinstance(v, PdfArray):
+            content_stream_refs.extend(v.p)
+        else:
+            assert False, "page.Contents is neither a reference or an array"
+        while len(content_stream_refs) > 0:
+            ref = content_stream_refs.popleft()
+            stream = self._get_object(ref).p
+            # strange but what content points can be another array
+            # which contains content streams
+            if isinstance(stream, PdfArray):
+                content_stream_refs.extend(stream.p)
+                continue
+            assert isinstance(stream, PdfStream), 'page.Contents is not a stream'
+            streams.append(stream)
+        return streams
+
+    # yields the decoded data of content streams in chunks
+    # streams are separated with an EOL, since a token cannot span streams
+    def iter_content_chunks(self):
+        for (i, stream) in enumerate(self.get_content_streams()):
+            if i > 0:
+                yield b'\n'
+            yield from stream.decode_chunks(stats=self.document.stats)
+
+    # yields (operands, operator) of the content of this page
+    # see ContentStreamLexer
+    def instructions(self):
+        return iter(ContentStreamLexer(self.iter_content_chunks()))
+
+    # text (str) of this page, see text.extract_page_text
+    def extract_text(self):
+        return text.extract_page_text(self)
+
+    # CompiledContent of this page, content is lexed only once
+    @property
+    def compiled_content(self):
+        if self._compiled_content is None:
+            self._compiled_content = CompiledContent.compile(self.instructions())
+        return self._compiled_content
+
+    # list of kid Page nodes, empty if this is not a Pages node
+    @property
+    def kids(self):
+        if self._kids is None:
+            kids = []
+            if self.is_pages():
+                for kid_ref in self.node[PdfName('Kids')]:
+                    logger.debug('page kid: %s' % kid_ref)
+                    kids.append(self.document._get_page_node(self, kid_ref))
+            self._kids = kids
+        return self._kids
+
+    # number of leaf pages under this node
+    def get_count(self):
         if self.is_pages():
-            self.kids = []
-            for kid_ref in self.node[PdfName('Kids')]:
-                logger.debug('page kid: %s' % kid_ref)
-                self.kids.append(Page(self.document, self, kid_ref))
+            return self.node[PdfName('Count')].p
         elif self.is_page():
-            self.document.add_leaf_page(self)
-            self.content = []
-            if PdfName('Contents') in self.node:
-                content_stream_refs = collections.deque()
-                # Contents can be a stream (ref) or an array of streams (refs)
-                v = self.node.get(PdfName('Contents'), None)
-                if v is None:
-                    pass
-                else:
-                    print(type(v))
-                    print(v)
-                    v = v.p()
-                    if isinstance(v, tuple):
-                        content_stream_refs.append(v)
-                    elif isinstance(v, list):
-                        content_stream_refs.extend(v)
-                    else:
-                        assert False, "page.Contents is neither a tuple or a list"
-                merged_content = []
-                while len(content_stream_refs) > 0:
-                    ref = content_stream_refs.popleft()
-                    stream = self.document.get_object(ref)
-                    # strange but what content points can be another list
-                    # which contains content streams
-                    if isinstance(stream, list):
-                        content_stream_refs.extend(stream)
-                        continue
-                    stream_data = stream.get('_stream_data_', None)
-                    if stream_data is not None:
-                        merged_content.append(stream_data)
-                merged_content = b''.join(merged_content)
-                with open('/tmp/content.%d' % self.ref[0], 'wb') as fp:
-                    fp.write(merged_content)
-                contents = []
-                stack = []
-                for i in range(0, len(merged_content)):
-                    ch = merged_content[i:i+1]
-                    if ch == b'\r':
-                        if len(stack) > 0:
-                            contents.append(b''.join(stack))
-                            stack = []
-                    else:
-                        stack.append(ch)
-                self.content = contents
+            return 1
+        else:
+            return 0
+
+    def _get_inherited_attributes(self):
+        if self.parent is not None:
+            attributes = self.parent.inherited_attributes
+        else:
+            attributes = {}
+        copied = False
+        for name in INHERITABLE_ATTRIBUTES:
+            value = self.node.get(name, None)
+            if value is None:
+                continue
+            if isinstance(value, PdfIndirectReference):
+                value = self.document.get_object(value).p
+            if not copied:
+                attributes = dict(attributes)
+                copied = True
+            attributes[name] = value
+        return attributes
+
+    # returns the resource of category (e.g. 'XObject', 'Font') named name
+    # it is usually a PdfIndirectReference, None if there is no such resource
+    def get_resource(self, category:str, name:PdfName):
+        return self.document.get_resource(self.resources, category, name)
 
     @property
     def resources(self):
-        if self._resources is not None:
-            return self._resources
-        elif self.parent is not None:
-            return self.parent.resources
-        else:
-            return None
+        return self.inherited_attributes.get(PdfName('Resources'), None)
+
+    @property
+    def media_box(self):
+        return self.inherited_attributes.get(PdfName('MediaBox'), None)
+
+    # default is MediaBox
+    @property
+    def crop_box(self):
+        crop_box = self.inherited_attributes.get(PdfName('CropBox'), None)
+        if crop_box is None:
+            return self.media_box
+        return crop_box
+
+    # in degrees, default is 0
+    @property
+    def rotate(self):
+        rotate = self.inherited_attributes.get(PdfName('Rotate'), None)
+        if rotate is None:
+            return 0
+        return rotate.p
 
     def is_resources_inherited(self):
         return self._resources == None
@@ -135,3 +225,24 @@ class Page:
 
     def is_template(self):
         return self.node_type == PdfName('Template')
+
+# the leaf pages of a document, in order
+# pages are created only when they are accessed
+# len is Count of the root of page tree
+class PageList:
+
+    def __init__(self, document):
+        self.document = document
+
+    def __len__(self):
+        return self.document.get_num_pages()
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self.document.page(i) for i in range(*idx.indices(len(self)))]
+        if idx < 0:
+            idx = idx + len(self)
+        return self.document.page(idx)
+
+    def __iter__(self):
+        return self.document.iter_pages()
@@ -22,8 +22,10 @@ import logging
 import re
 
 from . import Tokenizer
+from .stats import Stats
 from .tokens import *
 from .objects import *
+from .exceptions import *
 
 logger = logging.getLogger(__name__)
 
@@ -31,6 +33,14 @@ integer_re = re.compile(r"^[\+\-]?[0-9]+$")
 real1_re = re.compile(r"^[\+\-]?[0-9]*\.[0-9]+$")
 real2_re = re.compile(r"^[\+\-]?[0-9]+\.[0-9]*$")
 
+# an array of only indirect references, e.g. Kids, until and including ]
+# ISO 32000-2 7.2.3 whitespace characters are NUL, TAB, LF, FF, CR and SPACE
+_ws = rb'[\x00\t\n\x0c\r ]'
+reference_array_re = re.compile(rb'(?:%s*[0-9]+%s+[0-9]+%s+R)+%s*\]' % (_ws, _ws, _ws, _ws))
+reference_re = re.compile(rb'([0-9]+)%s+([0-9]+)' % _ws)
+# EOL is CR LF, CR or LF
+eol_re = re.compile(rb'\r\n?|\n')
+
 def is_integer(v):
     assert isinstance(v, str)
     return integer_re.match(v) is not None
@@ -39,14 +49,36 @@ def is_real(v):
     assert isinstance(v, str)
     return (real1_re.match(v) is not None) or (real2_re.match(v) is not None)
 
+def _new(cls, *args):
+    return cls(*args)
+
 # parser for PDF data in buffer
 class Parser:
 
-    def __init__(self, buffer):
+    # resolver is called with a PdfIndirectReference
+    # when the Length of a stream is an indirect object
+    # it should return the PdfIndirectObject
+    # if hash_cons (HashConsTable) is given, direct objects are hash-consed
+    # if stats (Stats) is given, objects parsed (and tokens of its tokenizers)
+    # are counted in it, and streams parsed are decoded with it (see PdfStream.stats)
+    def __init__(self, buffer, resolver=None, hash_cons=None, stats:Stats=None):
         self.buffer = buffer
-        self.tokenizer = Tokenizer(self.buffer)
-        self.line_offsets = []
-        self._calculate_line_boundaries()
+        self.resolver = resolver
+        self.hash_cons = hash_cons
+        self.stats = stats
+        # creates a scalar, _make(cls, *args)
+        self._make = hash_cons.get if hash_cons is not None else _new
+        self.tokenizer = Tokenizer(self.buffer, stats=self.stats)
+        # line boundaries are calculated on first use
+        # because it is a full scan of the buffer
+        # and it is not needed when only objects are parsed (e.g. in workers)
+        self.line_offsets = None
+
+    def _get_line_offsets(self):
+        if self.line_offsets is None:
+            self.line_offsets = []
+            self._calculate_line_boundaries()
+        return self.line_offsets
 
     # calculates line boundaries
     # skips the comments (introduced with % until EOL) except the first one
@@ -88,17 +120,19 @@ class Parser:
         logger.info("number of lines: %d" % len(self.line_offsets))
 
     def get_num_lines(self):
-        return len(self.line_offsets)
+        return len(self._get_line_offsets())
 
     def get_line(self, line_number):
-        assert line_number < len(self.line_offsets)
-        (start, end) = self.line_offsets[line_number]
+        line_offsets = self._get_line_offsets()
+        assert line_number < len(line_offsets)
+        (start, end) = line_offsets[line_number]
         return self.buffer[start:end]
 
     def _find_line(self, pos):
         logger.debug('finding line covering byte offset %d' % pos)
-        for idx in range(0, len(self.line_offsets)):
-            (start, end) = self.line_offsets[idx]
+        line_offsets = self._get_line_offsets()
+        for idx in range(0, len(line_offsets)):
+            (start, end) = line_offsets[idx]
             if (start <= pos and
                 pos < end):
                 logger.debug('byte offset %d is in line %d [%d, %d)' % (pos,
@@ -126,6 +160,20 @@ class Parser:
             self.seek(next_start)
         return line
 
+    # reads the line starting at pos, without using the line boundaries
+    # so it is not slower for large buffers
+    # the buffer is scanned only up to the first EOL (CR or LF)
+    # returns (line without EOL, position of the next line)
+    # or (None, pos) if pos is at the end of buffer
+    def read_line_at(self, pos:int):
+        buffer_len = len(self.buffer)
+        if pos >= buffer_len:
+            return (None, pos)
+        m = eol_re.search(self.buffer, pos)
+        if m is None:
+            return (self.buffer[pos:buffer_len], buffer_len)
+        return (self.buffer[pos:m.start()], m.end())
+
     def reset(self):
         self.seek(0)
 
@@ -136,121 +184,184 @@ class Parser:
         self.tokenizer.seek(pos)
 
     def seek_to_line(self, line_number):
-        assert line_number < len(self.line_offsets)
+        assert line_number < len(self._get_line_offsets())
         (start, end) = self.line_offsets[line_number]
         self.seek(start)
 
     def next(self):
-        token = self.tokenizer.next()
+        return self._next(self.tokenizer)
+
+    # parses the object at offset without changing the state of the parser
+    # a new tokenizer (cursor) is used for each call over the shared buffer
+    # so this can be called concurrently from multiple threads
+    # returns (object, end_offset)
+    def parse_object_at(self, offset:int):
+        tokenizer = Tokenizer(self.buffer, stats=self.stats)
+        tokenizer.seek(offset)
+        obj = self._next(tokenizer)
+        if self.stats is not None:
+            self.stats.objects_parsed = self.stats.objects_parsed + 1
+        return (obj, tokenizer.tell())
+
+    # Length of a stream can be an indirect object
+    # if it cannot be resolved, stream data ends before endstream
+    def _get_stream_length(self, stream_dictionary, stream_pos:int):
+        length = stream_dictionary[PdfName('Length')]
+        if isinstance(length, PdfIndirectReference) and self.resolver is not None:
+            try:
+                length = self.resolver(length).p
+            except KeyError:
+                pass
+        if isinstance(length, PdfIntegerNumber):
+            return length.p
+        logger.warning('stream Length is not known, searching for endstream')
+        end = self.buffer.find(b'endstream', stream_pos)
+        if end == -1:
+            raise PdfConformanceException('stream does not end with endstream')
+        # EOL before endstream is not part of the stream data
+        if self.buffer[end-2:end] == b'\r\n':
+            end = end - 2
+        elif self.buffer[end-1:end] in (b'\r', b'\n'):
+            end = end - 1
+        return end - stream_pos
+
+    # all the state of parsing is kept in tokenizer
+    def _next(self, tokenizer:Tokenizer):
+        token = tokenizer.next()
         if isinstance(token, TokenLiteral):
             v = token.as_bytes().decode('ascii', 'replace')
             if v == 'true':
-                return PdfBoolean(True)
+                return self._make(PdfBoolean, True)
             elif v == 'false':
-                return PdfBoolean(False)
+                return self._make(PdfBoolean, False)
             elif v == 'null':
-                return PdfNull()
+                return self._make(PdfNull)
             else:
                 if is_integer(v):
                     logger.debug('v: %s' % v)
-                    rollback_pos = self.tell()
+                    rollback_pos = tokenizer.tell()
                     object_number = int(v)
-                    v2 = self.tokenizer.next()
+                    v2 = tokenizer.next()
                     logger.debug('v2: %s' % v2)
                     if (v2 is not None and
                         isinstance(v2, TokenLiteral) and
                         is_integer(v2.as_bytes().decode('ascii', 'replace'))):
                         generation_number = int(v2.as_ascii())
-                        v3 = self.tokenizer.next()
+                        v3 = tokenizer.next()
                         logger.debug('v3: %s' % v3)
                         if (v3 is not None and
                             isinstance(v3, TokenLiteral)):
                             if (v3.as_bytes() == b'R'):
-                                return PdfIndirectReference(object_number,
-                                                            generation_number)
+                                return self._make(PdfIndirectReference,
+                                                  object_number,
+                                                  generation_number)
                             elif (v3.as_bytes() == b'obj'):
-                                value = self.next()
+                                value = self._next(tokenizer)
+                                value_end_pos = tokenizer.tell()
                                 stream_dictionary = None
                                 stream_data = None
+                                token = tokenizer.next()
                                 if isinstance(value, PdfDictionary):
-                                    token = self.tokenizer.next()
                                     if isinstance(token, TokenLiteral):
                                         if token.as_bytes() == b'stream':
                                             logger.debug('found stream')
                                             stream_dictionary = value
                                             assert PdfName('Length') in stream_dictionary, 'stream dictionary does not have Length'
                                             # read stream data directly
-                                            stream_length = stream_dictionary[PdfName('Length')].p
+                                            stream_length = self._get_stream_length(stream_dictionary,
+                                                                                    tokenizer.tell())
                                             logger.debug('stream_length: %d' % stream_length)
-                                            stream_data = self.buffer[self.tell():self.tell() + stream_length]
+                                            stream_offset = tokenizer.tell()
+                                            stream_data = self.buffer[stream_offset:stream_offset + stream_length]
                                             # advance
-                                            self.seek(self.tell() + stream_length)
-                                            token = self.tokenizer.next()
+                                            tokenizer.seek(tokenizer.tell() + stream_length)
+                                            token = tokenizer.next()
                                             assert isinstance(token, TokenLiteral)
                                             assert token.as_bytes() == b'endstream', 'stream does not end with endstream'
-                                            token = self.tokenizer.next()
+                                            token = tokenizer.next()
                                             assert isinstance(token, TokenLiteral)
                                             assert token.as_bytes() == b'endobj', 'stream does not end with endobj'
                                             return PdfIndirectObject(object_number,
                                                                      generation_number,
                                                                      PdfStream(stream_dictionary,
-                                                                               stream_data))
+                                                                               stream_data,
+                                                                               stream_offset,
+                                                                               self.stats))
+                                # consume endobj, so the position is at the end of object
+                                # if it is missing, the object ends with its value
+                                if not (isinstance(token, TokenLiteral) and
+                                        token.as_bytes() == b'endobj'):
+                                    tokenizer.seek(value_end_pos)
                                 return PdfIndirectObject(object_number,
                                                          generation_number,
                                                          value)
-                    self.seek(rollback_pos)
-                    return PdfIntegerNumber(int(v))
+                    tokenizer.seek(rollback_pos)
+                    return self._make(PdfIntegerNumber, int(v))
                 elif is_real(v):
                     try:
-                        return PdfRealNumber(float(v))
+                        return self._make(PdfRealNumber, float(v))
                     except ValueError:
                         raise PossibleBugException('not a real number? %s' % v)
                 else:
                     assert False, 'not implemented'
         elif isinstance(token, TokenLiteralStringStart):
-            string = self.tokenizer.next()
+            string = tokenizer.next()
             assert isinstance(string, TokenLiteral), string
-            end = self.tokenizer.next()
+            end = tokenizer.next()
             assert isinstance(end, TokenLiteralStringEnd), end
-            return PdfLiteralString(string.as_bytes())
+            return self._make(PdfLiteralString, string.as_bytes())
         elif isinstance(token, TokenHexStringStart):
-            string = self.tokenizer.next()
+            string = tokenizer.next()
             assert isinstance(string, TokenLiteral), string
-            end = self.tokenizer.next()
+            end = tokenizer.next()
             assert isinstance(end, TokenHexStringEnd), end
-            return PdfHexadecimalString(string.as_bytes())
+            return self._make(PdfHexadecimalString, string.as_bytes())
         elif isinstance(token, TokenSolidus):
-            token = self.tokenizer.next()
-            return PdfName(token.as_bytes())
+            token = tokenizer.next()
+            return self._make(PdfName, token.as_bytes())
         elif isinstance(token, TokenArrayStart):
+            # fast path, arrays of references are very common
+            # and they are the large ones (e.g. Kids of a flat page tree)
+            m = reference_array_re.match(self.buffer, tokenizer.tell())
+            if m is not None:
+                array = PdfArray([self._make(PdfIndirectReference, int(object_number), int(generation_number))
+                                  for (object_number, generation_number) in reference_re.findall(m.group())])
+                tokenizer.seek(m.end())
+                if self.hash_cons is not None:
+                    return self.hash_cons.get_container(array)
+                return array
             array = PdfArray()
             while True:
-                rollback_pos = self.tell()
-                token = self.tokenizer.next()
+                rollback_pos = tokenizer.tell()
+                token = tokenizer.next()
                 if isinstance(token, TokenArrayEnd):
+                    if self.hash_cons is not None:
+                        return self.hash_cons.get_container(array)
                     return array
                 else:
                     # rollback because entry or initial part of it is already read
-                    self.seek(rollback_pos)
-                    entry = self.next()
+                    tokenizer.seek(rollback_pos)
+                    entry = self._next(tokenizer)
                     logger.debug('entry: %s' % entry)
                     array.append(entry)
         elif isinstance(token, TokenDictionaryStart):
             dictionary = PdfDictionary()
             while True:
-                rollback_pos = self.tell()
-                token = self.tokenizer.next()
+                rollback_pos = tokenizer.tell()
+                token = tokenizer.next()
                 if isinstance(token, TokenDictionaryEnd):
+                    if self.hash_cons is not None:
+                        return self.hash_cons.get_container(dictionary)
                     return dictionary
                 else:
                     assert isinstance(token, TokenSolidus)
                     # rollback because solidus is already read
-                    self.seek(rollback_pos)
-                    entry_key = self.next()
+                    tokenizer.seek(rollback_pos)
+                    entry_key = self._next(tokenizer)
                     assert isinstance(entry_key, PdfName), entry_key
                     logger.debug('entry_key: %s' % entry_key)
 
-                    entry_value = self.next()
+                    entry_value = self._next(tokenizer)
                     assert isinstance(entry_key, PdfObject), entry_value
 
                     if (isinstance(entry_value, PdfArray) or
@@ -19,23 +19,103 @@
 # along with this program. If not, see <https://www.gnu.org/licenses/>.
 
 import argparse
+import cProfile
+import itertools
+import json
 import logging
 import sys
 import traceback
 
 from . import Document
 from . import Tokenizer
+from .objects import PdfIndirectReference
+from . import jsonexport
+from . import phases
+from .memprofile import MemoryProfiler
 
 logger = logging.getLogger(__name__)
 
-def show_license_header():
-    print('pdfls Copyright (C) 2022-2024 Mete Balci')
-    print('This program comes with ABSOLUTELY NO WARRANTY; for details see GNU GPLv3.')
-    print('This is free software, and you are welcome to redistribute it under certain conditions; for details see GNU GPLv3.')
+# out is stderr when stdout is JSON, stdout if None
+def show_license_header(out=None):
+    if out is None:
+        out = sys.stdout
+    print('pdfls Copyright (C) 2022-2024 Mete Balci', file=out)
+    print('This program comes with ABSOLUTELY NO WARRANTY; for details see GNU GPLv3.', file=out)
+    print('This is free software, and you are welcome to redistribute it under certain conditions; for details see GNU GPLv3.', file=out)
+
+# --pages, e.g. 3 or 10-20 or 1,3,10-20, pages are numbered from 1
+# returns a list of ranges of page indexes (from 0)
+def page_ranges(s:str):
+    ranges = []
+    for part in s.split(','):
+        try:
+            if '-' in part:
+                (first, last) = part.split('-', 1)
+                (first, last) = (int(first), int(last))
+            else:
+                first = last = int(part)
+        except ValueError:
+            raise argparse.ArgumentTypeError('%s is not a page or a page range' % part)
+        if first < 1 or last < first:
+            raise argparse.ArgumentTypeError('%s is not a valid page range' % part)
+        ranges.append(range(first - 1, last))
+    return ranges
+
+# writes the dict d as name: value lines, nested names are joined with .
+def print_stats(d:dict, out, prefix:str=''):
+    for (k, v) in d.items():
+        if isinstance(v, dict):
+            print_stats(v, out, '%s%s.' % (prefix, k))
+        else:
+            print('%s%s: %s' % (prefix, k, v), file=out)
+
+# opens the file and shows what args ask for, returns the Document
+# a page or an object not in the document is reported with parser.error
+def show(args, parser):
+    # when only a part is shown, objects are parsed only when they are needed
+    # JSON is written as objects are parsed, so they are not loaded first
+    json_output = args.json or args.json_lines
+    selection = args.pages is not None or args.object is not None or args.summary_only
+    # nothing is counted unless the counters are shown
+    document = Document.open(args.file,
+                             lazy=selection or json_output,
+                             index_cache=args.index_cache,
+                             stats=args.stats is not None)
+
+    if args.pages is not None:
+        num_pages = document.get_num_pages()
+        for page_range in args.pages:
+            if page_range.stop > num_pages:
+                parser.error('page %d is not in the document, it has %d pages' % (page_range.stop, num_pages))
+    if args.object is not None:
+        for (obj_num, obj_gen) in args.object:
+            if not document.has_object(PdfIndirectReference(obj_num, obj_gen)):
+                parser.error('object %d %d is not in the document' % (obj_num, obj_gen))
+
+    if json_output:
+        with phases.phase('json'):
+            jsonexport.write_json(document,
+                                  sys.stdout,
+                                  lines=args.json_lines,
+                                  stream_data=args.stream_data)
+        return document
+
+    if args.object is not None:
+        with phases.phase('objects shown'):
+            for (obj_num, obj_gen) in args.object:
+                document.print_object(PdfIndirectReference(obj_num, obj_gen))
+
+    if args.object is None or args.pages is not None or args.summary_only:
+        pages = None
+        if args.pages is not None:
+            pages = itertools.chain.from_iterable(args.pages)
+        with phases.phase('summary'):
+            document.print_summary(pages=pages, summary_only=args.summary_only)
+
+    return document
 
 def run():
     try:
-        show_license_header()
         parser = argparse.ArgumentParser(
             prog='pdfls',
             description='shows the structure of a PDF file',
@@ -44,10 +124,47 @@ def run():
                             help='pdf file')
         parser.add_argument('-j', '--json',
                             action='store_true',
-                            help='generate a JSON file representing the structure of the PDF')
+                            help='write the structure of the PDF (trailers, xref, objects and pages) as JSON to stdout')
+        parser.add_argument('--json-lines',
+                            action='store_true',
+                            help='write JSON Lines, a record on each line, instead of a JSON object (implies --json)')
+        parser.add_argument('--stream-data',
+                            choices=jsonexport.STREAM_DATA_MODES,
+                            default=jsonexport.STREAM_DATA_HASH,
+                            help='how stream data is written in JSON, default is its length and SHA-256')
         parser.add_argument('-i', '--instructions',
                             action='store_true',
                             help='show instructions')
+        parser.add_argument('--pages',
+                            type=page_ranges,
+                            help='show only these pages, e.g. 3 or 10-20 or 1,3,10-20')
+        parser.add_argument('--object',
+                            nargs=2,
+                            type=int,
+                            action='append',
+                            metavar=('OBJ_NUM', 'GEN'),
+                            help='show the object OBJ_NUM GEN, it can be given more than once')
+        parser.add_argument('--summary-only',
+                            action='store_true',
+                            help='show the summary of the document without its pages')
+        parser.add_argument('--index-cache',
+                            action='store_true',
+                            help='read (or write) the index of the file next to it, so xref is not parsed again')
+        parser.add_argument('--profile',
+                            action='store_true',
+                            help='show the wall and CPU time, calls and bytes of each phase on stderr')
+        parser.add_argument('--profile-trace',
+                            metavar='PATH',
+                            help='write the phases as Chrome trace JSON to PATH')
+        parser.add_argument('--profile-pstats',
+                            metavar='PATH',
+                            help='profile with cProfile and write the stats (see pstats) to PATH')
+        parser.add_argument('--memprofile',
+                            choices=('text', 'json'),
+                            help='show the peak and retained memory of each phase and the top allocation sites on stderr')
+        parser.add_argument('--stats',
+                            choices=('text', 'json'),
+                            help='show the counters of parsing and decoding (see Document.stats) on stderr')
         parser.add_argument('-v', '--verbose',
                             action='store_true',
                             help='enable verbose/INFO logging (default is WARN)')
@@ -61,6 +178,11 @@ def run():
                             action='store_true',
                             help='enable DEBUG logging in tokenizer')
         args = parser.parse_args()
+        if args.memprofile is not None and (args.profile or args.profile_trace is not None):
+            parser.error('--memprofile cannot be used with --profile or --profile-trace')
+
+        json_output = args.json or args.json_lines
+        show_license_header(sys.stderr if json_output else sys.stdout)
 
         loggingFormat = '%(levelname)s/%(filename)s: %(message)s'
         logging.basicConfig(format=loggingFormat)
@@ -90,8 +212,43 @@ def run():
             logging.getLogger('pdfls.tokenizer').setLevel(logging.DEBUG)
             logging.getLogger('pdfls.tokens').setLevel(logging.DEBUG)
 
-        with open(args.file, 'rb') as f:
-            Document(f.read()).print_summary()
+        profiler = None
+        if args.profile or args.profile_trace is not None:
+            profiler = phases.enable(phases.PhaseProfiler(trace=args.profile_trace is not None))
+        memory_profiler = None
+        if args.memprofile is not None:
+            memory_profiler = phases.enable(MemoryProfiler())
+        cprofile = None
+        if args.profile_pstats is not None:
+            cprofile = cProfile.Profile()
+            cprofile.enable()
+        try:
+            document = show(args, parser)
+        finally:
+            if cprofile is not None:
+                cprofile.disable()
+                cprofile.dump_stats(args.profile_pstats)
+            if profiler is not None:
+                phases.disable()
+                if args.profile:
+                    profiler.print_report(sys.stderr)
+                if args.profile_trace is not None:
+                    with open(args.profile_trace, 'w') as f:
+                        profiler.write_trace(f)
+            if memory_profiler is not None:
+                phases.disable()
+                memory_profiler.close()
+                if args.memprofile == 'json':
+                    json.dump(memory_profiler.to_dict(), sys.stderr)
+                    print(file=sys.stderr)
+                else:
+                    memory_profiler.print_report(sys.stderr)
+
+        if args.stats == 'json':
+            json.dump(document.stats.to_dict(), sys.stderr)
+            print(file=sys.stderr)
+        elif args.stats == 'text':
+            print_stats(document.stats.to_dict(), sys.stderr)
 
         return 0
 
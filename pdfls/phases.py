@@ -0,0 +1,199 @@
+# Copyright (C) 2024 Mete Balci
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+# pdfls: a utility to investigate PDF files
+# Copyright (C) 2024 Mete Balci
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+import json
+import os
+import threading
+import time
+
+# the active profiler, phases are not measured when it is None
+# it is process-wide, see enable and disable
+# a profiler creates the phases, see PhaseProfiler.phase and iter_phase
+# e.g. PhaseProfiler or MemoryProfiler (see memprofile.py)
+_profiler = None
+
+# wall time, CPU time, calls and bytes of a phase e.g. 'xref'
+class PhaseStats:
+    __slots__ = ('calls', 'wall_time', 'cpu_time', 'bytes')
+
+    def __init__(self):
+        self.calls = 0
+        self.wall_time = 0.0
+        self.cpu_time = 0.0
+        self.bytes = 0
+
+# a measured phase, see phase
+# nbytes is the number of bytes processed, it can be added with add_bytes
+class Phase:
+    __slots__ = ('profiler', 'name', 'nbytes', 'wall_start', 'cpu_start')
+
+    def __init__(self, profiler, name:str, nbytes:int):
+        self.profiler = profiler
+        self.name = name
+        self.nbytes = nbytes
+
+    def add_bytes(self, nbytes:int):
+        self.nbytes = self.nbytes + nbytes
+
+    def __enter__(self):
+        self.wall_start = time.perf_counter()
+        self.cpu_start = time.process_time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.profiler.record(self.name,
+                             self.wall_start,
+                             time.perf_counter() - self.wall_start,
+                             time.process_time() - self.cpu_start,
+                             self.nbytes)
+        return False
+
+# phase when there is no active profiler, it measures nothing
+class _NullPhase:
+
+    def add_bytes(self, nbytes:int):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        return False
+
+_NULL_PHASE = _NullPhase()
+
+# collects the phases of loading and showing a document
+# phases can be nested (e.g. stream decode in summary)
+# so the times of phases are not additive
+# if trace=True, each phase is kept as an event, see write_trace
+# it is thread-safe
+class PhaseProfiler:
+
+    def __init__(self, trace:bool=False):
+        # name -> PhaseStats, in the order phases are first seen
+        self.phases = {}
+        self.trace = trace
+        # (name, wall_start, wall_time, nbytes, thread id) if trace=True
+        self.events = []
+        self.wall_start = time.perf_counter()
+        self.cpu_start = time.process_time()
+        self._lock = threading.Lock()
+
+    def record(self, name:str, wall_start:float, wall_time:float, cpu_time:float, nbytes:int):
+        with self._lock:
+            stats = self.phases.get(name, None)
+            if stats is None:
+                stats = PhaseStats()
+                self.phases[name] = stats
+            stats.calls = stats.calls + 1
+            stats.wall_time = stats.wall_time + wall_time
+            stats.cpu_time = stats.cpu_time + cpu_time
+            stats.bytes = stats.bytes + nbytes
+            if self.trace:
+                self.events.append((name, wall_start, wall_time, nbytes, threading.get_ident()))
+
+    def phase(self, name:str, nbytes:int):
+        return Phase(self, name, nbytes)
+
+    def iter_phase(self, name:str, iterator, nbytes:int):
+        first_wall_start = None
+        wall_time = 0.0
+        cpu_time = 0.0
+        try:
+            while True:
+                wall_start = time.perf_counter()
+                cpu_start = time.process_time()
+                if first_wall_start is None:
+                    first_wall_start = wall_start
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    wall_time = wall_time + time.perf_counter() - wall_start
+                    cpu_time = cpu_time + time.process_time() - cpu_start
+                yield item
+        finally:
+            if first_wall_start is not None:
+                self.record(name, first_wall_start, wall_time, cpu_time, nbytes)
+
+    # returns (wall time, CPU time) since this profiler is created
+    def get_total_time(self):
+        return (time.perf_counter() - self.wall_start,
+                time.process_time() - self.cpu_start)
+
+    def print_report(self, out):
+        print('%-20s %8s %12s %12s %14s' % ('phase', 'calls', 'wall ms', 'cpu ms', 'bytes'), file=out)
+        with self._lock:
+            phases = list(self.phases.items())
+        for (name, stats) in phases:
+            print('%-20s %8d %12.2f %12.2f %14d' % (name,
+                                                   stats.calls,
+                                                   stats.wall_time * 1000,
+                                                   stats.cpu_time * 1000,
+                                                   stats.bytes), file=out)
+        (wall_time, cpu_time) = self.get_total_time()
+        print('%-20s %8s %12.2f %12.2f' % ('total', '', wall_time * 1000, cpu_time * 1000), file=out)
+        print('phases can be nested, so their times do not add up to total', file=out)
+
+    # writes the events as Chrome trace JSON (Trace Event Format)
+    # it can be opened with chrome://tracing or Perfetto
+    def write_trace(self, out):
+        pid = os.getpid()
+        with self._lock:
+            events = list(self.events)
+        json.dump({'traceEvents': [{'name': name,
+                                    'cat': 'pdfls',
+                                    'ph': 'X',
+                                    'ts': (wall_start - self.wall_start) * 1000000,
+                                    'dur': wall_time * 1000000,
+                                    'pid': pid,
+                                    'tid': tid,
+                                    'args': {'bytes': nbytes}}
+                                   for (name, wall_start, wall_time, nbytes, tid) in events],
+                   'displayTimeUnit': 'ms'},
+                  out)
+
+# returns a context manager measuring the phase name
+# e.g. with phase('xref') as p: ... p.add_bytes(n)
+# it measures nothing if there is no active profiler
+def phase(name:str, nbytes:int=0):
+    profiler = _profiler
+    if profiler is None:
+        return _NULL_PHASE
+    return profiler.phase(name, nbytes)
+
+# yields the items of iterator, getting the items (not the consumer)
+# is measured and recorded as one call of the phase name
+def iter_phase(name:str, iterator, nbytes:int=0):
+    profiler = _profiler
+    if profiler is None:
+        return iterator
+    return profiler.iter_phase(name, iter(iterator), nbytes)
+
+# makes profiler the active profiler and returns it
+def enable(profiler):
+    global _profiler
+    _profiler = profiler
+    return profiler
+
+def disable():
+    global _profiler
+    _profiler = None
@@ -0,0 +1,124 @@
+# Copyright (C) 2024 Mete Balci
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+# pdfls: a utility to investigate PDF files
+# Copyright (C) 2024 Mete Balci
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+from array import array
+import itertools
+import sys
+
+from .exceptions import *
+
+# ISO 32000-2 7.4.4.4 LZW and Flate predictor functions
+# Predictor 1: no prediction
+# Predictor 2: TIFF Predictor 2
+# Predictor >= 10: PNG predictors, each row starts with its PNG filter type
+PNG_FILTER_NONE = 0
+PNG_FILTER_SUB = 1
+PNG_FILTER_UP = 2
+PNG_FILTER_AVERAGE = 3
+PNG_FILTER_PAETH = 4
+
+# index of the low byte of an int64 in its native byte representation
+_LOW_BYTE = 0 if sys.byteorder == 'little' else 7
+
+def _paeth(a, b, c):
+    p = a + b - c
+    pa = abs(p - a)
+    pb = abs(p - b)
+    pc = abs(p - c)
+    if pa <= pb and pa <= pc:
+        return a
+    elif pb <= pc:
+        return b
+    else:
+        return c
+
+# every row uses Up filter, which is common e.g. for xref streams
+# then each column is the running sum of that column mod 256
+# the sums are accumulated in C and the low bytes are taken with a strided slice
+def _decode_png_up_rows(data:bytes, row_len:int, num_rows:int):
+    out = bytearray(row_len * num_rows)
+    for col in range(0, row_len):
+        sums = array('q', itertools.accumulate(data[col + 1::row_len + 1]))
+        out[col::row_len] = sums.tobytes()[_LOW_BYTE::8]
+    return bytes(out)
+
+def _decode_png_rows(data:bytes, row_len:int, num_rows:int, bpp:int):
+    out = bytearray()
+    prev = bytes(row_len)
+    for i in range(0, num_rows):
+        start = i * (row_len + 1)
+        filter_type = data[start]
+        row = bytearray(data[start + 1:start + 1 + row_len])
+        if filter_type == PNG_FILTER_NONE:
+            pass
+        elif filter_type == PNG_FILTER_SUB:
+            for j in range(bpp, row_len):
+                row[j] = (row[j] + row[j - bpp]) & 0xFF
+        elif filter_type == PNG_FILTER_UP:
+            for j in range(0, row_len):
+                row[j] = (row[j] + prev[j]) & 0xFF
+        elif filter_type == PNG_FILTER_AVERAGE:
+            for j in range(0, row_len):
+                left = row[j - bpp] if j >= bpp else 0
+                row[j] = (row[j] + ((left + prev[j]) >> 1)) & 0xFF
+        elif filter_type == PNG_FILTER_PAETH:
+            for j in range(0, row_len):
+                left = row[j - bpp] if j >= bpp else 0
+                upper_left = prev[j - bpp] if j >= bpp else 0
+                row[j] = (row[j] + _paeth(left, prev[j], upper_left)) & 0xFF
+        else:
+            raise PdfConformanceException('unknown PNG filter type %d' % filter_type)
+        out.extend(row)
+        prev = row
+    return bytes(out)
+
+def _decode_tiff_rows(data:bytes, row_len:int, num_rows:int, bpp:int):
+    out = bytearray(data[0:row_len * num_rows])
+    for i in range(0, num_rows):
+        start = i * row_len
+        for j in range(start + bpp, start + row_len):
+            out[j] = (out[j] + out[j - bpp]) & 0xFF
+    return bytes(out)
+
+# decode_param is a dict of DecodeParms entries (str -> Python value)
+def decode_predictor(data:bytes, decode_param:dict):
+    predictor = decode_param.get('Predictor', 1)
+    if predictor == 1:
+        return data
+    colors = decode_param.get('Colors', 1)
+    bits_per_component = decode_param.get('BitsPerComponent', 8)
+    columns = decode_param.get('Columns', 1)
+    # bytes per pixel, at least 1
+    bpp = max(1, (colors * bits_per_component) // 8)
+    row_len = (colors * bits_per_component * columns + 7) // 8
+    if predictor == 2:
+        if bits_per_component != 8:
+            raise NotSupportedException('TIFF predictor with BitsPerComponent %d not supported' % bits_per_component)
+        return _decode_tiff_rows(data, row_len, len(data) // row_len, bpp)
+    elif predictor >= 10:
+        num_rows = len(data) // (row_len + 1)
+        data = data[0:num_rows * (row_len + 1)]
+        filter_types = data[0::row_len + 1]
+        if filter_types.strip(bytes([PNG_FILTER_UP])) == b'':
+            return _decode_png_up_rows(data, row_len, num_rows)
+        else:
+            return _decode_png_rows(data, row_len, num_rows, bpp)
+    else:
+        raise PdfConformanceException('unknown Predictor %d' % predictor)
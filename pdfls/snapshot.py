@@ -0,0 +1,363 @@
+# Copyright (C) 2024 Mete Balci
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+# pdfls: a utility to investigate PDF files
+# Copyright (C) 2024 Mete Balci
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+from array import array
+import bisect
+import logging
+import mmap
+import os
+import struct
+import sys
+
+from . import indexcache
+from .objects import *
+from .exceptions import *
+
+logger = logging.getLogger(__name__)
+
+# ISO 32000-2 has no such thing, this is pdfls specific
+# a snapshot keeps the parsed objects of a document in a compact binary form
+# so they are not parsed again, the original file is still needed
+# since stream data is not copied, only its offset and length are kept
+# file layout:
+# header (magic, format version, byte order, file key of the PDF file)
+# path of the PDF file
+# objects, each is an encoded PdfDirectObject (see _Encoder)
+# index of the PDF file (see indexcache.encode_index)
+# name table, names are written once, objects refer to their index
+# object table, sorted object numbers, generations and offsets of objects (8-byte aligned)
+# length of objects
+# objects are written first, as they are encoded, so they are never all in memory
+# the tables after them are known only when all objects are encoded
+
+SNAPSHOT_MAGIC = b'PDFLSSNP'
+SNAPSHOT_FORMAT_VERSION = 2
+
+# encoded objects are written in chunks of about this many bytes
+SNAPSHOT_WRITE_CHUNK_SIZE = 1024 * 1024
+
+_BYTEORDER = b'L' if sys.byteorder == 'little' else b'B'
+
+# magic, format version, byte order, file size, file mtime_ns, hash
+_header_struct = struct.Struct('<8sHcQq32s')
+_length_struct = struct.Struct('<Q')
+
+# tags of encoded objects
+TAG_NULL = 0
+TAG_FALSE = 1
+TAG_TRUE = 2
+# zigzag varint
+TAG_INTEGER = 3
+# 8 bytes, double
+TAG_REAL = 4
+# varint index in name table
+TAG_NAME = 5
+# varint length, bytes
+TAG_LITERAL_STRING = 6
+TAG_HEXADECIMAL_STRING = 7
+# varint count, objects
+TAG_ARRAY = 8
+# varint count, (varint name index, object) pairs
+TAG_DICTIONARY = 9
+# varint object number, varint generation number
+TAG_REFERENCE = 10
+# dictionary (without tag), varint offset and varint length of data in PDF file
+TAG_STREAM = 11
+
+_real_struct = struct.Struct('<d')
+
+def _write_varint(out:bytearray, v:int):
+    while v > 0x7F:
+        out.append((v & 0x7F) | 0x80)
+        v = v >> 7
+    out.append(v)
+
+def _read_varint(data, pos:int):
+    v = 0
+    shift = 0
+    while True:
+        b = data[pos]
+        pos = pos + 1
+        v = v | ((b & 0x7F) << shift)
+        if b < 0x80:
+            return (v, pos)
+        shift = shift + 7
+
+# encodes objects of a document, names are collected in a table
+class _Encoder:
+
+    def __init__(self):
+        # list of bytes
+        self.names = []
+        # dict bytes -> index in names
+        self.name_indexes = {}
+
+    def _name_index(self, name:PdfName):
+        idx = self.name_indexes.get(name.p, None)
+        if idx is None:
+            idx = len(self.names)
+            self.name_indexes[name.p] = idx
+            self.names.append(name.p)
+        return idx
+
+    def encode(self, out:bytearray, obj:PdfDirectObject):
+        if isinstance(obj, PdfNull):
+            out.append(TAG_NULL)
+        elif isinstance(obj, PdfBoolean):
+            out.append(TAG_TRUE if obj.p else TAG_FALSE)
+        elif isinstance(obj, PdfIntegerNumber):
+            out.append(TAG_INTEGER)
+            v = obj.p
+            _write_varint(out, (v << 1) if v >= 0 else ((-v << 1) - 1))
+        elif isinstance(obj, PdfRealNumber):
+            out.append(TAG_REAL)
+            out += _real_struct.pack(obj.p)
+        elif isinstance(obj, PdfName):
+            out.append(TAG_NAME)
+            _write_varint(out, self._name_index(obj))
+        elif isinstance(obj, PdfString):
+            out.append(TAG_LITERAL_STRING if isinstance(obj, PdfLiteralString) else TAG_HEXADECIMAL_STRING)
+            _write_varint(out, len(obj.p))
+            out += obj.p
+        elif isinstance(obj, PdfIndirectReference):
+            out.append(TAG_REFERENCE)
+            _write_varint(out, obj.object_number)
+            _write_varint(out, obj.generation_number)
+        elif isinstance(obj, PdfArray):
+            out.append(TAG_ARRAY)
+            _write_varint(out, len(obj.p))
+            for v in obj.p:
+                self.encode(out, v)
+        elif isinstance(obj, PdfDictionary):
+            out.append(TAG_DICTIONARY)
+            self._encode_dictionary(out, obj)
+        elif isinstance(obj, PdfStream):
+            if obj.stream_offset is None:
+                raise NotSupportedException('stream without an offset in file cannot be in a snapshot')
+            out.append(TAG_STREAM)
+            self._encode_dictionary(out, obj.stream_dictionary)
+            _write_varint(out, obj.stream_offset)
+            _write_varint(out, len(obj.stream_data))
+        else:
+            raise NotSupportedException('%s cannot be in a snapshot' % type(obj))
+
+    def _encode_dictionary(self, out:bytearray, obj:PdfDictionary):
+        _write_varint(out, len(obj.p))
+        for (k, v) in obj.p.items():
+            _write_varint(out, self._name_index(k))
+            self.encode(out, v)
+
+# writes the snapshot of the PDF file at pdf_path to path
+# objects is an iterable of PdfIndirectObject, in any order
+# each one is encoded and written before the next one is taken
+# get_index returns the DocumentIndex of the PDF file
+# it is called after all objects are taken, e.g. so their Types are in index
+def write_snapshot(path:str, pdf_path:str, get_index, objects):
+    # (obj_num, obj_gen, offset in objects)
+    entries = []
+    indexcache.write_atomically(path, _iter_chunks(pdf_path, get_index, objects, entries))
+    logger.info('snapshot of %d objects written to %s' % (len(entries), path))
+
+# yields the chunks (bytes-like) of the snapshot file, see write_snapshot
+# entries (of the object table) are appended to entries
+def _iter_chunks(pdf_path:str, get_index, objects, entries:list):
+    encoder = _Encoder()
+    (size, mtime_ns, digest) = indexcache.get_file_key(pdf_path)
+    out = []
+    out.append(_header_struct.pack(SNAPSHOT_MAGIC,
+                                   SNAPSHOT_FORMAT_VERSION,
+                                   _BYTEORDER,
+                                   size,
+                                   mtime_ns,
+                                   digest))
+    encoded_path = os.path.abspath(pdf_path).encode('utf-8')
+    out.append(_length_struct.pack(len(encoded_path)))
+    out.append(encoded_path)
+    pos = sum([len(chunk) for chunk in out])
+    yield from out
+    data = bytearray()
+    data_length = 0
+    for obj in objects:
+        entries.append((obj.object_number, obj.generation_number, data_length + len(data)))
+        encoder.encode(data, obj.p)
+        if len(data) >= SNAPSHOT_WRITE_CHUNK_SIZE:
+            data_length = data_length + len(data)
+            yield data
+            data = bytearray()
+    data_length = data_length + len(data)
+    yield data
+    pos = pos + data_length
+    entries.sort()
+    out = []
+    encoded_index = []
+    indexcache.encode_index(encoded_index, get_index())
+    encoded_index = b''.join(encoded_index)
+    out.append(_length_struct.pack(len(encoded_index)))
+    out.append(encoded_index)
+    names = bytearray()
+    _write_varint(names, len(encoder.names))
+    for name in encoder.names:
+        _write_varint(names, len(name))
+        names += name
+    out.append(_length_struct.pack(len(names)))
+    out.append(names)
+    out.append(_length_struct.pack(len(entries)))
+    # object table is aligned, so it is used without copying (see Snapshot)
+    pos = pos + sum([len(chunk) for chunk in out])
+    out.append(bytes(-pos % 8))
+    out.append(array('q', [obj_num for (obj_num, obj_gen, offset) in entries]).tobytes())
+    out.append(array('q', [offset for (obj_num, obj_gen, offset) in entries]).tobytes())
+    out.append(array('H', [obj_gen for (obj_num, obj_gen, offset) in entries]).tobytes())
+    out.append(_length_struct.pack(data_length))
+    yield from out
+
+# a snapshot file mapped read-only
+# objects are decoded only when they are accessed (get_object)
+class Snapshot:
+
+    # pdf_path is the PDF file of the snapshot, the one in the snapshot if None
+    # raises SnapshotException if the snapshot is not valid or not of the PDF file
+    def __init__(self, path:str, pdf_path:str=None):
+        with open(path, 'rb') as f:
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self._read(path, pdf_path)
+        except (struct.error, IndexError, ValueError, UnicodeError) as e:
+            raise SnapshotException('snapshot %s is corrupted: %s' % (path, e))
+
+    def _read(self, path:str, pdf_path:str):
+        buffer = self.buffer
+        (magic, format_version, byteorder, size, mtime_ns, digest) = _header_struct.unpack_from(buffer, 0)
+        if (magic != SNAPSHOT_MAGIC or
+            format_version != SNAPSHOT_FORMAT_VERSION or
+            byteorder != _BYTEORDER):
+            raise SnapshotException('%s is not a compatible snapshot' % path)
+        pos = _header_struct.size
+        (length,) = _length_struct.unpack_from(buffer, pos)
+        pos = pos + _length_struct.size
+        if pdf_path is None:
+            pdf_path = buffer[pos:pos + length].decode('utf-8')
+        self.pdf_path = pdf_path
+        pos = pos + length
+        if (size, mtime_ns, digest) != indexcache.get_file_key(pdf_path):
+            raise SnapshotException('snapshot %s is stale, %s is changed' % (path, pdf_path))
+        self.data_offset = pos
+        # length of objects is at the end
+        tail_pos = len(buffer) - _length_struct.size
+        (length,) = _length_struct.unpack_from(buffer, tail_pos)
+        pos = pos + length
+        (length,) = _length_struct.unpack_from(buffer, pos)
+        pos = pos + _length_struct.size
+        (self.index, end) = indexcache.decode_index(buffer, pos)
+        pos = pos + length
+        (length,) = _length_struct.unpack_from(buffer, pos)
+        pos = pos + _length_struct.size
+        (num_names, name_pos) = _read_varint(buffer, pos)
+        # names are created once, so they are shared by all objects
+        self.names = []
+        for i in range(0, num_names):
+            (name_len, name_pos) = _read_varint(buffer, name_pos)
+            self.names.append(PdfName(buffer[name_pos:name_pos + name_len]))
+            name_pos = name_pos + name_len
+        pos = pos + length
+        (num_objects,) = _length_struct.unpack_from(buffer, pos)
+        pos = pos + _length_struct.size
+        pos = pos + (-pos % 8)
+        if pos + 18 * num_objects != tail_pos:
+            raise ValueError('truncated snapshot')
+        # views of the mapped file, they are not copied
+        view = memoryview(buffer)
+        self.obj_nums = view[pos:pos + 8 * num_objects].cast('q')
+        pos = pos + 8 * num_objects
+        self.offsets = view[pos:pos + 8 * num_objects].cast('q')
+        pos = pos + 8 * num_objects
+        self.generations = view[pos:pos + 2 * num_objects].cast('H')
+        # set by Document, stream data is sliced from it
+        self.pdf_buffer = None
+        # set by Document, Stats of the streams (see PdfStream.stats)
+        self.stats = None
+
+    def __len__(self):
+        return len(self.obj_nums)
+
+    # returns PdfIndirectObject of ref, or None if it is not in snapshot
+    def get_object(self, ref:PdfIndirectReference):
+        i = bisect.bisect_left(self.obj_nums, ref.object_number)
+        if (i == len(self.obj_nums) or
+            self.obj_nums[i] != ref.object_number or
+            self.generations[i] != ref.generation_number):
+            return None
+        (value, pos) = self._decode(self.data_offset + self.offsets[i])
+        return PdfIndirectObject(ref.object_number, ref.generation_number, value)
+
+    def _decode(self, pos:int):
+        buffer = self.buffer
+        tag = buffer[pos]
+        pos = pos + 1
+        if tag == TAG_NAME:
+            (idx, pos) = _read_varint(buffer, pos)
+            return (self.names[idx], pos)
+        elif tag == TAG_INTEGER:
+            (v, pos) = _read_varint(buffer, pos)
+            return (PdfIntegerNumber((v >> 1) if (v & 1) == 0 else -((v + 1) >> 1)), pos)
+        elif tag == TAG_REFERENCE:
+            (object_number, pos) = _read_varint(buffer, pos)
+            (generation_number, pos) = _read_varint(buffer, pos)
+            return (PdfIndirectReference(object_number, generation_number), pos)
+        elif tag == TAG_DICTIONARY:
+            return self._decode_dictionary(pos)
+        elif tag == TAG_ARRAY:
+            (count, pos) = _read_varint(buffer, pos)
+            values = []
+            for i in range(0, count):
+                (v, pos) = self._decode(pos)
+                values.append(v)
+            return (PdfArray(values), pos)
+        elif tag == TAG_REAL:
+            return (PdfRealNumber(_real_struct.unpack_from(buffer, pos)[0]), pos + _real_struct.size)
+        elif tag == TAG_LITERAL_STRING or tag == TAG_HEXADECIMAL_STRING:
+            (length, pos) = _read_varint(buffer, pos)
+            v = buffer[pos:pos + length]
+            cls = PdfLiteralString if tag == TAG_LITERAL_STRING else PdfHexadecimalString
+            return (cls(v), pos + length)
+        elif tag == TAG_NULL:
+            return (PdfNull(), pos)
+        elif tag == TAG_TRUE:
+            return (PdfBoolean(True), pos)
+        elif tag == TAG_FALSE:
+            return (PdfBoolean(False), pos)
+        elif tag == TAG_STREAM:
+            (stream_dictionary, pos) = self._decode_dictionary(pos)
+            (stream_offset, pos) = _read_varint(buffer, pos)
+            (length, pos) = _read_varint(buffer, pos)
+            stream_data = self.pdf_buffer[stream_offset:stream_offset + length]
+            return (PdfStream(stream_dictionary, stream_data, stream_offset, self.stats), pos)
+        else:
+            raise SnapshotException('unknown tag %d in snapshot' % tag)
+
+    def _decode_dictionary(self, pos:int):
+        (count, pos) = _read_varint(self.buffer, pos)
+        d = PdfDictionary()
+        names = self.names
+        for i in range(0, count):
+            (idx, pos) = _read_varint(self.buffer, pos)
+            (v, pos) = self._decode(pos)
+            d[names[idx]] = v
+        return (d, pos)
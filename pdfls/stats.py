@@ -0,0 +1,97 @@
+# Copyright (C) 2024 Mete Balci
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+# pdfls: a utility to investigate PDF files
+# Copyright (C) 2024 Mete Balci
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+# streams decoded with a filter, see Stats.filters
+class FilterStats:
+    __slots__ = ('streams', 'encoded_bytes', 'decoded_bytes', 'time')
+
+    def __init__(self):
+        self.streams = 0
+        self.encoded_bytes = 0
+        self.decoded_bytes = 0
+        # seconds (wall time)
+        self.time = 0.0
+
+    def to_dict(self):
+        return {'streams': self.streams,
+                'encoded_bytes': self.encoded_bytes,
+                'decoded_bytes': self.decoded_bytes,
+                'time': self.time}
+
+# counters of parsing and decoding, see Document.stats
+# they are plain ints incremented in place by Tokenizer, Parser,
+# PdfStream and Document, which are given a Stats
+# they count nothing (they only check for None) if they are given None
+# they are not locked, they can be slightly off if threads parse concurrently
+# objects parsed in worker processes are not counted
+class Stats:
+
+    def __init__(self):
+        # Tokenizer
+        self.tokens = 0
+        self.seeks = 0
+        # seeks backwards, e.g. by Parser after looking ahead for a reference
+        # rereading a delimiter ending a token is not a seek
+        self.rollbacks = 0
+        # bytes consumed by tokens, skipped stream data is not scanned
+        self.bytes_scanned = 0
+        # Parser, indirect objects and objects in object streams
+        self.objects_parsed = 0
+        # Document, objects kept in Document.objects and get_object lookups
+        self.objects_cached = 0
+        self.object_cache_hits = 0
+        self.object_cache_misses = 0
+        # PdfStream
+        self.streams_decoded = 0
+        self.stream_encoded_bytes = 0
+        self.stream_decoded_bytes = 0
+        # filter name (str) e.g. 'FlateDecode' -> FilterStats
+        self.filters = {}
+
+    def add_filter(self, name:str, encoded_bytes:int, decoded_bytes:int, time:float):
+        filter_stats = self.filters.get(name, None)
+        if filter_stats is None:
+            filter_stats = FilterStats()
+            self.filters[name] = filter_stats
+        filter_stats.streams = filter_stats.streams + 1
+        filter_stats.encoded_bytes = filter_stats.encoded_bytes + encoded_bytes
+        filter_stats.decoded_bytes = filter_stats.decoded_bytes + decoded_bytes
+        filter_stats.time = filter_stats.time + time
+
+    def add_stream(self, encoded_bytes:int, decoded_bytes:int):
+        self.streams_decoded = self.streams_decoded + 1
+        self.stream_encoded_bytes = self.stream_encoded_bytes + encoded_bytes
+        self.stream_decoded_bytes = self.stream_decoded_bytes + decoded_bytes
+
+    # returns a dict, it can be dumped as JSON
+    def to_dict(self):
+        return {'tokenizer': {'tokens': self.tokens,
+                              'seeks': self.seeks,
+                              'rollbacks': self.rollbacks,
+                              'bytes_scanned': self.bytes_scanned},
+                'objects': {'parsed': self.objects_parsed,
+                            'cached': self.objects_cached,
+                            'cache_hits': self.object_cache_hits,
+                            'cache_misses': self.object_cache_misses},
+                'streams': {'decoded': self.streams_decoded,
+                            'encoded_bytes': self.stream_encoded_bytes,
+                            'decoded_bytes': self.stream_decoded_bytes,
+                            'filters': {name: filter_stats.to_dict()
+                                        for (name, filter_stats) in self.filters.items()}}}
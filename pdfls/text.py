@@ -0,0 +1,112 @@
+# Copyright (C) 2024 Mete Balci
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+# pdfls: a utility to investigate PDF files
+# Copyright (C) 2024 Mete Balci
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+import logging
+
+from .objects import *
+from .exceptions import *
+
+logger = logging.getLogger(__name__)
+
+# ISO 32000-2 9.4 Text objects
+# text is extracted in the order it is shown, it is not laid out
+
+# a negative TJ adjustment (in thousandths of text space unit)
+# larger than this is taken as a space between words
+TJ_SPACE_THRESHOLD = 200
+
+# Form XObjects in Form XObjects are not followed deeper than this
+FORM_MAX_DEPTH = 16
+
+# fonts are cached in Document.decode_cache, see Document.get_font
+def _get_font(document, resources, name:PdfName):
+    font = document.get_resource(resources, 'Font', name)
+    if font is None:
+        logger.warning('font %s is not in resources' % name)
+        return None
+    return document.get_font(font)
+
+# lines are not started before any text or after an empty line
+def _new_line(out:list):
+    if len(out) > 0 and out[-1] != '\n':
+        out.append('\n')
+
+# appends str pieces shown by instructions to out
+# instructions is an iterable of (operands, operator)
+def _extract_text(document, instructions, resources, out:list, depth:int):
+    font = None
+    for (operands, operator) in instructions:
+        if operator == b'Tf':
+            if len(operands) == 2 and isinstance(operands[0], PdfName):
+                font = _get_font(document, resources, operands[0])
+        elif operator in (b'Tj', b"'", b'"'):
+            if operator != b'Tj':
+                _new_line(out)
+            if len(operands) > 0 and isinstance(operands[-1], PdfString) and font is not None:
+                out.append(font.decode(operands[-1].p))
+        elif operator == b'TJ':
+            if len(operands) == 1 and isinstance(operands[0], PdfArray) and font is not None:
+                for element in operands[0].p:
+                    if isinstance(element, PdfString):
+                        out.append(font.decode(element.p))
+                    elif isinstance(element, PdfNumber) and element.p <= -TJ_SPACE_THRESHOLD:
+                        out.append(' ')
+        elif operator == b'T*':
+            _new_line(out)
+        elif operator in (b'Td', b'TD'):
+            # only a move to another line is a new line
+            if len(operands) == 2 and isinstance(operands[1], PdfNumber) and operands[1].p != 0:
+                _new_line(out)
+        elif operator == b'ET':
+            _new_line(out)
+        elif operator == b'Do':
+            if len(operands) != 1 or not isinstance(operands[0], PdfName):
+                continue
+            ref = document.get_resource(resources, 'XObject', operands[0])
+            if not isinstance(ref, PdfIndirectReference):
+                continue
+            xobject = document.get_object(ref).p
+            if not isinstance(xobject, PdfStream):
+                continue
+            subtype = xobject.stream_dictionary.get(PdfName('Subtype'), None)
+            if not isinstance(subtype, PdfName) or subtype.p != b'Form':
+                continue
+            if depth >= FORM_MAX_DEPTH:
+                logger.warning('Form XObject %s is too deep' % ref)
+                continue
+            # a form without Resources uses the resources of the page
+            form_resources = xobject.stream_dictionary.get(PdfName('Resources'), resources)
+            _extract_text(document,
+                          document.get_compiled_content(ref),
+                          form_resources,
+                          out,
+                          depth + 1)
+
+# returns the text (str) of page
+def extract_page_text(page):
+    out = []
+    _extract_text(page.document, page.instructions(), page.resources, out, 0)
+    return ''.join(out)
+
+# yields the text (str) of each page of document, one page at a time
+# pages are not kept, see Document.iter_pages
+def iter_text(document):
+    for page in document.iter_pages(cache=False):
+        yield extract_page_text(page)
@@ -21,6 +21,7 @@
 import logging
 import re
 
+from .stats import Stats
 from .tokens import *
 from .exceptions import *
 
@@ -80,9 +81,12 @@ class Tokenizer:
     # if skip_comments=True, comments are not returned
     # meaning no TokenComment and no TokenLiteral for the comment content is
     # returned
-    def __init__(self, buffer:bytes, skip_comments:bool=True):
+    # if stats (Stats) is given, tokens, seeks and bytes scanned are counted in it
+    # nothing is counted if it is None
+    def __init__(self, buffer:bytes, skip_comments:bool=True, stats:Stats=None):
         self.buffer = buffer
         self.skip_comments = skip_comments
+        self.stats = stats
         self.context:int = _TOKENIZER_CONTEXT_FREE
         self.pos:int = 0
 
@@ -96,9 +100,20 @@ class Tokenizer:
     # be careful to not miss state changing positions when seeking
     def seek(self, pos:int):
         logger.debug('tokenizer.pos = %d' % pos)
+        stats = self.stats
+        if stats is not None:
+            stats.seeks = stats.seeks + 1
+            if pos < self.pos:
+                stats.rollbacks = stats.rollbacks + 1
         self.pos = pos
         self.context = _TOKENIZER_CONTEXT_FREE
 
+    # steps back one byte, so the last character (e.g. a delimiter ending a token)
+    # is read again by the next token, it is not counted as a seek
+    def _unread(self):
+        self.pos = self.pos - 1
+        self.context = _TOKENIZER_CONTEXT_FREE
+
     # this function returns:
     # - the byte in current position if position < len(self.buffer)
     #   but skips LF in CR LF because CR LF is considered as a single EOL marker
@@ -161,27 +176,27 @@ class Tokenizer:
                 ch = self._read_char()
                 if ch is None:
                     raise PdfConformanceException('PDF exhausted when reading literal string before )')
-                elif ch == 'n':
+                elif ch == ord('n'):
                     token.push(0x0A)
-                elif ch == 'r':
+                elif ch == ord('r'):
                     token.push(0x0D)
-                elif ch == 't':
+                elif ch == ord('t'):
                     token.push(0x09)
-                elif ch == 'b':
+                elif ch == ord('b'):
                     token.push(0x08)
-                elif ch == 'f':
+                elif ch == ord('f'):
                     token.push(0x0C)
-                elif ch == '(':
-                    token.push('(')
-                elif ch == ')':
-                    token.push(')')
-                elif ch == '\\':
-                    token.push('\\')
+                elif ch == ord('('):
+                    token.push(ord('('))
+                elif ch == ord(')'):
+                    token.push(ord(')'))
+                elif ch == ord('\\'):
+                    token.push(ord('\\'))
                 elif ch in EOL_CHARACTERS:
                     # skip \EOL
                     # literal continues on the next line
                     pass
-                elif ch < ord('0') or ch > ord('9'):
+                elif ch < ord('0') or ch > ord('7'):
                     # unknown escape character, ignore silently
                     pass
                 else:
@@ -189,21 +204,21 @@ class Tokenizer:
                     ch1 = ch
                     ch2 = self._read_char()
                     if ch2 == None:
-                        raise PdfConformanceException('PDF exhausted when reading literal string (\ddd 2) before )')
-                    elif ch2 < ord('0') or ch2 > ord('9'):
+                        raise PdfConformanceException('PDF exhausted when reading literal string (\\ddd 2) before )')
+                    elif ch2 < ord('0') or ch2 > ord('7'):
                         # found \d, reread the last char (ch2)
                         logger.debug('found \\d: \\%s' % chr(ch1))
-                        self.seek(self.tell() - 1)
+                        self._unread()
                         # -ord('0')  because ch1 contains the ascii code
                         token.push(ch1 - ord('0'))
                     else:
                         ch3 = self._read_char()
                         if ch3 == None:
-                            raise PdfConformanceException('PDF exhausted when reading literal string (\ddd 3) before )')
-                        elif ch3 < ord('0') or ch3 > ord('9'):
+                            raise PdfConformanceException('PDF exhausted when reading literal string (\\ddd 3) before )')
+                        elif ch3 < ord('0') or ch3 > ord('7'):
                             # found \dd, reread the last char (ch3)
                             logger.debug('found \\dd: \\%s%s' % (chr(ch1), chr(ch2)))
-                            self.seek(self.tell() - 1)
+                            self._unread()
                             token.push(8 * (ch1 - ord('0')) + (ch2 - ord('0')))
                         else:
                             # found \ddd
@@ -213,8 +228,8 @@ class Tokenizer:
                             ddd = (8 * 8 * (ch1 - ord('0')) +
                                    8 * (ch2 - ord('0')) +
                                    (ch3 - ord('0')))
-                            if ddd >= 0xFF:
-                                raise PdfConformanceException('\ddd is greater than 0xFF')
+                            if ddd > 0xFF:
+                                raise PdfConformanceException('\\ddd is greater than 0xFF')
                             token.push(ddd)
             # literal string may contain
             # balanced pair of parantheses without escaping e.g. (())
@@ -226,7 +241,7 @@ class Tokenizer:
                     balanced_parantheses = balanced_parantheses - 1
                     token.push(ch)
                 else:
-                    self.seek(self.tell() - 1)
+                    self._unread()
                     break
             else:
                 token.push(ch)
@@ -244,7 +259,7 @@ class Tokenizer:
             if ch is None:
                 raise PdfConformanceException('PDF exhausted when reading hexadecimal string before >')
             elif ch == ord('>'):
-                self.seek(self.tell() - 1)
+                self._unread()
                 break
             else:
                 val = hexdigit_to_int(ch)
@@ -291,7 +306,7 @@ class Tokenizer:
             elif ch in EOL_CHARACTERS:
                 break
             elif ch in DELIMITER_CHARACTERS:
-                self.seek(self.tell() - 1)
+                self._unread()
                 break
             else:
                 token.push(ch)
@@ -301,6 +316,7 @@ class Tokenizer:
         return token
 
     def next(self) -> Token | None:
+        start = self.pos
         token = None
         if self.context == _TOKENIZER_CONTEXT_FREE:
             literal = None
@@ -324,7 +340,7 @@ class Tokenizer:
                 elif ch in DELIMITER_CHARACTERS:
                     logger.debug('delimiter')
                     if literal is not None:
-                        self.seek(self.tell() - 1)
+                        self._unread()
                         token = literal
                     elif ch == ord('('):
                         self.context = _TOKENIZER_CONTEXT_LITERAL_STRING
@@ -337,7 +353,9 @@ class Tokenizer:
                         if ch == ord('<'):
                             token = TokenDictionaryStart()
                         else:
-                            self.seek(self.tell() - 1)
+                            # not exhausted, reread the last char
+                            if ch is not None:
+                                self._unread()
                             self.context = _TOKENIZER_CONTEXT_HEX_STRING
                             token = TokenHexStringStart()
                     elif ch == ord('>'):
@@ -345,7 +363,9 @@ class Tokenizer:
                         if ch == ord('>'):
                             token = TokenDictionaryEnd()
                         else:
-                            self.seek(self.tell() - 1)
+                            # not exhausted, reread the last char
+                            if ch is not None:
+                                self._unread()
                             token = TokenHexStringEnd()
                     elif ch == ord('['):
                         token = TokenArrayStart()
@@ -365,6 +385,8 @@ class Tokenizer:
                             self.context = _TOKENIZER_CONTEXT_COMMENT
                             self._read_comment_content()
                             self.context = _TOKENIZER_CONTEXT_FREE
+                            if self.stats is not None:
+                                self.stats.bytes_scanned = self.stats.bytes_scanned + self.pos - start
                             return self.next()
                         else:
                             self.context = _TOKENIZER_CONTEXT_COMMENT
@@ -407,4 +429,9 @@ class Tokenizer:
             raise PossibleBugException('unknown context')
 
         logger.debug('final token: %s' % token)
+        stats = self.stats
+        if stats is not None:
+            if token is not None:
+                stats.tokens = stats.tokens + 1
+            stats.bytes_scanned = stats.bytes_scanned + self.pos - start
         return token
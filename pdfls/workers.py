@@ -0,0 +1,146 @@
+# Copyright (C) 2024 Mete Balci
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+# pdfls: a utility to investigate PDF files
+# Copyright (C) 2024 Mete Balci
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+import collections
+import concurrent.futures
+import logging
+import mmap
+
+from . import Parser
+from .objects import *
+from .hashcons import HashConsTable
+
+logger = logging.getLogger(__name__)
+
+# parsing objects is pure Python and CPU-bound
+# so it is done in a process pool, not in threads
+# each worker process maps the same file read-only
+# so the buffer is never pickled to the workers
+
+# the number of chunks given to each worker
+# more than one so a slow chunk does not stall the whole pool
+CHUNKS_PER_WORKER = 4
+
+# the number of pages in flight for each worker in map_pages
+# results are yielded in page order, so a slow page holds this many back
+PAGES_IN_FLIGHT_PER_WORKER = 4
+
+# set in each worker process by _init_worker
+_parser = None
+
+# dict obj_num -> (obj_byte_offset, obj_gen) of in-use objects, set by _init_worker
+# it is used to resolve indirect Length of streams
+_in_use = None
+
+# set in each page worker process by _init_page_worker
+_document = None
+
+# if hash_cons=True, each worker has its own HashConsTable
+# objects shared in a chunk stay shared when they are pickled back
+# in_use is a list of (obj_byte_offset, obj_num, obj_gen) of in-use objects in xref
+def _init_worker(path:str, hash_cons:bool, in_use:list):
+    global _parser, _in_use
+    with open(path, 'rb') as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    _in_use = {obj_num: (obj_byte_offset, obj_gen)
+               for (obj_byte_offset, obj_num, obj_gen) in in_use}
+    _parser = Parser(buffer,
+                     resolver=_resolve,
+                     hash_cons=HashConsTable() if hash_cons else None)
+
+# resolver of _parser, the same as Document._parse_object for in-use objects
+# compressed objects are not known in workers, their Length is not resolved
+def _resolve(ref:PdfIndirectReference):
+    entry = _in_use.get(ref.object_number, None)
+    if entry is None or entry[1] != ref.generation_number:
+        raise KeyError(ref)
+    (obj, end_offset) = _parser.parse_object_at(entry[0])
+    if not isinstance(obj, PdfIndirectObject):
+        raise KeyError(ref)
+    return obj
+
+# chunk is a list of (obj_byte_offset, obj_num, obj_gen)
+# returns a list of (obj_num, obj_gen, PdfIndirectObject, end_offset)
+# stream data in returned objects is not decoded, so it is as small as in file
+def _parse_chunk(chunk:list):
+    objs = []
+    for (obj_byte_offset, obj_num, obj_gen) in chunk:
+        (obj, end_offset) = _parser.parse_object_at(obj_byte_offset)
+        assert isinstance(obj, PdfIndirectObject), '%s:%s' % (obj, type(obj))
+        objs.append((obj_num, obj_gen, obj, end_offset))
+    return objs
+
+# splits entries into chunks of consecutive offsets
+# entries is a list of (obj_byte_offset, obj_num, obj_gen)
+def split_entries(entries:list, num_chunks:int):
+    entries = sorted(entries)
+    chunk_size = max(1, -(-len(entries) // num_chunks))
+    return [entries[i:i+chunk_size] for i in range(0, len(entries), chunk_size)]
+
+# parses the objects at entries of the file at path with a process pool
+# entries is a list of (obj_byte_offset, obj_num, obj_gen)
+# in_use is the same of all in-use objects in xref (entries if None)
+# indirect Length of streams are resolved with it
+# returns a list of (obj_num, obj_gen, PdfIndirectObject, end_offset)
+def parse_objects(path:str, entries:list, workers:int, hash_cons:bool=False, in_use:list=None):
+    logger.debug('parse_objects: %d objects with %d workers' % (len(entries), workers))
+    if in_use is None:
+        in_use = entries
+    chunks = split_entries(entries, workers * CHUNKS_PER_WORKER)
+    objs = []
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers,
+                                                initializer=_init_worker,
+                                                initargs=(path, hash_cons, in_use)) as executor:
+        for chunk_objs in executor.map(_parse_chunk, chunks):
+            objs.extend(chunk_objs)
+    return objs
+
+# a page worker opens the document lazily, only xref and catalog are read
+# and the objects on the Parent chain of a page are parsed when it is mapped
+# document_class is Document, it is not imported here because of the cycle
+def _init_page_worker(document_class, path:str):
+    global _document
+    _document = document_class.open(path, lazy=True)
+
+def _map_page(fn, obj_num:int, obj_gen:int):
+    return fn(_document._get_page_node_by_parent(PdfIndirectReference(obj_num, obj_gen)))
+
+# yields fn(page) for the pages at page_refs in order, computed in a process pool
+# page_refs is an iterable of (obj_num, obj_gen) of leaf pages
+# only the page references are sent to workers, Page objects are never pickled
+# fn should be picklable (e.g. a module level function) and so should its results
+def map_pages(document_class, path:str, fn, page_refs, workers:int):
+    logger.debug('map_pages: %d workers' % workers)
+    max_pending = workers * PAGES_IN_FLIGHT_PER_WORKER
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers,
+                                                initializer=_init_page_worker,
+                                                initargs=(document_class, path)) as executor:
+        pending = collections.deque()
+        try:
+            for (obj_num, obj_gen) in page_refs:
+                if len(pending) >= max_pending:
+                    yield pending.popleft().result()
+                pending.append(executor.submit(_map_page, fn, obj_num, obj_gen))
+            while len(pending) > 0:
+                yield pending.popleft().result()
+        finally:
+            # if the results are not consumed to the end
+            for future in pending:
+                future.cancel()
@@ -0,0 +1,399 @@
+# Copyright (C) 2024 Mete Balci
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+# pdfls: a utility to investigate PDF files
+# Copyright (C) 2024 Mete Balci
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+from array import array
+import logging
+import sys
+
+from .exceptions import *
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+logger = logging.getLogger(__name__)
+
+# entry types kept in XrefTable.types
+# ENTRY_NONE means the object number is not in the table
+ENTRY_NONE = 0
+ENTRY_FREE = 1
+ENTRY_IN_USE = 2
+# ISO 32000-2 7.5.8.3: type 2 entry in xref stream
+# object is in an object stream, offsets column keeps the object number
+# of the object stream and generations column keeps the index in it
+ENTRY_COMPRESSED = 3
+
+# type of an xref section
+XREF_TYPE_TABLE = 'table'
+XREF_TYPE_STREAM = 'stream'
+
+# ISO 32000-2 7.5.4: Cross-reference table
+# each entry is exactly 20 bytes
+# nnnnnnnnnn ggggg fEOL
+# EOL is one of SP CR, SP LF, CR LF
+XREF_ENTRY_SIZE = 20
+
+# f -> ENTRY_FREE, n -> ENTRY_IN_USE, everything else -> ENTRY_NONE
+_entry_type_table = bytearray(256)
+_entry_type_table[ord('f')] = ENTRY_FREE
+_entry_type_table[ord('n')] = ENTRY_IN_USE
+_entry_type_table = bytes(_entry_type_table)
+
+# ENTRY_NONE -> 0, other types -> 1, see XrefOverlay.__len__
+_entry_present_table = bytes([0] + [1] * 255)
+
+# xref table indexed by object number
+# entries are kept in parallel columns instead of a tuple per entry
+# offsets: array('q'), byte offset of the object
+# generations: array('H'), generation number of the object
+# types: bytearray, one of ENTRY_* for each object number
+# for ENTRY_COMPRESSED, see its definition above
+class XrefTable:
+
+    def __init__(self):
+        self.offsets = array('q')
+        self.generations = array('H')
+        self.types = bytearray()
+
+    # number of object numbers in the table
+    def __len__(self):
+        return len(self.types) - self.types.count(ENTRY_NONE)
+
+    def __contains__(self, obj_num:int):
+        return obj_num < len(self.types) and self.types[obj_num] != ENTRY_NONE
+
+    # the largest object number + 1
+    def size(self):
+        return len(self.types)
+
+    def _grow(self, size:int):
+        n = size - len(self.types)
+        if n > 0:
+            self.offsets.extend(array('q', bytes(8 * n)))
+            self.generations.extend(array('H', bytes(2 * n)))
+            self.types.extend(bytes(n))
+
+    # returns (obj_offset, obj_gen, obj_is_free) or default
+    # compressed objects are returned as free, use get_entry for them
+    def get(self, obj_num:int, default=None):
+        if obj_num not in self:
+            return default
+        return (self.offsets[obj_num],
+                self.generations[obj_num],
+                self.types[obj_num] != ENTRY_IN_USE)
+
+    # returns (entry_type, offset column, generation column) or default
+    def get_entry(self, obj_num:int, default=None):
+        if obj_num not in self:
+            return default
+        return (self.types[obj_num],
+                self.offsets[obj_num],
+                self.generations[obj_num])
+
+    def set(self, obj_num:int, obj_offset:int, obj_gen:int, obj_is_free:bool):
+        self._grow(obj_num + 1)
+        self.offsets[obj_num] = obj_offset
+        self.generations[obj_num] = obj_gen
+        self.types[obj_num] = ENTRY_FREE if obj_is_free else ENTRY_IN_USE
+
+    # sets the entries of object numbers first_obj_num, first_obj_num+1, ...
+    # offsets and generations are arrays, types is bytes
+    def set_subsection(self, first_obj_num:int, offsets, generations, types):
+        end = first_obj_num + len(types)
+        self._grow(end)
+        self.offsets[first_obj_num:end] = offsets
+        self.generations[first_obj_num:end] = generations
+        self.types[first_obj_num:end] = types
+
+    # adds the entries of other table
+    # for object numbers which are not in this table or free in this table
+    def fill_from(self, other):
+        self._grow(other.size())
+        for obj_num in other:
+            if self.types[obj_num] in (ENTRY_NONE, ENTRY_FREE):
+                self.offsets[obj_num] = other.offsets[obj_num]
+                self.generations[obj_num] = other.generations[obj_num]
+                self.types[obj_num] = other.types[obj_num]
+
+    # object numbers in the table in increasing order
+    def __iter__(self):
+        types = self.types
+        return (obj_num for obj_num in range(0, len(types)) if types[obj_num] != ENTRY_NONE)
+
+    # returns a list of (obj_offset, obj_num, obj_gen) of in-use objects
+    def in_use_entries(self):
+        offsets = self.offsets
+        generations = self.generations
+        types = self.types
+        entries = []
+        obj_num = types.find(ENTRY_IN_USE)
+        while obj_num != -1:
+            entries.append((offsets[obj_num], obj_num, generations[obj_num]))
+            obj_num = types.find(ENTRY_IN_USE, obj_num + 1)
+        return entries
+
+    # returns a list of (objstm_obj_num, index, obj_num) of compressed objects
+    def compressed_entries(self):
+        offsets = self.offsets
+        generations = self.generations
+        types = self.types
+        entries = []
+        obj_num = types.find(ENTRY_COMPRESSED)
+        while obj_num != -1:
+            entries.append((offsets[obj_num], generations[obj_num], obj_num))
+            obj_num = types.find(ENTRY_COMPRESSED, obj_num + 1)
+        return entries
+
+# returns True if data is num_entries well formed 20-byte xref entries
+# the checks are on strided slices, so they run in C
+def _is_fixed_stride(data:bytes, num_entries:int):
+    if len(data) != num_entries * XREF_ENTRY_SIZE:
+        return False
+    if data[10::XREF_ENTRY_SIZE].strip(b' ') != b'':
+        return False
+    if data[16::XREF_ENTRY_SIZE].strip(b' ') != b'':
+        return False
+    if data[17::XREF_ENTRY_SIZE].translate(None, b'fn') != b'':
+        return False
+    if data[18::XREF_ENTRY_SIZE].translate(None, b' \r') != b'':
+        return False
+    if data[19::XREF_ENTRY_SIZE].translate(None, b'\r\n') != b'':
+        return False
+    return True
+
+# entries are parsed in chunks of this many entries
+# so the temporary objects (e.g. split words) stay small
+XREF_CHUNK_ENTRIES = 65536
+
+def _parse_fixed_stride_numpy(data:bytes, num_entries:int):
+    rows = numpy.frombuffer(data, dtype=numpy.uint8).reshape(num_entries, XREF_ENTRY_SIZE)
+    offset_digits = rows[:, 0:10].astype(numpy.int64) - ord('0')
+    generation_digits = rows[:, 11:16].astype(numpy.int64) - ord('0')
+    if (((offset_digits < 0) | (offset_digits > 9)).any() or
+        ((generation_digits < 0) | (generation_digits > 9)).any()):
+        raise PdfConformanceException('xref entry has a non-digit offset or generation')
+    offsets = offset_digits @ (10 ** numpy.arange(9, -1, -1, dtype=numpy.int64))
+    generations = generation_digits @ (10 ** numpy.arange(4, -1, -1, dtype=numpy.int64))
+    if (generations > 0xFFFF).any():
+        raise PdfConformanceException('xref entry generation is greater than 65535')
+    return (array('q', offsets.astype(numpy.int64).tobytes()),
+            array('H', generations.astype(numpy.uint16).tobytes()))
+
+def _parse_fixed_stride(data:bytes, num_entries:int):
+    # when well formed, there are exactly 3 words per entry
+    words = data.split()
+    if len(words) != 3 * num_entries:
+        raise PdfConformanceException('xref entry is not in nnnnnnnnnn ggggg f format')
+    try:
+        offsets = array('q', map(int, words[0::3]))
+        generations = array('H', map(int, words[1::3]))
+    except ValueError:
+        raise PdfConformanceException('xref entry has a non-digit offset or generation')
+    except OverflowError:
+        raise PdfConformanceException('xref entry generation is greater than 65535')
+    return (offsets, generations)
+
+# parses num_entries xref entries starting at pos
+# returns (offsets, generations, types, position after the entries)
+# or None if the entries are not 20 bytes each
+def parse_xref_subsection(buffer, pos:int, num_entries:int):
+    offsets = array('q')
+    generations = array('H')
+    types = bytearray()
+    while num_entries > 0:
+        chunk_entries = min(num_entries, XREF_CHUNK_ENTRIES)
+        end = pos + chunk_entries * XREF_ENTRY_SIZE
+        data = bytes(buffer[pos:end])
+        if not _is_fixed_stride(data, chunk_entries):
+            return None
+        if numpy is not None:
+            (chunk_offsets, chunk_generations) = _parse_fixed_stride_numpy(data, chunk_entries)
+        else:
+            (chunk_offsets, chunk_generations) = _parse_fixed_stride(data, chunk_entries)
+        offsets.extend(chunk_offsets)
+        generations.extend(chunk_generations)
+        types.extend(data[17::XREF_ENTRY_SIZE].translate(_entry_type_table))
+        pos = end
+        num_entries = num_entries - chunk_entries
+    return (offsets, generations, bytes(types), pos)
+
+# xref stream type field -> ENTRY_*, unknown types are treated as free
+# ISO 32000-2 7.5.8.3: "Any other value shall be interpreted
+# as a reference to the null object"
+_stream_entry_type_table = bytes([ENTRY_FREE, ENTRY_IN_USE, ENTRY_COMPRESSED] + [ENTRY_FREE] * 253)
+
+# fields wider than 8 bytes are not supported
+MAX_XREF_STREAM_FIELD_WIDTH = 8
+
+# decodes the big-endian unsigned field of width bytes at col of each row
+# the bytes of the field are copied with strided slices
+# into the low end of 8-byte big-endian lanes, and read as one array
+def _decode_field_column(data:bytes, row_len:int, col:int, width:int, num_rows:int):
+    lanes = bytearray(8 * num_rows)
+    for j in range(0, width):
+        lanes[8 - width + j::8] = data[col + j::row_len]
+    values = array('q', lanes)
+    if sys.byteorder == 'little':
+        values.byteswap()
+    return values
+
+# ISO 32000-2 7.5.8: Cross-reference streams
+# data is the decoded stream data
+# widths is W, the widths of the three fields
+# index is Index, a list of (first_obj_num, num_entries)
+# returns XrefTable
+def parse_xref_stream(data:bytes, widths:list, index:list):
+    if len(widths) != 3:
+        raise PdfConformanceException('xref stream W should have 3 entries')
+    for width in widths:
+        if width < 0 or width > MAX_XREF_STREAM_FIELD_WIDTH:
+            raise NotSupportedException('xref stream field width %d not supported' % width)
+    row_len = sum(widths)
+    num_rows = sum([num_entries for (first_obj_num, num_entries) in index])
+    if row_len == 0 or len(data) < row_len * num_rows:
+        raise PdfConformanceException('xref stream has less data than W and Index requires')
+    data = data[0:row_len * num_rows]
+    cols = [0, widths[0], widths[0] + widths[1]]
+    # type field
+    if widths[0] == 0:
+        # default type is 1
+        types = bytes([ENTRY_IN_USE]) * num_rows
+    elif widths[0] == 1:
+        types = data[0::row_len].translate(_stream_entry_type_table)
+    else:
+        type_values = _decode_field_column(data, row_len, 0, widths[0], num_rows)
+        types = bytes([_stream_entry_type_table[min(v, 255)] for v in type_values])
+    # second field, default is 0
+    if widths[1] == 0:
+        offsets = array('q', bytes(8 * num_rows))
+    else:
+        offsets = _decode_field_column(data, row_len, cols[1], widths[1], num_rows)
+    # third field, default is 0 (generation or index in object stream)
+    if widths[2] == 0:
+        generations = array('H', bytes(2 * num_rows))
+    else:
+        try:
+            generations = array('H', _decode_field_column(data, row_len, cols[2], widths[2], num_rows))
+        except OverflowError:
+            raise NotSupportedException('xref stream generation or index is greater than 65535')
+    xref_table = XrefTable()
+    row = 0
+    for (first_obj_num, num_entries) in index:
+        xref_table.set_subsection(first_obj_num,
+                                  offsets[row:row + num_entries],
+                                  generations[row:row + num_entries],
+                                  types[row:row + num_entries])
+        row = row + num_entries
+    return xref_table
+
+# xref of an incrementally updated document
+# layers is a list of XrefTable, newest first (the one startxref points to)
+# an object number is looked up in the layers newest first
+# so the tables are not copied or merged
+class XrefOverlay:
+
+    def __init__(self, layers:list):
+        self.layers = layers
+
+    # the overlay of layers starting from the one at index
+    # i.e. xref as it was before the newer updates
+    def older(self, index:int):
+        return XrefOverlay(self.layers[index:])
+
+    def _find_layer(self, obj_num:int):
+        for layer in self.layers:
+            if obj_num in layer:
+                return layer
+        return None
+
+    def __contains__(self, obj_num:int):
+        return self._find_layer(obj_num) is not None
+
+    def size(self):
+        return max([layer.size() for layer in self.layers] + [0])
+
+    def get(self, obj_num:int, default=None):
+        layer = self._find_layer(obj_num)
+        if layer is None:
+            return default
+        return layer.get(obj_num)
+
+    def get_entry(self, obj_num:int, default=None):
+        layer = self._find_layer(obj_num)
+        if layer is None:
+            return default
+        return layer.get_entry(obj_num)
+
+    # calls fn(layer, obj_num) for the newest entry of each object number
+    def _visible(self, fn):
+        seen = bytearray(self.size())
+        for layer in self.layers:
+            for obj_num in layer:
+                if not seen[obj_num]:
+                    seen[obj_num] = 1
+                    fn(layer, obj_num)
+
+    # number of object numbers in any layer
+    # the layers are merged as bit sets (a bit per object number) with int |
+    # so neither a list of object numbers nor a Python loop over them is needed
+    def __len__(self):
+        if len(self.layers) == 1:
+            return len(self.layers[0])
+        present = 0
+        for layer in self.layers:
+            present = present | int.from_bytes(layer.types.translate(_entry_present_table), 'little')
+        return present.bit_count()
+
+    def __iter__(self):
+        obj_nums = []
+        self._visible(lambda layer, obj_num: obj_nums.append(obj_num))
+        return iter(sorted(obj_nums))
+
+    # the number of in-use and compressed objects, only the newest versions
+    def count_objects(self):
+        if len(self.layers) == 1:
+            # nothing is shadowed, types are counted without a Python loop
+            types = self.layers[0].types
+            return types.count(ENTRY_IN_USE) + types.count(ENTRY_COMPRESSED)
+        count = [0]
+        def add(layer, obj_num):
+            if layer.types[obj_num] in (ENTRY_IN_USE, ENTRY_COMPRESSED):
+                count[0] = count[0] + 1
+        self._visible(add)
+        return count[0]
+
+    # only the newest versions, older (shadowed) ones are not returned
+    def in_use_entries(self):
+        entries = []
+        def add(layer, obj_num):
+            if layer.types[obj_num] == ENTRY_IN_USE:
+                entries.append((layer.offsets[obj_num], obj_num, layer.generations[obj_num]))
+        self._visible(add)
+        return entries
+
+    # only the newest versions, older (shadowed) ones are not returned
+    def compressed_entries(self):
+        entries = []
+        def add(layer, obj_num):
+            if layer.types[obj_num] == ENTRY_COMPRESSED:
+                entries.append((layer.offsets[obj_num], layer.generations[obj_num], obj_num))
+        self._visible(add)
+        return entries
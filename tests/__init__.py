@@ -19,6 +19,7 @@
 # along with this program. If not, see <https://www.gnu.org/licenses/>.
 
 import logging
+import zlib
 
 def with_debug(func):
     def inner(*args, **kwargs):
@@ -27,3 +28,161 @@ def with_debug(func):
         logging.basicConfig(level=logging.WARNING)
     return inner
 
+
+# builds a PDF file with a classic xref table
+# objects is a dict of obj_num -> bytes (the value between obj and endobj)
+def make_pdf(objects, root=1, version=b'1.7'):
+    out = bytearray(b'%PDF-' + version + b'\n')
+    offsets = {}
+    for obj_num in sorted(objects):
+        offsets[obj_num] = len(out)
+        out += b'%d 0 obj\n%s\nendobj\n' % (obj_num, objects[obj_num])
+    size = max(objects) + 1
+    xref_offset = len(out)
+    out += b'xref\n0 %d\n' % size
+    out += b'0000000000 65535 f\r\n'
+    for obj_num in range(1, size):
+        if obj_num in offsets:
+            out += b'%010d 00000 n\r\n' % offsets[obj_num]
+        else:
+            out += b'0000000000 00000 f\r\n'
+    out += b'trailer\n<< /Size %d /Root %d 0 R >>\n' % (size, root)
+    out += b'startxref\n%d\n%%%%EOF\n' % xref_offset
+    return bytes(out)
+
+# builds a PDF file with a catalog, a flat page tree of num_pages pages
+# and a content stream for each page
+def make_pages_pdf(num_pages, content=b'BT /F1 12 Tf (Hello) Tj ET'):
+    objects = {}
+    objects[1] = b'<< /Type /Catalog /Pages 2 0 R >>'
+    kids = []
+    for i in range(0, num_pages):
+        page_num = 3 + 2 * i
+        kids.append(b'%d 0 R' % page_num)
+        objects[page_num] = (b'<< /Type /Page /Parent 2 0 R '
+                             b'/MediaBox [0 0 612 792] /Contents %d 0 R >>' % (page_num + 1))
+        objects[page_num + 1] = b'<< /Length %d >>\nstream\n%s\nendstream' % (len(content), content)
+    objects[2] = (b'<< /Type /Pages /Resources << /Font << >> >> /Kids [%s] /Count %d >>' %
+                  (b' '.join(kids), num_pages))
+    return make_pdf(objects)
+
+# builds a PDF file of num_pages pages sharing a Form XObject (Fm1) and a font (F1)
+# each page draws the form, the form shows a text
+def make_template_pdf(num_pages):
+    objects = {}
+    objects[1] = b'<< /Type /Catalog /Pages 2 0 R >>'
+    form = b'BT /F1 10 Tf (Footer) Tj ET'
+    objects[3] = (b'<< /Type /XObject /Subtype /Form /BBox [0 0 612 50] /Resources 5 0 R '
+                  b'/Length %d >>\nstream\n%s\nendstream' % (len(form), form))
+    objects[4] = b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>'
+    objects[5] = b'<< /Font << /F1 4 0 R >> /XObject << /Fm1 3 0 R >> >>'
+    content = b'q /Fm1 Do Q'
+    kids = []
+    for i in range(0, num_pages):
+        page_num = 6 + 2 * i
+        kids.append(b'%d 0 R' % page_num)
+        objects[page_num] = b'<< /Type /Page /Parent 2 0 R /Contents %d 0 R >>' % (page_num + 1)
+        objects[page_num + 1] = b'<< /Length %d >>\nstream\n%s\nendstream' % (len(content), content)
+    objects[2] = (b'<< /Type /Pages /Resources 5 0 R /MediaBox [0 0 612 792] /Kids [%s] /Count %d >>' %
+                  (b' '.join(kids), num_pages))
+    return make_pdf(objects)
+
+# builds a PDF file with a balanced page tree of num_pages pages
+# each Pages node has at most fanout kids, pages have no content
+# returns (buffer, list of page object numbers in order)
+def make_page_tree_pdf(num_pages, fanout):
+    objects = {}
+    objects[1] = b'<< /Type /Catalog /Pages 2 0 R >>'
+    next_obj_num = [3]
+    page_obj_nums = []
+    def add_node(obj_num, parent, first, count):
+        if count == 1 and parent is not None:
+            objects[obj_num] = b'<< /Type /Page /Parent %d 0 R >>' % parent
+            page_obj_nums.append(obj_num)
+            return
+        kids = []
+        step = max(1, -(-count // fanout))
+        for kid_first in range(first, first + count, step):
+            kid_obj_num = next_obj_num[0]
+            next_obj_num[0] = next_obj_num[0] + 1
+            kids.append(kid_obj_num)
+            add_node(kid_obj_num, obj_num, kid_first, min(step, first + count - kid_first))
+        parent_entry = b'/Parent %d 0 R ' % parent if parent is not None else b''
+        objects[obj_num] = (b'<< /Type /Pages %s/Kids [%s] /Count %d >>' %
+                            (parent_entry,
+                             b' '.join([b'%d 0 R' % kid for kid in kids]),
+                             count))
+    add_node(2, None, 0, num_pages)
+    return (make_pdf(objects), page_obj_nums)
+
+# encodes rows with PNG Up filter, rows is a list of bytes of the same length
+def png_up_encode(rows):
+    out = bytearray()
+    prev = bytes(len(rows[0]))
+    for row in rows:
+        out.append(2)
+        out.extend([(row[i] - prev[i]) & 0xFF for i in range(0, len(row))])
+        prev = row
+    return bytes(out)
+
+# builds a PDF file with a cross-reference stream (PDF 1.5+)
+# objects is a dict of obj_num -> bytes (the value between obj and endobj)
+# compressed is a dict of obj_num -> (objstm_obj_num, index) for type 2 entries
+def make_xref_stream_pdf(objects, root=1, compressed={}, trailer=b''):
+    out = bytearray(b'%PDF-1.7\n')
+    offsets = {}
+    for obj_num in sorted(objects):
+        offsets[obj_num] = len(out)
+        out += b'%d 0 obj\n%s\nendobj\n' % (obj_num, objects[obj_num])
+    xref_obj_num = max(list(objects) + list(compressed)) + 1
+    offsets[xref_obj_num] = len(out)
+    size = xref_obj_num + 1
+    rows = []
+    for obj_num in range(0, size):
+        if obj_num in offsets:
+            rows.append(bytes([1]) + offsets[obj_num].to_bytes(4, 'big') + bytes(2))
+        elif obj_num in compressed:
+            (objstm_obj_num, index) = compressed[obj_num]
+            rows.append(bytes([2]) + objstm_obj_num.to_bytes(4, 'big') + index.to_bytes(2, 'big'))
+        else:
+            rows.append(bytes([0]) + bytes(4) + b'\xff\xff')
+    data = zlib.compress(png_up_encode(rows))
+    out += (b'%d 0 obj\n<< /Type /XRef /Size %d /W [1 4 2] /Root %d 0 R %s'
+            b'/Filter /FlateDecode /DecodeParms << /Predictor 12 /Columns 7 >> '
+            b'/Length %d >>\nstream\n' % (xref_obj_num, size, root, trailer, len(data)))
+    out += data + b'\nendstream\nendobj\n'
+    out += b'startxref\n%d\n%%%%EOF\n' % offsets[xref_obj_num]
+    return bytes(out)
+
+# builds the value of an object stream (ObjStm) object
+# objects is a list of (obj_num, bytes)
+def make_object_stream(objects):
+    header = []
+    body = bytearray()
+    for (obj_num, value) in objects:
+        header.append(b'%d %d' % (obj_num, len(body)))
+        body += value + b'\n'
+    header = b' '.join(header) + b'\n'
+    data = zlib.compress(header + bytes(body))
+    return (b'<< /Type /ObjStm /N %d /First %d /Filter /FlateDecode /Length %d >>\nstream\n' %
+            (len(objects), len(header), len(data))) + data + b'\nendstream'
+
+# appends an incremental update to buffer built by make_pdf
+# objects is a dict of obj_num -> bytes, the new or changed objects
+# prev is the offset of the previous xref, found from startxref if not given
+def append_update(buffer, objects, root=1, prev=None):
+    if prev is None:
+        prev = int(buffer[buffer.rindex(b'startxref') + 9:].split()[0])
+    out = bytearray(buffer)
+    offsets = {}
+    for obj_num in sorted(objects):
+        offsets[obj_num] = len(out)
+        out += b'%d 0 obj\n%s\nendobj\n' % (obj_num, objects[obj_num])
+    xref_offset = len(out)
+    out += b'xref\n'
+    for obj_num in sorted(offsets):
+        out += b'%d 1\n%010d 00000 n\r\n' % (obj_num, offsets[obj_num])
+    size = max(objects) + 1
+    out += b'trailer\n<< /Size %d /Root %d 0 R /Prev %d >>\n' % (size, root, prev)
+    out += b'startxref\n%d\n%%%%EOF\n' % xref_offset
+    return bytes(out)
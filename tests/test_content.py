@@ -0,0 +1,171 @@
+# Copyright (C) 2024 Mete Balci
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+# pdfls: a utility to investigate PDF files
+# Copyright (C) 2024 Mete Balci
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+import pickle
+import tracemalloc
+import unittest
+import zlib
+
+from pdfls import Parser
+from pdfls.stats import Stats
+from pdfls.content import ContentStreamLexer
+from pdfls.content import CompiledContent
+from pdfls.objects import *
+from pdfls.exceptions import *
+
+class TestContentStreamLexer(unittest.TestCase):
+
+    content = (b'q 1 0 0 1 72.5 -700 cm BT /F1 12 Tf (Hello \\(x\\)\\101) Tj\n'
+               b'[(A) -250 (B)] TJ <41 4>Tj ET %comment\n'
+               b'/N#20x << /MCID 0 >> BDC EMC Q')
+
+    def _instructions(self, chunks, window_size=None):
+        if window_size is None:
+            lexer = ContentStreamLexer(chunks)
+        else:
+            lexer = ContentStreamLexer(chunks, window_size=window_size)
+        return [(operands, operator) for (operands, operator) in lexer]
+
+    def test_instructions(self):
+        instructions = self._instructions([self.content])
+        self.assertEqual([operator for (operands, operator) in instructions],
+                         [b'q', b'cm', b'BT', b'Tf', b'Tj', b'TJ', b'Tj', b'ET', b'BDC', b'EMC', b'Q'])
+        self.assertEqual(instructions[1][0],
+                         [PdfIntegerNumber(1), PdfIntegerNumber(0), PdfIntegerNumber(0),
+                          PdfIntegerNumber(1), PdfRealNumber(72.5), PdfIntegerNumber(-700)])
+        self.assertEqual(instructions[3][0], [PdfName('F1'), PdfIntegerNumber(12)])
+        self.assertEqual(instructions[4][0], [PdfLiteralString(b'Hello (x)A')])
+        self.assertEqual(instructions[5][0],
+                         [PdfArray([PdfLiteralString(b'A'),
+                                    PdfIntegerNumber(-250),
+                                    PdfLiteralString(b'B')])])
+        self.assertEqual(instructions[6][0], [PdfHexadecimalString(b'\x41\x40')])
+        self.assertEqual(instructions[8][0][0], PdfName(b'N x'))
+        self.assertEqual(instructions[8][0][1][PdfName('MCID')], PdfIntegerNumber(0))
+
+    # tokens split across chunks and a window smaller than tokens
+    def test_small_chunks(self):
+        expected = self._instructions([self.content])
+        chunks = [self.content[i:i+1] for i in range(0, len(self.content))]
+        self.assertEqual(self._instructions(chunks, window_size=4), expected)
+
+    def test_unbalanced_array(self):
+        with self.assertRaises(PdfConformanceException):
+            self._instructions([b'[1 2 TJ'])
+        with self.assertRaises(PdfConformanceException):
+            self._instructions([b'1 2] TJ'])
+
+    def test_stray_delimiters(self):
+        with self.assertLogs('pdfls.content', level='WARNING') as cm:
+            self.assertEqual(self._instructions([b') Tj']), [([], b'Tj')])
+        self.assertIn(') at 0 in content stream is skipped', cm.output[0])
+        with self.assertLogs('pdfls.content', level='WARNING') as cm:
+            self.assertEqual(self._instructions([b'{ } x']), [([], b'x')])
+        self.assertEqual(len(cm.output), 2)
+        with self.assertRaises(PdfConformanceException):
+            self._instructions([b'1 0 0 1 0 0 cm <</A (B) Tj'])
+
+    def test_inline_image(self):
+        # length is known, so EI in the data is not a problem
+        image = b'\x00 EI \x01' * 8
+        content = (b'q BI /W 4 /H 4 /BPC 8 /CS /RGB ID\n%s\nEI Q '
+                   b'BI /W 2 /H 2 /F /AHx ID 00ff00ff>\nEI '
+                   b'BI /W 2 /H 2 /BPC 1 /IM true ID \x00\x00EI' % image)
+        for window_size in [None, 8]:
+            chunks = [content[i:i+5] for i in range(0, len(content), 5)]
+            instructions = self._instructions(chunks, window_size=window_size)
+            self.assertEqual([operator for (operands, operator) in instructions],
+                             [b'q', b'BI', b'Q', b'BI', b'BI'])
+            (image_dictionary, data) = instructions[1][0]
+            self.assertEqual(image_dictionary[PdfName('W')], PdfIntegerNumber(4))
+            self.assertEqual(bytes(data), image)
+            # filtered, length is not known, data is up to EI
+            self.assertEqual(bytes(instructions[3][0][1]), b'00ff00ff>')
+            self.assertEqual(bytes(instructions[4][0][1]), b'\x00\x00')
+
+    def test_inline_image_without_ei(self):
+        with self.assertRaises(PdfConformanceException):
+            self._instructions([b'BI /W 2 /H 2 /F /AHx ID 00ff00ff>'])
+
+    def test_compiled_content(self):
+        content = self.content + b' BI /W 2 /H 1 /BPC 8 /CS /G ID \x01\x02 EI 9007199254740993 Tz'
+        instructions = self._instructions([content])
+        compiled_content = CompiledContent.compile(ContentStreamLexer([content]))
+        self.assertEqual(len(compiled_content), len(instructions))
+        # inline image data is bytes, not memoryview
+        self.assertEqual(compiled_content.pool[-2][1], b'\x01\x02')
+        compiled_instructions = list(compiled_content)
+        self.assertEqual(compiled_instructions[-2][0][1], b'\x01\x02')
+        self.assertEqual(compiled_instructions[:-2], instructions[:-2])
+        # not exact as a double, so it is pooled
+        self.assertEqual(compiled_instructions[-1][0], [PdfIntegerNumber(9007199254740993)])
+        self.assertEqual(compiled_content.get_operator_counts()[b'Tj'], 2)
+        (values, operator) = list(compiled_content.iter_values())[1]
+        self.assertEqual(operator, b'cm')
+        self.assertEqual(values, [1, 0, 0, 1, 72.5, -700])
+        self.assertIsInstance(values[0], int)
+        # F1 is pooled once
+        compiled_content = CompiledContent.compile(ContentStreamLexer([b'/F1 1 Tf /F1 2 Tf']))
+        self.assertEqual(compiled_content.pool, [PdfName('F1')])
+        unpickled = pickle.loads(pickle.dumps(compiled_content))
+        self.assertEqual(list(unpickled), list(compiled_content))
+
+    def test_flate_decode_chunks(self):
+        content = self.content * 1000
+        data = zlib.compress(content)
+        buffer = (b'1 0 obj\n<< /Filter /FlateDecode /Length %d >>\nstream\n%s\nendstream\nendobj' %
+                  (len(data), data))
+        stream = Parser(buffer).next().p
+        chunks = list(stream.decode_chunks(chunk_size=1024))
+        self.assertTrue(all([len(chunk) <= 1024 for chunk in chunks]))
+        self.assertEqual(b''.join(chunks), content)
+        self.assertEqual(b''.join(chunks), stream.decode())
+        stats = Stats()
+        list(stream.decode_chunks(stats=stats))
+        stream.decode(stats)
+        self.assertEqual(stats.streams_decoded, 2)
+        self.assertEqual(stats.filters['FlateDecode'].streams, 2)
+        self.assertEqual(stats.filters['FlateDecode'].encoded_bytes, 2 * len(data))
+        self.assertEqual(stats.filters['FlateDecode'].decoded_bytes, 2 * len(content))
+        # chunks not consumed to the end are counted when they are closed
+        stats = Stats()
+        chunks = stream.decode_chunks(chunk_size=1024, stats=stats)
+        next(chunks)
+        chunks.close()
+        self.assertEqual(stats.streams_decoded, 1)
+        self.assertEqual(stats.filters['FlateDecode'].decoded_bytes, 1024)
+
+    # memory used while lexing does not depend on the size of content
+    def test_bounded_memory(self):
+        line = b'BT /F1 12 Tf 72 712 Td [(Hello) -120 (World)] TJ ET\n'
+        num_chunks = 20
+        def chunks():
+            for i in range(0, num_chunks):
+                yield line * 100
+        tracemalloc.start()
+        try:
+            num_instructions = 0
+            for instruction in ContentStreamLexer(chunks(), window_size=4096):
+                num_instructions = num_instructions + 1
+            (current, peak) = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        self.assertEqual(num_instructions, 5 * 100 * num_chunks)
+        self.assertLess(peak, 1024 * 1024)
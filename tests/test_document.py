@@ -0,0 +1,519 @@
+# Copyright (C) 2024 Mete Balci
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+# pdfls: a utility to investigate PDF files
+# Copyright (C) 2024 Mete Balci
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+import os
+import tempfile
+import threading
+import unittest
+import unittest.mock
+
+from pdfls import Document
+from pdfls import indexcache
+from pdfls.decodecache import DecodeCache
+from pdfls.objstm import ObjectStreamCache
+from pdfls import workers
+from pdfls.objects import *
+from pdfls.exceptions import *
+
+from . import make_pdf
+from . import make_xref_stream_pdf
+from . import make_object_stream
+from . import append_update
+from . import make_pages_pdf
+from . import make_page_tree_pdf
+from . import make_template_pdf
+
+# used by test_map_pages, it is pickled to workers
+def _count_instructions(page):
+    return (page.ref.object_number, len(list(page.instructions())))
+
+class TestDocument(unittest.TestCase):
+
+    def setUp(self):
+        self.buffer = make_pages_pdf(20)
+        fd, self.path = tempfile.mkstemp(suffix='.pdf')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(self.buffer)
+
+    def tearDown(self):
+        os.remove(self.path)
+        index_path = indexcache.get_index_path(self.path)
+        if os.path.exists(index_path):
+            os.remove(index_path)
+
+    def test_load(self):
+        d = Document(self.buffer)
+        self.assertEqual(d.version, (1, 7))
+        self.assertEqual(len(d.objects), 42)
+        self.assertEqual(d.catalog[PdfName('Type')], PdfName('Catalog'))
+        self.assertEqual(len(d.pages), 20)
+
+    def test_open(self):
+        d = Document.open(self.path)
+        self.assertEqual(len(d.objects), 42)
+        self.assertEqual(len(d.pages), 20)
+
+    def test_split_entries(self):
+        entries = [(100 - i, i + 1, 0) for i in range(0, 10)]
+        chunks = workers.split_entries(entries, 3)
+        self.assertEqual(len(chunks), 3)
+        self.assertEqual(sum(chunks, []), sorted(entries))
+
+    def test_load_with_workers(self):
+        d1 = Document(self.buffer)
+        d2 = Document.open(self.path, workers=2)
+        self.assertEqual(set(d1.objects.keys()), set(d2.objects.keys()))
+        for ref, obj in d1.objects.items():
+            self.assertEqual(obj.p, d2.objects[ref].p)
+        self.assertEqual(len(d2.pages), 20)
+
+    # indirect Length of a stream is resolved in workers
+    def test_load_with_workers_indirect_length(self):
+        content = b'BT /F1 12 Tf (endstream) Tj ET'
+        buffer = make_pdf({1: b'<< /Type /Catalog /Pages 2 0 R >>',
+                           2: b'<< /Type /Pages /Kids [3 0 R] /Count 1 >>',
+                           3: b'<< /Type /Page /Parent 2 0 R /Contents 4 0 R >>',
+                           4: b'<< /Length 5 0 R >>\nstream\n%s\nendstream' % content,
+                           5: b'%d' % len(content)})
+        with open(self.path, 'wb') as f:
+            f.write(buffer)
+        with self.assertNoLogs('pdfls.parser', 'WARNING'):
+            d = Document.open(self.path, workers=2)
+        self.assertEqual(d.get_object(PdfIndirectReference(4, 0)).p.stream_data, content)
+
+    def test_lazy(self):
+        d = Document(self.buffer, lazy=True)
+        self.assertEqual(len(d.pages), 20)
+        obj = d.get_object(PdfIndirectReference(4, 0))
+        self.assertIsInstance(obj.p, PdfStream)
+        self.assertIs(d.get_object(PdfIndirectReference(4, 0)), obj)
+        with self.assertRaises(KeyError):
+            d.get_object(PdfIndirectReference(4, 1))
+        with self.assertRaises(KeyError):
+            d.get_object(PdfIndirectReference(100, 0))
+
+    def test_get_object_threads(self):
+        d = Document(self.buffer, lazy=True)
+        results = []
+        def run():
+            results.append([d.get_object(PdfIndirectReference(obj_num, 0))
+                            for obj_num in range(1, 43)])
+        threads = [threading.Thread(target=run) for i in range(0, 8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(results), 8)
+        for result in results:
+            for i in range(0, len(result)):
+                self.assertIs(result[i], results[0][i])
+
+    def test_no_line_index(self):
+        d = Document(self.buffer)
+        self.assertIsNone(d.parser.line_offsets)
+
+    def test_startxref_far_from_end(self):
+        # some producers pad the end of file
+        d = Document(self.buffer + b' ' * 2000)
+        self.assertEqual(len(d.pages), 20)
+
+    def test_xref_subsections(self):
+        buffer = make_pdf({1: b'<< /Type /Catalog /Pages 2 0 R >>',
+                           2: b'<< /Type /Pages /Kids [] /Count 0 >>'})
+        # split the single subsection 0 3 into 0 1 and 1 2
+        buffer = buffer.replace(b'xref\n0 3\n0000000000 65535 f\r\n',
+                                b'xref\n0 1\n0000000000 65535 f\r\n1 2\n')
+        d = Document(buffer)
+        self.assertEqual(list(d.xref), [0, 1, 2])
+        self.assertEqual(d.trailer[PdfName('Size')], PdfIntegerNumber(3))
+
+    def test_xref_stream(self):
+        buffer = make_xref_stream_pdf({1: b'<< /Type /Catalog /Pages 2 0 R >>',
+                                       2: b'<< /Type /Pages /Kids [3 0 R] /Count 1 >>',
+                                       3: b'<< /Type /Page /Parent 2 0 R >>'})
+        d = Document(buffer)
+        self.assertEqual(len(d.pages), 1)
+        self.assertEqual(d.trailer[PdfName('Type')], PdfName('XRef'))
+        self.assertIn(PdfIndirectReference(3, 0), d.objects)
+
+    def _make_object_stream_pdf(self, num_objects):
+        objects = [(obj_num, b'<< /Value %d /Ref 1 0 R >>' % obj_num)
+                   for obj_num in range(4, 4 + num_objects)]
+        compressed = {}
+        for index in range(0, num_objects):
+            compressed[4 + index] = (3, index)
+        return make_xref_stream_pdf({1: b'<< /Type /Catalog /Pages 2 0 R >>',
+                                     2: b'<< /Type /Pages /Kids [] /Count 0 >>',
+                                     3: make_object_stream(objects)},
+                                    compressed=compressed)
+
+    def test_object_stream(self):
+        d = Document(self._make_object_stream_pdf(200), lazy=True)
+        for obj_num in range(4, 204):
+            obj = d.get_object(PdfIndirectReference(obj_num, 0))
+            self.assertEqual(obj.object_number, obj_num)
+            self.assertEqual(obj.p[PdfName('Value')], PdfIntegerNumber(obj_num))
+        # decoded only once
+        self.assertEqual(d.object_streams.misses, 1)
+        self.assertEqual(d.object_streams.hits, 199)
+        with self.assertRaises(KeyError):
+            d.get_object(PdfIndirectReference(4, 1))
+
+    def test_object_stream_eager(self):
+        d = Document(self._make_object_stream_pdf(20))
+        self.assertEqual(len(d.objects), 23 + 1)
+        self.assertEqual(d.object_streams.misses, 1)
+
+    def test_object_stream_cache_budget(self):
+        d = Document(self._make_object_stream_pdf(20), lazy=True)
+        d.object_streams.max_size = 0
+        d.get_object(PdfIndirectReference(4, 0))
+        d.objects.clear()
+        d.get_object(PdfIndirectReference(5, 0))
+        self.assertEqual(d.object_streams.hits, 1)
+        self.assertEqual(len(d.object_streams), 1)
+
+    def _make_updated_pdf(self):
+        buffer = make_pdf({1: b'<< /Type /Catalog /Pages 2 0 R >>',
+                           2: b'<< /Type /Pages /Kids [] /Count 0 >>',
+                           3: b'(original)'})
+        buffer = append_update(buffer, {3: b'(first update)'})
+        buffer = append_update(buffer, {3: b'(second update)', 4: b'(new)'})
+        return buffer
+
+    def test_incremental_updates(self):
+        d = Document(self._make_updated_pdf())
+        self.assertEqual(d.get_num_revisions(), 3)
+        self.assertEqual(d.prevs[0][0], 'table')
+        self.assertEqual(len(d.xref), 5)
+        self.assertEqual(d.get_object(PdfIndirectReference(3, 0)).p,
+                         PdfLiteralString(b'second update'))
+        self.assertEqual(d.get_object(PdfIndirectReference(4, 0)).p,
+                         PdfLiteralString(b'new'))
+        self.assertEqual(len(d.objects), 4)
+
+    def test_incremental_updates_revision(self):
+        d = Document(self._make_updated_pdf())
+        ref = PdfIndirectReference(3, 0)
+        self.assertEqual(d.get_object(ref, revision=0).p, PdfLiteralString(b'original'))
+        self.assertEqual(d.get_object(ref, revision=1).p, PdfLiteralString(b'first update'))
+        self.assertEqual(d.get_object(ref, revision=2).p, PdfLiteralString(b'second update'))
+        with self.assertRaises(KeyError):
+            d.get_object(PdfIndirectReference(4, 0), revision=1)
+        with self.assertRaises(IndexError):
+            d.get_object(ref, revision=3)
+
+    def test_incremental_updates_cycle(self):
+        buffer = make_pdf({1: b'<< /Type /Catalog /Pages 2 0 R >>',
+                           2: b'<< /Type /Pages /Kids [] /Count 0 >>'})
+        objects = {1: b'<< /Type /Catalog /Pages 2 0 R >>',
+                   2: b'<< /Type /Pages /Kids [] /Count 0 >>'}
+        # Prev points to the xref of the update itself
+        xref_offset = len(buffer) + sum([len(b'%d 0 obj\n%s\nendobj\n' % (k, v))
+                                         for (k, v) in objects.items()])
+        buffer = append_update(buffer, objects, prev=xref_offset)
+        with self.assertLogs('pdfls.document', level='WARNING'):
+            d = Document(buffer)
+        self.assertEqual(d.get_num_revisions(), 1)
+
+    def test_knuth65(self):
+        d = Document.open('knuth65.pdf')
+        self.assertEqual(d.get_num_revisions(), 2)
+        self.assertEqual(len(d.pages), 33)
+
+    def test_index_cache(self):
+        d1 = Document.open(self.path, index_cache=True)
+        self.assertTrue(os.path.exists(indexcache.get_index_path(self.path)))
+        # xref and page tree are not read from the file again
+        with unittest.mock.patch.object(Document, '_find_last_xref_offset') as m:
+            d2 = Document.open(self.path, index_cache=True)
+            m.assert_not_called()
+        self.assertEqual(d2.version, d1.version)
+        self.assertEqual(list(d2.xref), list(d1.xref))
+        self.assertEqual(d2.trailer, d1.trailer)
+        self.assertEqual(d2.object_ends, d1.object_ends)
+        self.assertEqual(d2.object_types, d1.object_types)
+        self.assertEqual([page.ref for page in d2.pages],
+                         [page.ref for page in d1.pages])
+        self.assertEqual(d2.root_page.ref, d1.root_page.ref)
+        self.assertEqual(len(d2.root_page.kids), 20)
+        # objects are parsed on demand after the index is read
+        self.assertTrue(d2.lazy)
+        self.assertLess(len(d2.objects), len(d1.objects))
+        self.assertEqual(d2.get_object(PdfIndirectReference(4, 0)).p.stream_data,
+                         d1.get_object(PdfIndirectReference(4, 0)).p.stream_data)
+
+    def test_index_cache_malformed_type(self):
+        d = Document.open(self.path, index_cache=True)
+        # the parser rejects such a Type, but an object can be built without it
+        d._record_object(PdfIndirectObject(99, 0, PdfDictionary({PdfName('Type'): PdfIntegerNumber(5)})), 10)
+        self.assertNotIn(99, d.object_types)
+        d._write_index()
+        self.assertIsNotNone(indexcache.read_index(self.path))
+
+    def test_index_cache_stale(self):
+        Document.open(self.path, index_cache=True)
+        # an incremental update invalidates the index
+        buffer = append_update(self.buffer, {3: b'<< /Type /Page /Parent 2 0 R >>'})
+        with open(self.path, 'wb') as f:
+            f.write(buffer)
+        self.assertIsNone(indexcache.read_index(self.path))
+        d = Document.open(self.path, index_cache=True)
+        self.assertEqual(d.get_num_revisions(), 2)
+        index = indexcache.read_index(self.path)
+        self.assertEqual(len(index.sections), 2)
+
+    def test_index_cache_corrupted(self):
+        Document.open(self.path, index_cache=True)
+        index_path = indexcache.get_index_path(self.path)
+        with open(index_path, 'r+b') as f:
+            f.truncate(100)
+        with self.assertLogs('pdfls.indexcache', level='WARNING'):
+            self.assertIsNone(indexcache.read_index(self.path))
+        d = Document.open(self.path, index_cache=True)
+        self.assertEqual(len(d.pages), 20)
+
+    def test_hash_cons(self):
+        d1 = Document(self.buffer)
+        d2 = Document(self.buffer, hash_cons=True)
+        for ref, obj in d1.objects.items():
+            self.assertEqual(obj.p, d2.objects[ref].p)
+        media_boxes = [page.node[PdfName('MediaBox')] for page in d2.pages]
+        for media_box in media_boxes:
+            self.assertIs(media_box, media_boxes[0])
+        self.assertGreater(d2.hash_cons.bytes_saved, 0)
+        self.assertIsNone(d1.hash_cons)
+
+    def test_page(self):
+        (buffer, page_obj_nums) = make_page_tree_pdf(1000, 10)
+        d = Document(buffer, lazy=True)
+        self.assertEqual(len(d.pages), 1000)
+        # only the root is created
+        self.assertEqual(len(d._page_nodes), 1)
+        page = d.page(567)
+        self.assertEqual(page.ref.object_number, page_obj_nums[567])
+        # root, 2 intermediate nodes and the page
+        self.assertEqual(len(d._page_nodes), 4)
+        self.assertIs(d.pages[567], page)
+        self.assertEqual(d.pages[-1].ref.object_number, page_obj_nums[-1])
+        self.assertEqual([p.ref.object_number for p in d.pages[10:13]],
+                         page_obj_nums[10:13])
+        with self.assertRaises(IndexError):
+            d.page(1000)
+
+    def test_iter_pages(self):
+        (buffer, page_obj_nums) = make_page_tree_pdf(100, 3)
+        d = Document(buffer)
+        pages = iter(d.pages)
+        self.assertEqual(next(pages).ref.object_number, page_obj_nums[0])
+        # only the kids of the nodes on the path to the first page
+        self.assertLess(len(d._page_nodes), 20)
+        self.assertEqual([page.ref.object_number for page in d.pages], page_obj_nums)
+
+    def test_page_tree_cycle(self):
+        buffer = make_pdf({1: b'<< /Type /Catalog /Pages 2 0 R >>',
+                           2: b'<< /Type /Pages /Kids [3 0 R 4 0 R] /Count 2 >>',
+                           3: b'<< /Type /Page /Parent 2 0 R >>',
+                           4: b'<< /Type /Pages /Parent 2 0 R /Kids [2 0 R] /Count 1 >>'})
+        d = Document(buffer)
+        with self.assertRaises(PdfConformanceException):
+            list(d.pages)
+        with self.assertRaises(PdfConformanceException):
+            list(d.iter_page_refs())
+
+    def test_page_tree_depth(self):
+        (buffer, page_obj_nums) = make_page_tree_pdf(100, 3)
+        d = Document(buffer)
+        self.assertEqual([ref.object_number for ref in d.iter_page_refs()], page_obj_nums)
+        with unittest.mock.patch('pdfls.document.PAGE_TREE_MAX_DEPTH', 2):
+            with self.assertRaises(PdfConformanceException):
+                list(d.iter_page_refs())
+            with self.assertRaises(PdfConformanceException):
+                d.page(50)
+
+    # page tree nodes are walked without keeping them
+    def test_iter_page_refs_lazy(self):
+        (buffer, page_obj_nums) = make_page_tree_pdf(100, 3)
+        d = Document(buffer, lazy=True)
+        num_objects = len(d.objects)
+        self.assertEqual([ref.object_number for ref in d.iter_page_refs()], page_obj_nums)
+        self.assertEqual(len(d.objects), num_objects)
+
+    def test_inherited_attributes(self):
+        buffer = make_pdf({1: b'<< /Type /Catalog /Pages 2 0 R >>',
+                           2: b'<< /Type /Pages /Kids [3 0 R] /Count 3 /Resources 7 0 R /Rotate 90 >>',
+                           3: b'<< /Type /Pages /Parent 2 0 R /Kids [4 0 R 5 0 R 6 0 R] /Count 3 '
+                              b'/MediaBox [0 0 612 792] >>',
+                           4: b'<< /Type /Page /Parent 3 0 R >>',
+                           5: b'<< /Type /Page /Parent 3 0 R >>',
+                           6: b'<< /Type /Page /Parent 3 0 R /CropBox [0 0 100 100] '
+                              b'/Resources << >> /Rotate 0 >>',
+                           7: b'<< /Font << >> >>'})
+        d = Document(buffer)
+        (page1, page2, page3) = list(d.pages)
+        self.assertEqual(page1.resources, PdfDictionary({PdfName('Font'): PdfDictionary()}))
+        self.assertTrue(page1.is_resources_inherited())
+        self.assertEqual(page1.media_box[2], PdfIntegerNumber(612))
+        self.assertIs(page1.crop_box, page1.media_box)
+        self.assertEqual(page1.rotate, 90)
+        # shared with the parent, not copied
+        self.assertIs(page1.inherited_attributes, page1.parent.inherited_attributes)
+        self.assertIs(page2.inherited_attributes, page1.inherited_attributes)
+        self.assertEqual(page3.resources, PdfDictionary())
+        self.assertFalse(page3.is_resources_inherited())
+        self.assertEqual(page3.crop_box[2], PdfIntegerNumber(100))
+        self.assertIs(page3.media_box, page1.media_box)
+        self.assertEqual(page3.rotate, 0)
+
+    def test_page_instructions(self):
+        d = Document(self.buffer)
+        page = d.pages[0]
+        self.assertEqual([operator for (operands, operator) in page.instructions()],
+                         [b'BT', b'Tf', b'Tj', b'ET'])
+        compiled_content = page.compiled_content
+        # compiled once per page
+        self.assertIs(page.compiled_content, compiled_content)
+        self.assertEqual(list(compiled_content), list(page.instructions()))
+
+    def test_decode_cache(self):
+        d = Document(make_template_pdf(500))
+        for page in d.pages:
+            for (operands, operator) in page.compiled_content:
+                if operator == b'Do':
+                    ref = page.get_resource('XObject', operands[0])
+                    form = d.get_compiled_content(ref)
+                    self.assertEqual(form.get_operator_counts()[b'Tj'], 1)
+                    font = d.get_font(page.get_resource('Font', PdfName('F1')))
+                    self.assertEqual(font.base_font, b'Helvetica')
+        self.assertEqual(d.decode_cache.loads['content'], 1)
+        self.assertEqual(d.decode_cache.loads['font'], 1)
+        self.assertEqual(d.decode_cache.hits, 998)
+        self.assertAlmostEqual(d.decode_cache.get_hit_rate(), 998 / 1000)
+        self.assertEqual(d.get_decoded_stream(ref), b'BT /F1 10 Tf (Footer) Tj ET')
+
+    def test_stats(self):
+        d = Document(make_template_pdf(10))
+        self.assertEqual(d.stats.objects_cached, len(d.objects))
+        self.assertGreaterEqual(d.stats.objects_parsed, len(d.objects))
+        self.assertGreater(d.stats.tokens, 0)
+        hits = d.stats.object_cache_hits
+        d.get_object(PdfIndirectReference(1, 0))
+        self.assertEqual(d.stats.object_cache_hits, hits + 1)
+        for page in d.pages:
+            list(page.instructions())
+        stats = d.stats.to_dict()
+        self.assertEqual(stats['streams']['decoded'], 10)
+        self.assertEqual(stats['streams']['decoded_bytes'],
+                         sum(len(page.get_content_streams()[0].decode()) for page in d.pages))
+        self.assertEqual(stats['streams']['filters'], {})
+        # decoding on access to p is counted
+        d.get_object(PdfIndirectReference(3, 0)).p.p
+        self.assertEqual(d.stats.streams_decoded, 11)
+
+    def test_stats_disabled(self):
+        d = Document(make_template_pdf(10), stats=False)
+        self.assertIsNone(d.stats)
+        self.assertEqual(list(d.iter_text()), ['Footer\n'] * 10)
+        d.get_object(PdfIndirectReference(3, 0)).p.p
+
+    def test_decode_cache_eviction(self):
+        cache = DecodeCache(max_size=10)
+        self.assertEqual(cache.get(('stream', 1), lambda: b'123456'), b'123456')
+        self.assertEqual(cache.get(('stream', 2), lambda: b'abcdef'), b'abcdef')
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(cache.evictions, 1)
+        self.assertEqual(cache.get(('stream', 1), lambda: b'654321'), b'654321')
+        self.assertEqual(cache.misses, 3)
+
+    def test_decode_cache_concurrent_loads(self):
+        cache = DecodeCache()
+        started = threading.Event()
+        loads = []
+        # the load of key 1 waits until key 2 is loaded in another thread
+        def load_1():
+            loads.append(1)
+            started.set()
+            self.assertTrue(loaded_2.wait(5))
+            return b'1'
+        loaded_2 = threading.Event()
+        def load_2():
+            loads.append(2)
+            loaded_2.set()
+            return b'2'
+        results = []
+        def get(key, load):
+            results.append(cache.get(('stream', key), load))
+        threads = [threading.Thread(target=get, args=(1, load_1))]
+        threads[0].start()
+        self.assertTrue(started.wait(5))
+        # key 1 is being loaded, this thread waits for it instead of loading it again
+        threads.append(threading.Thread(target=get, args=(1, load_1)))
+        threads.append(threading.Thread(target=get, args=(2, load_2)))
+        for thread in threads[1:]:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(sorted(results), [b'1', b'1', b'2'])
+        self.assertEqual(loads, [1, 2])
+        self.assertEqual(cache.loads['stream'], 2)
+        with self.assertRaises(ValueError):
+            cache.get(('stream', 4), lambda: int('x'))
+        self.assertEqual(cache.get(('stream', 4), lambda: b'4'), b'4')
+
+    def test_object_stream_cache_concurrent_loads(self):
+        loaded_2 = threading.Event()
+        loads = []
+        # the load of key 1 waits until key 2 is loaded in another thread
+        def load(key):
+            loads.append(key)
+            if key == 1:
+                self.assertTrue(loaded_2.wait(5))
+            else:
+                loaded_2.set()
+            return unittest.mock.Mock(size=lambda: 1, key=key)
+        cache = ObjectStreamCache(load)
+        results = []
+        threads = [threading.Thread(target=lambda key=key: results.append(cache.get(key).key))
+                   for key in (1, 1, 2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(sorted(results), [1, 1, 2])
+        self.assertEqual(sorted(loads), [1, 2])
+
+    def test_map_pages(self):
+        d = Document.open(self.path)
+        expected = [(3 + 2 * n, 4) for n in range(0, 20)]
+        self.assertEqual(list(d.map_pages(_count_instructions)), expected)
+        self.assertEqual(list(d.map_pages(_count_instructions, workers=2)), expected)
+        self.assertEqual(list(d.map_pages(_count_instructions, workers=2, pages=range(5, 8))),
+                         expected[5:8])
+        self.assertEqual(list(d.map_pages(_count_instructions, pages=range(1, 20, 3))),
+                         expected[1:20:3])
+        # leaf pages are created only in workers
+        d = Document.open(self.path, lazy=True)
+        self.assertEqual(list(d.map_pages(_count_instructions, workers=2, pages=range(1, 20, 3))),
+                         expected[1:20:3])
+        self.assertFalse(any(page.is_page() for page in d._page_nodes.values()))
+        # results are streamed, not consumed to the end
+        results = d.map_pages(_count_instructions, workers=2)
+        self.assertEqual(next(results), expected[0])
+        results.close()
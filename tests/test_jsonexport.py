@@ -0,0 +1,77 @@
+# Copyright (C) 2024 Mete Balci
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+# pdfls: a utility to investigate PDF files
+# Copyright (C) 2024 Mete Balci
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+import io
+import json
+import unittest
+
+from pdfls import Document
+from pdfls import Parser
+from pdfls.jsonexport import to_json
+from pdfls.jsonexport import write_json
+from pdfls.objects import *
+
+from . import make_pdf
+from . import make_pages_pdf
+
+class TestJsonExport(unittest.TestCase):
+
+    def test_to_json(self):
+        obj = Parser(b'<< /Type /Page /Kids [3 0 R] /Count 1.5 /T (abc) /H <00ff> '
+                     b'/U <feff00e9> /B true /A [null] >>').next()
+        self.assertEqual(to_json(obj), {'Type': '/Page',
+                                        'Kids': [{'ref': [3, 0]}],
+                                        'Count': 1.5,
+                                        'T': {'string': 'abc'},
+                                        'H': {'hex': '00ff'},
+                                        'U': {'string': 'é'},
+                                        'B': True,
+                                        'A': [None]})
+
+    def test_stream_data(self):
+        buffer = b'1 0 obj\n<< /Length 3 >>\nstream\nabc\nendstream\nendobj'
+        stream = Parser(buffer).next().p
+        self.assertEqual(to_json(stream)['stream'],
+                         {'length': 3,
+                          'sha256': 'ba7816bf8f01cfea414140de5dae2223b00361a396177a9cb410ff61f20015ad'})
+        self.assertEqual(to_json(stream, 'base64')['stream'], {'length': 3, 'data': 'YWJj'})
+        self.assertEqual(to_json(stream, 'none')['stream'], {'length': 3})
+
+    # objects are written, not kept in document
+    def test_write_json(self):
+        d = Document(make_pages_pdf(3), lazy=True)
+        out = io.StringIO()
+        write_json(d, out)
+        document = json.loads(out.getvalue())
+        self.assertEqual(list(document), ['header', 'trailers', 'xref', 'objects', 'pages'])
+        self.assertEqual(len(document['xref']), 9)
+        self.assertEqual(document['xref'][0]['type'], 'free')
+        self.assertEqual(len(document['pages']), 3)
+        self.assertLess(len(d.objects), 3)
+
+    def test_write_json_empty_sections(self):
+        d = Document(make_pdf({1: b'<< /Type /Catalog /Pages 2 0 R >>',
+                               2: b'<< /Type /Pages /Kids [] /Count 0 >>'}), lazy=True)
+        out = io.StringIO()
+        write_json(d, out)
+        document = json.loads(out.getvalue())
+        self.assertEqual(list(document), ['header', 'trailers', 'xref', 'objects', 'pages'])
+        self.assertEqual(document['pages'], [])
+        self.assertEqual(len(document['objects']), 2)
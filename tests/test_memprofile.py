@@ -0,0 +1,59 @@
+# Copyright (C) 2024 Mete Balci
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+# pdfls: a utility to investigate PDF files
+# Copyright (C) 2024 Mete Balci
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+import tracemalloc
+import unittest
+
+from pdfls import Document
+from pdfls import phases
+from pdfls.memprofile import MemoryProfiler
+
+from . import make_pages_pdf
+
+class TestMemoryProfiler(unittest.TestCase):
+
+    def test_phases(self):
+        buffer = make_pages_pdf(50)
+        profiler = phases.enable(MemoryProfiler())
+        try:
+            with phases.phase('open'):
+                d = Document(buffer)
+            with phases.phase('outer'):
+                with phases.phase('inner'):
+                    data = bytearray(1024 * 1024)
+                del data
+        finally:
+            phases.disable()
+            profiler.close()
+        self.assertFalse(tracemalloc.is_tracing())
+        stats = profiler.to_dict()
+        self.assertTrue({'header', 'xref', 'objects', 'catalog', 'page tree'} <= set(stats['phases']))
+        self.assertGreater(stats['phases']['objects']['retained'], 0)
+        self.assertGreater(stats['phases']['objects']['bytes'], 0)
+        # objects are parsed in open, they are retained by the document
+        self.assertGreater(stats['phases']['open']['retained'], 0)
+        self.assertTrue(stats['phases']['open']['top_sites'][0]['site'].startswith('pdfls/'))
+        # peak of a nested phase is also the peak of the outer phase
+        self.assertGreaterEqual(stats['phases']['inner']['peak'], 1024 * 1024)
+        self.assertGreaterEqual(stats['phases']['outer']['peak'], 1024 * 1024)
+        self.assertLess(stats['phases']['outer']['retained'], 1024)
+        self.assertEqual(stats['phases']['inner']['top_sites'], [])
+        self.assertGreaterEqual(stats['peak'], 1024 * 1024)
+        self.assertEqual(len(d.pages), 50)
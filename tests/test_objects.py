@@ -0,0 +1,61 @@
+# Copyright (C) 2024 Mete Balci
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+# pdfls: a utility to investigate PDF files
+# Copyright (C) 2024 Mete Balci
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+import pickle
+import unittest
+
+from pdfls.objects import *
+
+class TestObjects(unittest.TestCase):
+
+    def test_scalars_are_immutable(self):
+        for obj in [PdfBoolean(True),
+                    PdfIntegerNumber(1),
+                    PdfRealNumber(1.5),
+                    PdfLiteralString(b'a'),
+                    PdfHexadecimalString(b'a'),
+                    PdfName(b'a'),
+                    PdfNull(),
+                    PdfIndirectReference(1, 0)]:
+            self.assertFalse(hasattr(obj, '__dict__'))
+            with self.assertRaises(AttributeError):
+                obj.p = 2
+            self.assertEqual(pickle.loads(pickle.dumps(obj)), obj)
+
+    def test_indirect_reference(self):
+        ref = PdfIndirectReference(12, 3)
+        self.assertEqual(ref.p, (12, 3))
+        self.assertEqual(ref.object_number, 12)
+        self.assertEqual(ref.generation_number, 3)
+        self.assertEqual(ref, PdfIndirectReference(12, 3))
+        self.assertNotEqual(ref, PdfIndirectReference(12, 0))
+        self.assertEqual(hash(ref), hash(PdfIndirectReference(12, 3)))
+        self.assertEqual('%s' % ref, '(12, 3)')
+        with self.assertRaises(AttributeError):
+            ref.object_number = 1
+
+    def test_containers_own_storage(self):
+        a1 = PdfArray()
+        a1.append(PdfIntegerNumber(1))
+        self.assertEqual(len(PdfArray().p), 0)
+        d1 = PdfDictionary()
+        d1[PdfName('Type')] = PdfName('Page')
+        self.assertNotIn(PdfName('Type'), PdfDictionary())
+        self.assertFalse(hasattr(d1, '__dict__'))
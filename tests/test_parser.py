@@ -22,6 +22,7 @@ import unittest
 
 from pdfls import Parser
 from pdfls.objects import *
+from pdfls.hashcons import HashConsTable
 
 class TestParser(unittest.TestCase):
 
@@ -209,3 +210,63 @@ endobj
         self.assertEqual(obj.object_number, 12)
         self.assertEqual(obj.generation_number, 0)
         self.assertEqual(obj.p, PdfLiteralString(b'Brillig'))
+
+    def test_parse_object_at(self):
+        buffer = b'1 0 obj\n(first)\nendobj\n2 0 obj\n[1 2]\nendobj\n'
+        p = Parser(buffer)
+        (obj, end_offset) = p.parse_object_at(buffer.index(b'2 0 obj'))
+        self.assertEqual(obj.object_number, 2)
+        self.assertEqual(obj.p, PdfArray([PdfIntegerNumber(1), PdfIntegerNumber(2)]))
+        self.assertEqual(end_offset, len(buffer))
+        # parser state is not changed
+        self.assertEqual(p.tell(), 0)
+        (obj, end_offset) = p.parse_object_at(0)
+        self.assertEqual(obj.p, PdfLiteralString(b'first'))
+        self.assertEqual(buffer[end_offset:end_offset+1], b'2')
+
+    def test_read_line_at(self):
+        buffer = b'abc\ndef\r\nghi\rjkl'
+        p = Parser(buffer)
+        self.assertEqual(p.read_line_at(0), (b'abc', 4))
+        self.assertEqual(p.read_line_at(4), (b'def', 9))
+        self.assertEqual(p.read_line_at(9), (b'ghi', 13))
+        self.assertEqual(p.read_line_at(13), (b'jkl', 16))
+        self.assertEqual(p.read_line_at(16), (None, 16))
+        self.assertEqual(Parser(b'abc\r').read_line_at(0), (b'abc', 4))
+
+    def test_hash_cons(self):
+        buffer = (b'[<< /MediaBox [0 0 612 792] /Type /Page >> '
+                  b'<< /MediaBox [0 0 612 792] /Type /Page >> '
+                  b'[0 0 612.0 792] 1 0 R 1 0 R]')
+        hash_cons = HashConsTable()
+        p = Parser(buffer, hash_cons=hash_cons)
+        obj = p.next()
+        self.assertIs(obj[0], obj[1])
+        self.assertIs(obj[0][PdfName('MediaBox')][0], obj[0][PdfName('MediaBox')][1])
+        self.assertIs(obj[3], obj[4])
+        # equal but not identical, real is not integer
+        self.assertIsNot(obj[2], obj[0][PdfName('MediaBox')])
+        self.assertIsInstance(obj[2][2], PdfRealNumber)
+        self.assertTrue(obj[0].frozen)
+        # larger containers are not hash-consed
+        hash_cons.max_container_size = 4
+        p.seek(0)
+        obj = p.next()
+        self.assertFalse(obj.frozen)
+        with self.assertRaises(AssertionError):
+            obj[0][PdfName('Type')] = PdfName('Pages')
+        self.assertGreater(hash_cons.hits, 0)
+        self.assertGreater(hash_cons.bytes_saved, 0)
+
+    def test_reference_array(self):
+        p = Parser(b'[1 0 R\r\n2 5 R\x00 3 0 R ]/Next')
+        obj = p.next()
+        self.assertEqual(obj, PdfArray([PdfIndirectReference(1, 0),
+                                        PdfIndirectReference(2, 5),
+                                        PdfIndirectReference(3, 0)]))
+        self.assertEqual(p.next(), PdfName('Next'))
+        # not only references
+        p = Parser(b'[1 0 R 2]')
+        obj = p.next()
+        self.assertEqual(obj, PdfArray([PdfIndirectReference(1, 0),
+                                        PdfIntegerNumber(2)]))
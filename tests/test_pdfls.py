@@ -0,0 +1,146 @@
+# Copyright (C) 2024 Mete Balci
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+# pdfls: a utility to investigate PDF files
+# Copyright (C) 2024 Mete Balci
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import unittest
+import unittest.mock
+
+from pdfls.pdfls import run
+from pdfls.pdfls import page_ranges
+
+from . import make_pages_pdf
+
+class TestPdfls(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.pdf')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(make_pages_pdf(20))
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def _run(self, *args, err=None):
+        out = io.StringIO()
+        if err is None:
+            err = io.StringIO()
+        with unittest.mock.patch.object(sys, 'argv', ['pdfls', self.path] + list(args)):
+            with contextlib.redirect_stdout(out), contextlib.redirect_stderr(err):
+                self.assertEqual(run(), 0)
+        return out.getvalue()
+
+    def test_page_ranges(self):
+        self.assertEqual(page_ranges('3'), [range(2, 3)])
+        self.assertEqual(page_ranges('1,10-20'), [range(0, 1), range(9, 20)])
+        with self.assertRaises(argparse.ArgumentTypeError):
+            page_ranges('0')
+        with self.assertRaises(argparse.ArgumentTypeError):
+            page_ranges('5-3')
+        with self.assertRaises(argparse.ArgumentTypeError):
+            page_ranges('a')
+
+    def test_all_pages(self):
+        out = self._run()
+        self.assertIn('Final XREF contains 42 objects', out)
+        self.assertIn('Page #20 contains 4 instructions', out)
+
+    def test_pages(self):
+        out = self._run('--pages', '3,5-6')
+        self.assertIn('Final XREF contains 42 objects', out)
+        self.assertEqual([line for line in out.splitlines() if line.endswith(' instructions')],
+                         ['Page #3 contains 4 instructions',
+                          'Page #5 contains 4 instructions',
+                          'Page #6 contains 4 instructions'])
+
+    def test_summary_only(self):
+        out = self._run('--summary-only')
+        self.assertIn('PDF contains 20 pages:', out)
+        self.assertNotIn('Page #1', out)
+
+    def test_object(self):
+        out = self._run('--object', '4', '0', '--object', '3', '0')
+        self.assertIn('Object (4, 0):\n{} stream[', out)
+        self.assertIn('Object (3, 0):', out)
+        self.assertNotIn('PDF contains', out)
+
+    def test_json(self):
+        out = self._run('--json')
+        document = json.loads(out)
+        self.assertEqual(document['header'], {'version': '1.7'})
+        self.assertEqual(len(document['objects']), 42)
+        self.assertEqual(document['pages'][1], {'index': 1, 'ref': [5, 0]})
+
+    def test_json_lines(self):
+        out = self._run('--json-lines', '--stream-data', 'base64')
+        records = [json.loads(line) for line in out.splitlines()]
+        self.assertEqual([record['kind'] for record in records[0:2]], ['header', 'trailer'])
+        self.assertEqual(len([record for record in records if record['kind'] == 'object']), 42)
+        stream = [record for record in records if record['kind'] == 'object'][3]['value']['stream']
+        self.assertEqual(stream['data'], 'QlQgL0YxIDEyIFRmIChIZWxsbykgVGogRVQ=')
+
+    def test_profile(self):
+        err = io.StringIO()
+        (fd, trace_path) = tempfile.mkstemp(suffix='.json')
+        os.close(fd)
+        try:
+            out = self._run('--profile', '--profile-trace', trace_path, err=err)
+            with open(trace_path) as f:
+                trace = json.load(f)
+        finally:
+            os.remove(trace_path)
+        self.assertIn('PDF contains 20 pages:', out)
+        report = {line[0:20].strip(): line[20:].split() for line in err.getvalue().splitlines()[1:-2]}
+        self.assertEqual(report['header'][0], '1')
+        self.assertEqual(report['stream decode'][0], '20')
+        self.assertGreater(int(report['objects'][3]), 0)
+        self.assertIn('total', err.getvalue())
+        names = set(event['name'] for event in trace['traceEvents'])
+        self.assertTrue({'header', 'xref', 'objects', 'catalog', 'page tree', 'summary'} <= names)
+
+    def test_stats(self):
+        err = io.StringIO()
+        self._run('--summary-only', '--stats', 'json', err=err)
+        stats = json.loads(err.getvalue())
+        self.assertEqual(stats['objects']['cache_misses'], 2)
+        self.assertGreater(stats['tokenizer']['tokens'], 0)
+
+    def test_memprofile(self):
+        err = io.StringIO()
+        out = self._run('--memprofile', 'json', err=err)
+        self.assertIn('PDF contains 20 pages:', out)
+        memprofile = json.loads(err.getvalue())
+        self.assertGreater(memprofile['peak'], 0)
+        self.assertGreater(memprofile['phases']['objects']['retained'], 0)
+        self.assertEqual(memprofile['phases']['summary']['calls'], 1)
+
+    def test_selection_not_in_document(self):
+        for args in (('--pages', '3,21'), ('--object', '99', '0'), ('--object', '4', '1')):
+            err = io.StringIO()
+            with self.assertRaises(SystemExit) as cm:
+                self._run(*args, err=err)
+            self.assertEqual(cm.exception.code, 2)
+            self.assertIn('not in the document', err.getvalue())
+            self.assertNotIn('Traceback', err.getvalue())
@@ -0,0 +1,101 @@
+# Copyright (C) 2024 Mete Balci
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+# pdfls: a utility to investigate PDF files
+# Copyright (C) 2024 Mete Balci
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+import os
+import tempfile
+import unittest
+
+from pdfls import Document
+from pdfls.objects import *
+from pdfls.exceptions import *
+from pdfls.jsonexport import to_json
+
+from . import make_xref_stream_pdf
+from . import make_object_stream
+
+class TestSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        objects = {1: b'<< /Type /Catalog /Pages 2 0 R >>',
+                   2: b'<< /Type /Pages /Kids [3 0 R] /Count 1 >>',
+                   3: b'<< /Type /Page /Parent 2 0 R /Contents 4 0 R /MediaBox [0 0 612.5 -792] >>',
+                   4: b'<< /Length 11 >>\nstream\nBT (Hi) ET\n\nendstream',
+                   5: make_object_stream([(6, b'<< /A (abc) /B <00ff> /C [true false null] /D 7 0 R >>')])}
+        buffer = make_xref_stream_pdf(objects, compressed={6: (5, 0)})
+        (fd, self.path) = tempfile.mkstemp(suffix='.pdf')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(buffer)
+        self.snapshot_path = self.path + '.snapshot'
+
+    def tearDown(self):
+        os.remove(self.path)
+        if os.path.exists(self.snapshot_path):
+            os.remove(self.snapshot_path)
+
+    def test_save_load(self):
+        d = Document.open(self.path)
+        d.save_snapshot(self.snapshot_path)
+        s = Document.load_snapshot(self.snapshot_path)
+        # objects are decoded when they are accessed
+        self.assertLess(len(s.objects), len(d.objects))
+        # and the xref stream
+        self.assertEqual(len(s.snapshot), 7)
+        for ref in d.objects:
+            self.assertEqual(to_json(s.get_object(ref).p, 'base64'),
+                             to_json(d.get_object(ref).p, 'base64'))
+        self.assertEqual(s.get_object(PdfIndirectReference(4, 0)).p.decode(), b'BT (Hi) ET\n')
+        self.assertEqual(len(s.pages), 1)
+        self.assertEqual(s.pages[0].media_box[3], PdfIntegerNumber(-792))
+        # names are shared
+        catalog = s.get_object(PdfIndirectReference(1, 0)).p
+        self.assertIs(next(iter(catalog.p)), s.snapshot.names[0])
+
+    # objects are written as they are parsed, they are not kept
+    def test_save_lazy(self):
+        d = Document.open(self.path, lazy=True)
+        num_objects = len(d.objects)
+        d.save_snapshot(self.snapshot_path)
+        # also page tree nodes walked for the index
+        self.assertEqual(len(d.objects), num_objects)
+        s = Document.load_snapshot(self.snapshot_path)
+        self.assertEqual(len(s.snapshot), 7)
+        self.assertEqual(s.snapshot.index.object_types[3], b'Page')
+        self.assertEqual(s.get_object(PdfIndirectReference(6, 0)).p[PdfName('A')], PdfLiteralString(b'abc'))
+
+    def test_truncated(self):
+        Document.open(self.path).save_snapshot(self.snapshot_path)
+        with open(self.snapshot_path, 'r+b') as f:
+            f.truncate(os.path.getsize(self.snapshot_path) - 3)
+        with self.assertRaises(SnapshotException):
+            Document.load_snapshot(self.snapshot_path)
+
+    def test_stale(self):
+        Document.open(self.path).save_snapshot(self.snapshot_path)
+        with open(self.path, 'ab') as f:
+            f.write(b'\n')
+        with self.assertRaises(SnapshotException):
+            Document.load_snapshot(self.snapshot_path)
+
+    def test_corrupted(self):
+        Document.open(self.path).save_snapshot(self.snapshot_path)
+        with open(self.snapshot_path, 'r+b') as f:
+            f.write(b'X')
+        with self.assertRaises(SnapshotException):
+            Document.load_snapshot(self.snapshot_path)
@@ -0,0 +1,111 @@
+# Copyright (C) 2024 Mete Balci
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+# pdfls: a utility to investigate PDF files
+# Copyright (C) 2024 Mete Balci
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+import os
+import tempfile
+import unittest
+
+from pdfls import Document
+from pdfls import indexcache
+from pdfls.cmap import ToUnicodeCMap
+from pdfls.objects import *
+
+from . import make_pdf
+from . import make_pages_pdf
+from . import make_template_pdf
+
+TO_UNICODE = (b'/CIDInit /ProcSet findresource begin 12 dict begin begincmap\n'
+              b'1 begincodespacerange <0000> <FFFF> endcodespacerange\n'
+              b'2 beginbfchar <0003> <0020> <0024> <0041> endbfchar\n'
+              b'3 beginbfrange <0044> <0046> <0061> <1000> <2000> <4E00>\n'
+              b'<0050> <0051> [<00660069> <D83DDE00>] endbfrange\n'
+              b'endcmap CMapName currentdict /CMap defineresource pop end end')
+
+class TestText(unittest.TestCase):
+
+    def test_to_unicode_cmap(self):
+        cmap = ToUnicodeCMap(TO_UNICODE)
+        self.assertEqual(cmap.code_lengths, [2])
+        # bfrange <1000> <2000> is not expanded
+        self.assertEqual(len(cmap.range_starts), 1)
+        self.assertEqual(cmap.decode(b'\x00\x24\x00\x03\x00\x45\x10\x01\x00\x50\x00\x51\x09\x99'),
+                         'A b丁fi\U0001f600�')
+
+    def test_to_unicode_cmap_mixed_code_lengths(self):
+        cmap = ToUnicodeCMap(b'2 begincodespacerange <00> <80> <8140> <9ffc> endcodespacerange\n'
+                             b'2 beginbfchar <41> <0041> <8140> <3000> endbfchar')
+        self.assertEqual(cmap.decode(b'A\x81\x40A'), 'A　A')
+
+    def test_extract_text(self):
+        content = (b'BT /F1 12 Tf 72 712 Td (Hello) Tj [(W) 10 (or) -300 (ld)] TJ 0 -14 Td '
+                   b'/F2 12 Tf <00240003004400450046> Tj ET')
+        buffer = make_pdf({1: b'<< /Type /Catalog /Pages 2 0 R >>',
+                           2: b'<< /Type /Pages /Kids [3 0 R] /Count 1 >>',
+                           3: b'<< /Type /Page /Parent 2 0 R /Contents 4 0 R '
+                              b'/Resources << /Font << /F1 5 0 R /F2 6 0 R >> >> >>',
+                           4: b'<< /Length %d >>\nstream\n%s\nendstream' % (len(content), content),
+                           5: b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>',
+                           6: b'<< /Type /Font /Subtype /Type0 /BaseFont /X /Encoding /Identity-H '
+                              b'/ToUnicode 7 0 R >>',
+                           7: b'<< /Length %d >>\nstream\n%s\nendstream' % (len(TO_UNICODE), TO_UNICODE)})
+        d = Document(buffer)
+        self.assertEqual(d.pages[0].extract_text(), 'HelloWor ld\nA abc\n')
+
+    # text of a Form XObject, its font is read once
+    def test_iter_text(self):
+        d = Document(make_template_pdf(10))
+        texts = list(d.iter_text())
+        self.assertEqual(texts, ['Footer\n'] * 10)
+        self.assertEqual(d.decode_cache.loads['font'], 1)
+        self.assertEqual(d.decode_cache.loads['content'], 1)
+
+    # pages and their contents are not kept while text is extracted
+    def test_iter_text_memory(self):
+        buffer = make_pages_pdf(100)
+        fd, path = tempfile.mkstemp(suffix='.pdf')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(buffer)
+        try:
+            Document.open(path, index_cache=True)
+            # page tree is walked, or leaf pages are read from the index
+            for d in (Document(buffer, lazy=True),
+                      Document.open(path, index_cache=True)):
+                num_objects = len(d.objects)
+                num_page_nodes = len(d._page_nodes)
+                with self.assertLogs('pdfls.text', 'WARNING'):
+                    self.assertEqual(len(list(d.iter_text())), 100)
+                self.assertEqual(len(d.objects), num_objects)
+                self.assertEqual(len(d._page_nodes), num_page_nodes)
+        finally:
+            os.remove(path)
+            os.remove(indexcache.get_index_path(path))
+
+    # a direct font dictionary is read once, not on each Tf
+    def test_direct_font(self):
+        content = b'BT /F1 12 Tf (a) Tj /F1 12 Tf (b) Tj ET'
+        buffer = make_pdf({1: b'<< /Type /Catalog /Pages 2 0 R >>',
+                           2: b'<< /Type /Pages /Kids [3 0 R] /Count 1 >>',
+                           3: b'<< /Type /Page /Parent 2 0 R /Contents 4 0 R '
+                              b'/Resources << /Font << /F1 << /Type /Font /Subtype /Type1 '
+                              b'/BaseFont /Helvetica >> >> >> >>',
+                           4: b'<< /Length %d >>\nstream\n%s\nendstream' % (len(content), content)})
+        d = Document(buffer)
+        self.assertEqual(d.pages[0].extract_text(), 'ab\n')
+        self.assertEqual(d.decode_cache.loads['font'], 1)
@@ -21,6 +21,7 @@
 import unittest
 
 from pdfls import Tokenizer
+from pdfls.stats import Stats
 from pdfls.tokens import *
 
 class TestTokenizer(unittest.TestCase):
@@ -35,6 +36,22 @@ class TestTokenizer(unittest.TestCase):
         t = Tokenizer(buffer)
         self.assertIsInstance(t.next(), TokenLiteral)
 
+    def test_stats(self):
+        t = Tokenizer(b'[1 2] % comment\n3', stats=Stats())
+        tokens = [t.next() for i in range(0, 6)]
+        self.assertIsNone(tokens[-1])
+        self.assertEqual(t.stats.tokens, 5)
+        # ] ending 2 is read again, it is not a seek
+        self.assertEqual(t.stats.seeks, 0)
+        self.assertEqual(t.stats.rollbacks, 0)
+        self.assertEqual(t.stats.bytes_scanned, 17)
+        t.seek(1)
+        self.assertEqual(t.stats.rollbacks, 1)
+        # nothing is counted without stats
+        t = Tokenizer(b'[1 2]')
+        self.assertIsNone(t.stats)
+        self.assertIsInstance(t.next(), TokenArrayStart)
+
     def test_solidus(self):
         buffer = '/'.encode('ascii')
         t = Tokenizer(buffer)
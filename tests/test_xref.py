@@ -0,0 +1,114 @@
+# Copyright (C) 2024 Mete Balci
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+# pdfls: a utility to investigate PDF files
+# Copyright (C) 2024 Mete Balci
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+import unittest
+
+from array import array
+
+from pdfls.xref import *
+from pdfls.predictors import decode_predictor
+
+from . import png_up_encode
+
+class TestXref(unittest.TestCase):
+
+    def test_parse_xref_subsection(self):
+        buffer = (b'xx' +
+                  b'0000000000 65535 f\r\n' +
+                  b'0000000017 00000 n \n' +
+                  b'0000000081 00002 n \r' +
+                  b'trailer')
+        (offsets, generations, types, end) = parse_xref_subsection(buffer, 2, 3)
+        self.assertEqual(list(offsets), [0, 17, 81])
+        self.assertEqual(list(generations), [65535, 0, 2])
+        self.assertEqual(types, bytes([ENTRY_FREE, ENTRY_IN_USE, ENTRY_IN_USE]))
+        self.assertEqual(buffer[end:], b'trailer')
+
+    def test_parse_xref_subsection_not_fixed_stride(self):
+        # 19 bytes entries, EOL is a single character
+        buffer = b'0000000000 65535 f\n0000000017 00000 n\n'
+        self.assertIsNone(parse_xref_subsection(buffer, 0, 2))
+
+    def test_xref_table(self):
+        xref = XrefTable()
+        xref.set_subsection(3, array('q', [10, 20]), array('H', [0, 1]), b'\x02\x01')
+        xref.set(1, 5, 0, False)
+        self.assertEqual(len(xref), 3)
+        self.assertEqual(xref.size(), 5)
+        self.assertEqual(list(xref), [1, 3, 4])
+        self.assertNotIn(2, xref)
+        self.assertIsNone(xref.get(2))
+        self.assertIsNone(xref.get(100))
+        self.assertEqual(xref.get(4), (20, 1, True))
+        self.assertEqual(xref.in_use_entries(), [(5, 1, 0), (10, 3, 0)])
+
+    def test_xref_overlay(self):
+        older = XrefTable()
+        older.set_subsection(0, array('q', [0, 10, 20]), array('H', [65535, 0, 0]), b'\x01\x02\x02')
+        newer = XrefTable()
+        newer.set(2, 30, 1, False)
+        newer.set(5, 40, 0, False)
+        xref = XrefOverlay([newer, older])
+        self.assertEqual(len(xref), 4)
+        self.assertEqual(len(xref), len(list(xref)))
+        self.assertEqual(list(xref), [0, 1, 2, 5])
+        self.assertEqual(xref.get_entry(2), (ENTRY_IN_USE, 30, 1))
+        self.assertEqual(len(xref.older(1)), 3)
+
+    def test_parse_xref_stream(self):
+        data = bytes([0, 0, 0, 0xff, 0xff,
+                      1, 0, 0x10, 0, 0,
+                      2, 0, 0x05, 0, 3,
+                      1, 1, 0x00, 0, 1])
+        xref = parse_xref_stream(data, [1, 2, 2], [(0, 2), (10, 2)])
+        self.assertEqual(list(xref), [0, 1, 10, 11])
+        self.assertEqual(xref.get_entry(0), (ENTRY_FREE, 0, 65535))
+        self.assertEqual(xref.get_entry(1), (ENTRY_IN_USE, 16, 0))
+        self.assertEqual(xref.get_entry(10), (ENTRY_COMPRESSED, 5, 3))
+        self.assertEqual(xref.get_entry(11), (ENTRY_IN_USE, 256, 1))
+
+    def test_parse_xref_stream_default_type(self):
+        data = bytes([0x10, 0, 0x20, 0])
+        xref = parse_xref_stream(data, [0, 2, 0], [(1, 2)])
+        self.assertEqual(xref.get(1), (0x1000, 0, False))
+        self.assertEqual(xref.get(2), (0x2000, 0, False))
+
+    def test_fill_from(self):
+        xref1 = XrefTable()
+        xref1.set(1, 10, 0, False)
+        xref1.set(2, 0, 0, True)
+        xref2 = XrefTable()
+        xref2.set(1, 11, 0, False)
+        xref2.set(2, 22, 0, False)
+        xref2.set(3, 33, 0, False)
+        xref1.fill_from(xref2)
+        self.assertEqual(xref1.get(1), (10, 0, False))
+        self.assertEqual(xref1.get(2), (22, 0, False))
+        self.assertEqual(xref1.get(3), (33, 0, False))
+
+    def test_png_predictor(self):
+        rows = [bytes([i, i * 3 % 256, 255 - i]) for i in range(0, 50)]
+        encoded = png_up_encode(rows)
+        params = {'Predictor': 12, 'Columns': 3}
+        self.assertEqual(decode_predictor(encoded, params), b''.join(rows))
+        # Sub filter (1) on first row, forces the row by row path
+        rows.insert(0, bytes([1, 2, 3]))
+        encoded = bytes([1, 1, 1, 1]) + png_up_encode(rows)[4:]
+        self.assertEqual(decode_predictor(encoded, params), b''.join(rows))